@@ -6,7 +6,7 @@
 @brief Aplicación principal del ERP de Mega Nevada
 @details Archivo principal que inicializa Flask, configura la base de datos y define las rutas principales del sistema.
 @author José David Sánchez Fernández
-@version 6.3
+@version 6.9
 @date 2025-06-15
 @copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
 """
@@ -15,6 +15,7 @@ from flask import Flask, render_template, jsonify
 from flask_cors import CORS
 from config.config import config
 from models.models import db
+from sqlalchemy import text
 import os
 
 def create_app(config_name=None):
@@ -23,7 +24,7 @@ def create_app(config_name=None):
     @details Función factory que configura y crea la instancia de Flask con todas las extensiones y configuraciones necesarias.
     @param config_name Nombre del entorno de configuración a usar
     @return Flask Instancia configurada de la aplicación
-    @version 6.2
+    @version 7.0
     """
     
     # Crear instancia de Flask
@@ -41,6 +42,8 @@ def create_app(config_name=None):
     from routes.clientes import clientes_bp
     from routes.pedidos import pedidos_bp
     from routes.facturas import facturas_bp
+    from routes.busqueda import busqueda_bp
+    from routes.eventos import eventos_bp
     
     try:
         from routes.productos import productos_bp
@@ -52,11 +55,22 @@ def create_app(config_name=None):
     app.register_blueprint(clientes_bp)
     app.register_blueprint(pedidos_bp)
     app.register_blueprint(facturas_bp)
-    print("Blueprints de clientes, pedidos y facturas registrados")
+    app.register_blueprint(busqueda_bp)
+    app.register_blueprint(eventos_bp)
+    print("Blueprints de clientes, pedidos, facturas, búsqueda y eventos registrados")
+    
+    # Registrar comandos de mantenimiento
+    from utils.comandos import registrar_comandos
+    registrar_comandos(app)
     
     # Crear las tablas de la base de datos
     with app.app_context():
         try:
+            # Los índices de búsqueda por trigramas necesitan la extensión pg_trgm y los triggers de búsqueda unaccent
+            if db.engine.dialect.name == 'postgresql':
+                with db.engine.begin() as conexion:
+                    conexion.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                    conexion.execute(text('CREATE EXTENSION IF NOT EXISTS unaccent'))
             db.create_all()
             print("Base de datos inicializada correctamente")
             print("Tablas creadas en PostgreSQL")
@@ -64,6 +78,26 @@ def create_app(config_name=None):
             print(f"Error al inicializar la base de datos: {e}")
             print(f"Verifica la configuración en .env")
     
+    # Índices en memoria de los buscadores del formulario de pedidos
+    from services.autocompletado_service import iniciar_autocompletado
+    iniciar_autocompletado(app)
+    
+    # Caché de resultados de los buscadores
+    from services.cache_busqueda_service import iniciar_cache_busqueda
+    iniciar_cache_busqueda(app)
+    
+    # Caché de las APIs del home, con ETag y Last-Modified
+    from services.cache_home_service import iniciar_cache_home, cache_home
+    iniciar_cache_home(app)
+    
+    # Bus de eventos en tiempo real del canal SSE
+    from services.eventos_service import iniciar_eventos
+    iniciar_eventos(app)
+    
+    # Borrado de los PDF guardados de las facturas modificadas
+    from services.pdf_service import iniciar_pdf_facturas
+    iniciar_pdf_facturas(app)
+    
     # Registrar rutas principales
     @app.route('/')
     def index():
@@ -116,51 +150,21 @@ def create_app(config_name=None):
         })
     
     @app.route('/api/home/estadisticas')
+    @cache_home
     def api_home_estadisticas():
         """
         @brief API para obtener todas las estadísticas del home
-        @details Proporciona contadores de clientes, productos, pedidos y facturas
+        @details Proporciona contadores de clientes, productos, pedidos y facturas, calculados en una sola consulta por
+                 estadisticas_service. Pasa por la caché del home.
         @return JSON con estadísticas completas del sistema
-        @version 1.1
+        @version 1.3
         """
         try:
-            from models.models import Cliente, Producto, Pedido, Factura
-            from datetime import datetime, timedelta
-            from sqlalchemy import func
-            
-            # Estadísticas de clientes
-            total_clientes = Cliente.query.filter_by(activo=True).count()
-            
-            # Estadísticas de productos
-            try:
-                total_productos = Producto.query.filter_by(activo=True).count()
-            except:
-                total_productos = 0
-            
-            # Estadísticas de pedidos
-            try:
-                pedidos_pendientes = Pedido.query.filter_by(estado='pendiente').count()
-                total_pedidos = Pedido.query.count()
-            except:
-                pedidos_pendientes = 0
-                total_pedidos = 0
-            
-            # Estadísticas de facturas del mes actual
-            try:
-                inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                facturas_mes = Factura.query.filter(Factura.fecha_factura >= inicio_mes).count()
-            except:
-                facturas_mes = 0
+            from services.estadisticas_service import estadisticas_home
             
             return jsonify({
                 'success': True,
-                'estadisticas': {
-                    'total_clientes': total_clientes,
-                    'total_productos': total_productos,
-                    'total_pedidos': total_pedidos,
-                    'pedidos_pendientes': pedidos_pendientes,
-                    'facturas_mes': facturas_mes
-                }
+                'estadisticas': estadisticas_home()
             })
             
         except Exception as e:
@@ -178,135 +182,20 @@ def create_app(config_name=None):
             }), 500
     
     @app.route('/api/home/actividad')
+    @cache_home
     def api_home_actividad():
         """
         @brief API para obtener actividad reciente del home con enlaces
+        @details Calculada por home_service. Pasa por la caché del home.
         @return JSON con actividad reciente del sistema incluyendo enlaces
-        @version 2.1
+        @version 2.3
         """
         try:
-            from models.models import Cliente, Producto, Pedido
-            from datetime import datetime, timedelta
-            
-            actividades = []
-            
-            # Últimos pedidos creados
-            try:
-                pedidos_recientes = Pedido.query.order_by(Pedido.fecha_pedido.desc()).limit(3).all()
-                for pedido in pedidos_recientes:
-                    actividades.append({
-                        'tipo': 'pedido_nuevo',
-                        'mensaje': f'Nuevo pedido: {pedido.numero_pedido} - {pedido.cliente.nombre}',
-                        'fecha': pedido.fecha_pedido.isoformat(),
-                        'icono': 'fa-shopping-cart',
-                        'color': 'success',
-                        'enlace': f'/pedidos',
-                        'elemento_id': pedido.id,
-                        'elemento_tipo': 'pedido'
-                    })
-            except:
-                pass
-            
-            # Últimos clientes creados
-            clientes_recientes = Cliente.query.order_by(Cliente.fecha_creacion.desc()).limit(2).all()
-            for cliente in clientes_recientes:
-                actividades.append({
-                    'tipo': 'cliente_nuevo',
-                    'mensaje': f'Nuevo cliente: {cliente.nombre}',
-                    'fecha': cliente.fecha_creacion.isoformat(),
-                    'icono': 'fa-user-plus',
-                    'color': 'primary',
-                    'enlace': f'/clientes',
-                    'elemento_id': cliente.id,
-                    'elemento_tipo': 'cliente'
-                })
-            
-            # Últimos productos creados
-            try:
-                productos_recientes = Producto.query.order_by(Producto.fecha_creacion.desc()).limit(2).all()
-                for producto in productos_recientes:
-                    actividades.append({
-                        'tipo': 'producto_nuevo',
-                        'mensaje': f'Nuevo producto: {producto.nombre}',
-                        'fecha': producto.fecha_creacion.isoformat(),
-                        'icono': 'fa-box',
-                        'color': 'info',
-                        'enlace': f'/productos',
-                        'elemento_id': producto.id,
-                        'elemento_tipo': 'producto'
-                    })
-            except:
-                pass
-            
-            # Pedidos pendientes (alertas)
-            try:
-                pedidos_pendientes = Pedido.query.filter_by(estado='pendiente').count()
-                if pedidos_pendientes > 0:
-                    actividades.append({
-                        'tipo': 'pedidos_pendientes',
-                        'mensaje': f'{pedidos_pendientes} pedidos pendientes de confirmar',
-                        'fecha': datetime.now().isoformat(),
-                        'icono': 'fa-clock',
-                        'color': 'warning',
-                        'enlace': f'/pedidos?estado=pendiente',
-                        'elemento_id': None,
-                        'elemento_tipo': None
-                    })
-            except:
-                pass
-            
-            # Productos con stock bajo (últimos detectados)
-            try:
-                productos_stock_bajo = Producto.query.filter(
-                    Producto.activo == True,
-                    Producto.stock <= Producto.stock_minimo
-                ).order_by(Producto.stock.asc()).limit(2).all()
-                
-                for producto in productos_stock_bajo:
-                    actividades.append({
-                        'tipo': 'stock_bajo',
-                        'mensaje': f'Stock bajo: {producto.nombre} ({producto.stock} unidades)',
-                        'fecha': datetime.now().isoformat(),
-                        'icono': 'fa-exclamation-triangle',
-                        'color': 'danger',
-                        'enlace': f'/productos',
-                        'elemento_id': producto.id,
-                        'elemento_tipo': 'producto'
-                    })
-            except:
-                pass
-            
-            # Ordenar por fecha (más recientes primero)
-            actividades.sort(key=lambda x: x['fecha'], reverse=True)
-            
-            # Actividad de muestra si no hay datos
-            if not actividades:
-                actividades = [
-                    {
-                        'tipo': 'sistema',
-                        'mensaje': 'Sistema ERP iniciado correctamente',
-                        'fecha': datetime.now().isoformat(),
-                        'icono': 'fa-check-circle',
-                        'color': 'success',
-                        'enlace': None,
-                        'elemento_id': None,
-                        'elemento_tipo': None
-                    },
-                    {
-                        'tipo': 'info',
-                        'mensaje': 'ERP listo para gestionar pedidos',
-                        'fecha': datetime.now().isoformat(),
-                        'icono': 'fa-info-circle',
-                        'color': 'info',
-                        'enlace': '/pedidos/nuevo',
-                        'elemento_id': None,
-                        'elemento_tipo': None
-                    }
-                ]
+            from services.home_service import actividad_reciente
             
             return jsonify({
                 'success': True,
-                'actividades': actividades[:6]
+                'actividades': actividad_reciente()
             })
             
         except Exception as e:
@@ -317,39 +206,21 @@ def create_app(config_name=None):
             })
     
     @app.route('/api/home/stock-bajo')
+    @cache_home
     def api_home_stock_bajo():
         """
         @brief API para obtener productos con stock bajo
+        @details Calculada por home_service. Pasa por la caché del home.
         @return JSON con productos que requieren reabastecimiento
-        @version 1.0
+        @version 1.2
         """
         try:
-            from models.models import Producto
+            from services.home_service import productos_stock_bajo
             
-            # Buscar productos con stock bajo
-            try:
-                productos_stock_bajo = Producto.query.filter(Producto.stock <= Producto.stock_minimo, Producto.activo == True).all()
-                
-                productos = []
-                for producto in productos_stock_bajo:
-                    productos.append({
-                        'id': producto.id,
-                        'nombre': producto.nombre,
-                        'codigo': producto.codigo,
-                        'stock_actual': producto.stock,
-                        'stock_minimo': producto.stock_minimo
-                    })
-                
-                return jsonify({
-                    'success': True,
-                    'productos': productos
-                })
-                
-            except:
-                return jsonify({
-                    'success': True,
-                    'productos': []
-                })
+            return jsonify({
+                'success': True,
+                'productos': productos_stock_bajo()
+            })
             
         except Exception as e:
             return jsonify({
@@ -359,41 +230,21 @@ def create_app(config_name=None):
             })
     
     @app.route('/api/home/pedidos-resumen')
+    @cache_home
     def api_home_pedidos_resumen():
         """
         @brief API para obtener resumen de pedidos para el home
+        @details Calculada por home_service. Pasa por la caché del home.
         @return JSON con resumen de pedidos por estado
-        @version 1.0
+        @version 1.2
         """
         try:
-            from models.models import Pedido
-            from sqlalchemy import func
+            from services.home_service import resumen_pedidos
             
-            try:
-                # Contar pedidos por estado
-                resumen = db.session.query(
-                    Pedido.estado,
-                    func.count(Pedido.id).label('cantidad'),
-                    func.sum(Pedido.total).label('valor_total')
-                ).group_by(Pedido.estado).all()
-                
-                pedidos_resumen = {}
-                for estado, cantidad, valor in resumen:
-                    pedidos_resumen[estado] = {
-                        'cantidad': cantidad,
-                        'valor_total': float(valor) if valor else 0
-                    }
-                
-                return jsonify({
-                    'success': True,
-                    'resumen': pedidos_resumen
-                })
-                
-            except:
-                return jsonify({
-                    'success': True,
-                    'resumen': {}
-                })
+            return jsonify({
+                'success': True,
+                'resumen': resumen_pedidos()
+            })
                 
         except Exception as e:
             return jsonify({
@@ -402,6 +253,37 @@ def create_app(config_name=None):
                 'resumen': {}
             })
     
+    @app.route('/api/home/bootstrap')
+    @cache_home
+    def api_home_bootstrap():
+        """
+        @brief API con todos los widgets del home en una sola petición
+        @details Contadores, actividad reciente, alertas de stock y resumen de pedidos leídos en una única transacción por
+                 home_service. Pasa por la caché del home: mientras no cambie la generación de los datos del home (la
+                 incrementa cualquier escritura confirmada en pedidos, facturas, albaranes, productos o clientes) se sirve
+                 sin consultar la base de datos, y con If-None-Match o If-Modified-Since vigentes se responde 304. El ETag
+                 sale de la versión de los datos leída en la misma transacción, y el cuerpo no lleva la hora de la
+                 petición. Sustituye también a la comprobación de /api/test en el home: si responde, API y base de datos
+                 funcionan.
+        @return JSON con estadisticas, actividades, productos_stock_bajo y resumen_pedidos
+        @version 1.1
+        """
+        try:
+            from services.home_service import datos_home
+            
+            return jsonify({
+                'success': True,
+                **datos_home()
+            })
+            
+        except Exception as e:
+            print(f"Error en bootstrap del home: {str(e)}")
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'Error al cargar el home: {str(e)}'
+            }), 500
+    
     return app
 
 if __name__ == '__main__':
@@ -49,6 +49,37 @@ class Config:
     # Configuraciones de la aplicación
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'frontend', 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB máximo para archivos
+    
+    # Carga masiva de pedidos: pedidos procesados por commit
+    CARGA_PEDIDOS_LOTE = int(os.environ.get('CARGA_PEDIDOS_LOTE') or 500)
+    
+    # Horas que se guardan las respuestas de las peticiones con Idempotency-Key
+    IDEMPOTENCIA_HORAS = int(os.environ.get('IDEMPOTENCIA_HORAS') or 24)
+    
+    # Índice en memoria de los buscadores del formulario de pedidos y segundos entre recargas completas
+    AUTOCOMPLETADO_EN_MEMORIA = os.environ.get('AUTOCOMPLETADO_EN_MEMORIA', 'true').lower() in ['true', '1', 'on', 'yes']
+    AUTOCOMPLETADO_RECARGA_SEGUNDOS = int(os.environ.get('AUTOCOMPLETADO_RECARGA_SEGUNDOS') or 300)
+    
+    # Caché de resultados de los buscadores: entradas máximas (0 la desactiva) y segundos de validez
+    CACHE_BUSQUEDA_ENTRADAS = int(os.environ.get('CACHE_BUSQUEDA_ENTRADAS') or 2000)
+    CACHE_BUSQUEDA_SEGUNDOS = int(os.environ.get('CACHE_BUSQUEDA_SEGUNDOS') or 60)
+    
+    # Caché de las APIs del home: segundos de validez (0 la desactiva) y entradas máximas
+    CACHE_HOME_SEGUNDOS = int(os.environ.get('CACHE_HOME_SEGUNDOS') or 30)
+    CACHE_HOME_ENTRADAS = int(os.environ.get('CACHE_HOME_ENTRADAS') or 50)
+    
+    # Canal de eventos en tiempo real (SSE): conexiones simultáneas por proceso (0 lo desactiva), eventos guardados para
+    # reenviar al reconectar y segundos entre latidos de una conexión sin eventos
+    EVENTOS_MAX_SUSCRIPTORES = int(os.environ.get('EVENTOS_MAX_SUSCRIPTORES') or 100)
+    EVENTOS_HISTORIAL = int(os.environ.get('EVENTOS_HISTORIAL') or 200)
+    EVENTOS_LATIDO_SEGUNDOS = int(os.environ.get('EVENTOS_LATIDO_SEGUNDOS') or 15)
+    
+    # Directorio donde se guardan los PDF de las facturas ya generados
+    PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'cache', 'facturas_pdf')
+    
+    # Procesos que generan los PDF de la exportación masiva de facturas (por defecto, uno por núcleo; con 1 se generan
+    # en el propio proceso del servidor)
+    PDF_EXPORTACION_PROCESOS = int(os.environ.get('PDF_EXPORTACION_PROCESOS') or os.cpu_count() or 1)
 
 class DevelopmentConfig(Config):
     """
@@ -67,9 +98,24 @@ class ProductionConfig(Config):
     """
     DEBUG = False
 
+class TestingConfig(Config):
+    """
+    @brief Configuración para las pruebas automáticas
+    @details Usa una base de datos SQLite en memoria para que los tests no dependan de PostgreSQL.
+    @version 1.0
+    """
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    AUTOCOMPLETADO_EN_MEMORIA = False
+    CACHE_BUSQUEDA_ENTRADAS = 0
+    CACHE_HOME_SEGUNDOS = 0
+    EVENTOS_MAX_SUSCRIPTORES = 0
+    PDF_EXPORTACION_PROCESOS = 1
+
 # Diccionario de configuraciones
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
\ No newline at end of file
@@ -6,25 +6,72 @@
 @brief Modelos de base de datos para el ERP de Mega Nevada
 @details Este módulo contiene todos los modelos de SQLAlchemy que representan las entidades del sistema: clientes, productos, pedidos, facturas y albaranes.
 @author José David Sánchez Fernández
-@version 4.6
+@version 5.5
 @date 2025-06-15
 @copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, DDL
+from sqlalchemy.orm import deferred
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from datetime import datetime
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+from utils.helpers import normalizar_busqueda
 
 # Instancia de SQLAlchemy
 db = SQLAlchemy()
 
+# tsvector de la búsqueda global: en PostgreSQL lo rellena un trigger; en SQLite queda vacío
+TIPO_TSVECTOR = TSVECTOR().with_variant(db.Text(), 'sqlite')
+
+def redondear_importe(valor):
+    """
+    @brief Redondea un importe a céntimos
+    @param valor Importe en Decimal
+    @return Decimal Importe redondeado a dos decimales
+    @version 1.0
+    """
+    return Decimal(valor).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+def serializar(registro, campos=None):
+    """
+    @brief Convierte un registro en diccionario evaluando solo los campos indicados
+    @details Cada modelo declara en SERIALIZACION cómo se obtiene cada campo, de modo que los campos calculados que no se
+             piden no se calculan ni obligan a cargar sus columnas.
+    @param registro Instancia de un modelo con SERIALIZACION
+    @param campos Campos a incluir, o None para todos
+    @return dict Campo -> valor
+    @version 1.0
+    """
+    serializacion = type(registro).SERIALIZACION
+    if campos is None:
+        return {campo: valor(registro) for campo, valor in serializacion.items()}
+    return {campo: serializacion[campo](registro) for campo in campos}
+
 class Cliente(db.Model):
     """
     @brief Modelo para gestionar clientes del proveedor
     @details Representa la información completa de cada cliente farmacia, incluyendo datos de contacto, historial y estado.
-    @version 3.5
+    @version 3.10
     """
     __tablename__ = 'clientes'
+    __table_args__ = (
+        # Orden del listado, usado por la paginación por cursor
+        db.Index('ix_clientes_nombre_id', 'nombre', 'id'),
+        # Búsqueda por subcadena con trigramas (solo PostgreSQL, requiere la extensión pg_trgm)
+        db.Index('ix_clientes_texto_busqueda_trgm', 'texto_busqueda', postgresql_using='gin',
+                 postgresql_ops={'texto_busqueda': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        # Los más parecidos primero sin calcular la similitud de todas las coincidencias (operador <<->, solo
+        # PostgreSQL). Sobre lower() para que los LIKE sigan usando el índice GIN
+        db.Index('ix_clientes_texto_busqueda_gist', db.text('lower(texto_busqueda) gist_trgm_ops(siglen=256)'),
+                 postgresql_using='gist').ddl_if(dialect='postgresql'),
+        # Búsqueda global de texto completo
+        db.Index('ix_clientes_busqueda_tsv', 'busqueda_tsv', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+    
+    # Campos que se copian, normalizados, en texto_busqueda
+    CAMPOS_BUSQUEDA = ('nombre', 'codigo', 'telefono', 'nombre_fiscal', 'cif', 'contacto')
     
     # Campos básicos
     id = db.Column(db.Integer, primary_key=True)
@@ -35,6 +82,8 @@ class Cliente(db.Model):
     email = db.Column(db.String(100))
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     fecha_ultima_visita = db.Column(db.DateTime)
+    # Última escritura del registro, validador HTTP de los datos del home
+    fecha_modificacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     activo = db.Column(db.Boolean, default=True)
     notas = db.Column(db.Text)
     
@@ -44,36 +93,71 @@ class Cliente(db.Model):
     contacto = db.Column(db.String(100))
     cuenta_bancaria = db.Column(db.String(34))
     
+    # Concatenación normalizada de CAMPOS_BUSQUEDA, mantenida al guardar
+    texto_busqueda = db.Column(db.Text)
+    
+    # Vector de la búsqueda global, mantenido por un trigger de PostgreSQL (no se carga por defecto)
+    busqueda_tsv = deferred(db.Column(TIPO_TSVECTOR))
+    
     # Relaciones con manejo de errores
     pedidos = db.relationship('Pedido', backref='cliente', lazy='dynamic')
 
     def __repr__(self):
         return f'<Cliente {self.codigo}: {self.nombre}>'
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'codigo': self.codigo,
-            'nombre': self.nombre,
-            'direccion': self.direccion,
-            'telefono': self.telefono,
-            'email': self.email,
-            'nombre_fiscal': self.nombre_fiscal,
-            'cif': self.cif,
-            'contacto': self.contacto,
-            'cuenta_bancaria': self.cuenta_bancaria,
-            'activo': self.activo,
-            'notas': self.notas,
-            'fecha_ultima_visita': self.fecha_ultima_visita.isoformat() if self.fecha_ultima_visita else None
-        }
+    # Serialización de cada campo de to_dict(), para poder evaluar solo los campos pedidos
+    SERIALIZACION = {
+        'id': lambda c: c.id,
+        'codigo': lambda c: c.codigo,
+        'nombre': lambda c: c.nombre,
+        'direccion': lambda c: c.direccion,
+        'telefono': lambda c: c.telefono,
+        'email': lambda c: c.email,
+        'nombre_fiscal': lambda c: c.nombre_fiscal,
+        'cif': lambda c: c.cif,
+        'contacto': lambda c: c.contacto,
+        'cuenta_bancaria': lambda c: c.cuenta_bancaria,
+        'activo': lambda c: c.activo,
+        'notas': lambda c: c.notas,
+        'fecha_ultima_visita': lambda c: c.fecha_ultima_visita.isoformat() if c.fecha_ultima_visita else None,
+    }
+
+    def to_dict(self, campos=None):
+        """
+        @brief Diccionario del cliente para las APIs
+        @param campos Campos a incluir (por defecto todos los de SERIALIZACION)
+        @return dict Datos del cliente
+        @version 1.1
+        """
+        return serializar(self, campos)
 
 class Producto(db.Model):
     """
     @brief Modelo para gestionar productos del catálogo
     @details Representa cada producto farmacéutico con su información comercial, stock, precios y datos de control de caducidad.
-    @version 7.3
+    @version 7.9
     """
     __tablename__ = 'productos'
+    __table_args__ = (
+        # Orden del listado, usado por la paginación por cursor
+        db.Index('ix_productos_nombre_id', 'nombre', 'id'),
+        # Código nacional único cuando está informado, para la lectura exacta del escáner
+        db.Index('ix_productos_codigo_nacional', 'codigo_nacional', unique=True,
+                 postgresql_where=db.text('codigo_nacional IS NOT NULL'),
+                 sqlite_where=db.text('codigo_nacional IS NOT NULL')),
+        # Búsqueda por subcadena con trigramas (solo PostgreSQL, requiere la extensión pg_trgm)
+        db.Index('ix_productos_texto_busqueda_trgm', 'texto_busqueda', postgresql_using='gin',
+                 postgresql_ops={'texto_busqueda': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        # Los más parecidos primero sin calcular la similitud de todas las coincidencias (operador <<->, solo
+        # PostgreSQL). Sobre lower() para que los LIKE sigan usando el índice GIN
+        db.Index('ix_productos_texto_busqueda_gist', db.text('lower(texto_busqueda) gist_trgm_ops(siglen=256)'),
+                 postgresql_using='gist').ddl_if(dialect='postgresql'),
+        # Búsqueda global de texto completo
+        db.Index('ix_productos_busqueda_tsv', 'busqueda_tsv', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+    
+    # Campos que se copian, normalizados, en texto_busqueda
+    CAMPOS_BUSQUEDA = ('nombre', 'codigo', 'descripcion', 'codigo_nacional', 'num_referencia', 'nombre_proveedor', 'marca')
     
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(20), unique=True, nullable=False, index=True)
@@ -88,6 +172,8 @@ class Producto(db.Model):
     imagen_url = db.Column(db.String(200))
     activo = db.Column(db.Boolean, default=True)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    # Última escritura del registro, validador HTTP de los datos del home
+    fecha_modificacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Campos para identificación y proveedor
     codigo_nacional = db.Column(db.String(20))
@@ -96,6 +182,12 @@ class Producto(db.Model):
     marca = db.Column(db.String(100))
     iva_porcentaje = db.Column(db.Numeric(5, 2), default=21.0)
     recargo_equivalencia = db.Column(db.Numeric(5, 2), default=0.0)
+    
+    # Concatenación normalizada de CAMPOS_BUSQUEDA, mantenida al guardar
+    texto_busqueda = db.Column(db.Text)
+    
+    # Vector de la búsqueda global, mantenido por un trigger de PostgreSQL (no se carga por defecto)
+    busqueda_tsv = deferred(db.Column(TIPO_TSVECTOR))
 
     def __repr__(self):
         return f'<Producto {self.codigo}: {self.nombre}>'
@@ -115,65 +207,75 @@ class Producto(db.Model):
 
     @property
     def recargo_equivalencia_calculado(self):
-        """Calcula el recargo de equivalencia basado en el IVA si no está definido manualmente"""
-        # Si ya tiene un recargo manual definido, usarlo
-        if hasattr(self, 'recargo_equivalencia') and self.recargo_equivalencia and self.recargo_equivalencia > 0:
+        """Recargo de equivalencia manual si está definido; si no, el que corresponde a su tipo de IVA"""
+        if self.recargo_equivalencia and self.recargo_equivalencia > 0:
             return self.recargo_equivalencia
         
-        # Si no, calcular automáticamente basado en el IVA
-        if not self.iva_porcentaje:
-            return Decimal('0')
-        
-        # Tabla de correspondencia IVA - Recargo
-        iva = float(self.iva_porcentaje)
-        if iva == 4.0:
-            return Decimal('0.5')
-        elif iva == 10.0:
-            return Decimal('1.4')
-        elif iva == 21.0:
-            return Decimal('5.2')
-        else:
-            return Decimal('0')
+        from services.impuestos_service import recargo_para_iva
+        return recargo_para_iva(self.iva_porcentaje)
 
     @property
     def es_deposito(self):
         """Indica si el producto es en depósito (por defecto False)"""
         return False
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'codigo': self.codigo,
-            'nombre': self.nombre,
-            'descripcion': self.descripcion,
-            'precio': float(self.precio) if self.precio else 0,
-            'pvf_sin_iva': float(self.pvf_sin_iva) if self.pvf_sin_iva else 0,
-            'pvf_con_iva': float(self.pvf_con_iva) if self.pvf_con_iva else 0,
-            'iva_porcentaje': float(self.iva_porcentaje) if self.iva_porcentaje else 21.0,
-            'recargo_equivalencia': float(self.recargo_equivalencia) if hasattr(self, 'recargo_equivalencia') and self.recargo_equivalencia else 0.0,
-            'recargo_equivalencia_calculado': float(self.recargo_equivalencia_calculado),
-            'categoria': self.categoria,
-            'stock': self.stock,
-            'stock_minimo': self.stock_minimo,
-            'lote': self.lote,
-            'fecha_caducidad': self.fecha_caducidad.isoformat() if self.fecha_caducidad else None,
-            'imagen_url': self.imagen_url,
-            'activo': self.activo,
-            'es_deposito': self.es_deposito,
-            # Campos de identificación
-            'codigo_nacional': self.codigo_nacional,
-            'num_referencia': self.num_referencia,
-            'nombre_proveedor': self.nombre_proveedor,
-            'marca': self.marca
-        }
+    # Serialización de cada campo de to_dict(), para poder evaluar solo los campos pedidos
+    SERIALIZACION = {
+        'id': lambda p: p.id,
+        'codigo': lambda p: p.codigo,
+        'nombre': lambda p: p.nombre,
+        'descripcion': lambda p: p.descripcion,
+        'precio': lambda p: float(p.precio) if p.precio else 0,
+        'pvf_sin_iva': lambda p: float(p.pvf_sin_iva) if p.pvf_sin_iva else 0,
+        'pvf_con_iva': lambda p: float(p.pvf_con_iva) if p.pvf_con_iva else 0,
+        'iva_porcentaje': lambda p: float(p.iva_porcentaje) if p.iva_porcentaje else 21.0,
+        'recargo_equivalencia': lambda p: float(p.recargo_equivalencia) if p.recargo_equivalencia else 0.0,
+        'recargo_equivalencia_calculado': lambda p: float(p.recargo_equivalencia_calculado),
+        'categoria': lambda p: p.categoria,
+        'stock': lambda p: p.stock,
+        'stock_minimo': lambda p: p.stock_minimo,
+        'lote': lambda p: p.lote,
+        'fecha_caducidad': lambda p: p.fecha_caducidad.isoformat() if p.fecha_caducidad else None,
+        'imagen_url': lambda p: p.imagen_url,
+        'activo': lambda p: p.activo,
+        'es_deposito': lambda p: p.es_deposito,
+        # Campos de identificación
+        'codigo_nacional': lambda p: p.codigo_nacional,
+        'num_referencia': lambda p: p.num_referencia,
+        'nombre_proveedor': lambda p: p.nombre_proveedor,
+        'marca': lambda p: p.marca,
+    }
+    
+    # Columnas de las que depende cada campo calculado de to_dict() (los demás usan la columna de su nombre)
+    COLUMNAS_CAMPOS = {
+        'pvf_sin_iva': ('precio',),
+        'pvf_con_iva': ('precio', 'iva_porcentaje'),
+        'recargo_equivalencia_calculado': ('recargo_equivalencia', 'iva_porcentaje'),
+        'es_deposito': (),
+    }
+
+    def to_dict(self, campos=None):
+        """
+        @brief Diccionario del producto para las APIs
+        @param campos Campos a incluir (por defecto todos los de SERIALIZACION)
+        @return dict Datos del producto
+        @version 1.1
+        """
+        return serializar(self, campos)
 
 class Pedido(db.Model):
     """
     @brief Modelo para gestionar pedidos de clientes
-    @details Representa cada pedido realizado por un cliente, con su estado, total y relación con items individuales.
-    @version 3.5
+    @details Representa cada pedido realizado por un cliente, con su estado, totales persistidos y relación con items individuales.
+    @version 4.3
     """
     __tablename__ = 'pedidos'
+    __table_args__ = (
+        # Orden del listado, usado por la paginación por cursor
+        db.Index('ix_pedidos_fecha_pedido_id', 'fecha_pedido', 'id'),
+        # Búsqueda global de texto completo
+        db.Index('ix_pedidos_busqueda_tsv', 'busqueda_tsv', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
     
     # Campos básicos que seguro existen
     id = db.Column(db.Integer, primary_key=True)
@@ -181,87 +283,86 @@ class Pedido(db.Model):
     cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
     fecha_pedido = db.Column(db.DateTime, default=datetime.utcnow)
     estado = db.Column(db.String(20), default='pendiente')
+    # Última escritura del registro, validador HTTP de los datos del home
+    fecha_modificacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     observaciones = db.Column(db.Text)
     
+    # Totales persistidos, se mantienen con calcular_totales()
+    subtotal = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    total_iva = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    total_recargo = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    total = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    
+    # Vector de la búsqueda global, mantenido por un trigger de PostgreSQL (no se carga por defecto)
+    busqueda_tsv = deferred(db.Column(TIPO_TSVECTOR))
+    
     # Relaciones
     items = db.relationship('ItemPedido', backref='pedido', lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Pedido {self.numero_pedido}>'
     
-    @property
-    def subtotal(self):
-        """Subtotal calculado dinámicamente"""
-        return sum(item.subtotal_sin_iva for item in self.items)
-    
-    @property
-    def total_iva(self):
-        """Total IVA calculado dinámicamente"""
-        return sum(item.total_iva for item in self.items)
-    
-    @property
-    def total_recargo(self):
+    def calcular_totales(self):
         """
-        Total recargo calculado dinámicamente por tipo de IVA
+        @brief Calcula y guarda los totales del pedido
+        @details Usa el desglose por tipo de IVA de impuestos_service, que recorre los items una sola vez.
+                 Debe llamarse después de cualquier alta, baja o modificación de items.
+        @version 2.1
         """
-        # Calcular bases por tipo de IVA
-        base_iva_4 = Decimal('0')
-        base_iva_10 = Decimal('0')
-        base_iva_21 = Decimal('0')
-        
-        for item in self.items:
-            iva = float(item.iva_porcentaje)
-            if iva == 4.0:
-                base_iva_4 += item.subtotal_sin_iva
-            elif iva == 10.0:
-                base_iva_10 += item.subtotal_sin_iva
-            elif iva == 21.0:
-                base_iva_21 += item.subtotal_sin_iva
-        
-        # Calcular recargos por tipo de IVA
-        recargo_4 = base_iva_4 * Decimal('0.005')   # 0.50%
-        recargo_10 = base_iva_10 * Decimal('0.014') # 1.40%
-        recargo_21 = base_iva_21 * Decimal('0.052') # 5.20%
-        
-        total_recargo = recargo_4 + recargo_10 + recargo_21
-        
-        return total_recargo
-    
-    @property
-    def total(self):
-        """Total calculado dinámicamente"""
-        return self.subtotal + self.total_iva + self.total_recargo
+        from services.impuestos_service import desglosar_items
+        self.aplicar_desglose(desglosar_items(self.items))
     
-    def calcular_totales(self):
+    def aplicar_desglose(self, desglose):
         """
-        @brief Calcula los totales del pedido
-        @details Método para compatibilidad - los totales se calculan dinámicamente
-        @version 1.3
+        @brief Guarda en el pedido los totales de un desglose de impuestos
+        @param desglose DesgloseImpuestos del pedido
+        @version 1.0
         """
-        pass
+        self.subtotal = desglose.base
+        self.total_iva = desglose.iva
+        self.total_recargo = desglose.recargo
+        self.total = desglose.total
 
-    def to_dict(self):
+    @property
+    def items_count(self):
         """Manejo seguro de len(self.items)"""
         try:
-            items_count = len(self.items) if self.items else 0
+            return len(self.items) if self.items else 0
         except:
-            items_count = 0
-            
-        return {
-            'id': self.id,
-            'numero_pedido': self.numero_pedido,
-            'cliente_id': self.cliente_id,
-            'cliente_nombre': self.cliente.nombre if self.cliente else '',
-            'cliente_codigo': self.cliente.codigo if self.cliente else '',
-            'fecha_pedido': self.fecha_pedido.isoformat() if self.fecha_pedido else None,
-            'subtotal': float(self.subtotal),
-            'total_iva': float(self.total_iva),
-            'total_recargo': float(self.total_recargo),
-            'total': float(self.total),
-            'estado': self.estado,
-            'observaciones': self.observaciones,
-            'items_count': items_count
-        }
+            return 0
+
+    # Serialización de cada campo de to_dict(), para poder evaluar solo los campos pedidos
+    SERIALIZACION = {
+        'id': lambda p: p.id,
+        'numero_pedido': lambda p: p.numero_pedido,
+        'cliente_id': lambda p: p.cliente_id,
+        'cliente_nombre': lambda p: p.cliente.nombre if p.cliente else '',
+        'cliente_codigo': lambda p: p.cliente.codigo if p.cliente else '',
+        'fecha_pedido': lambda p: p.fecha_pedido.isoformat() if p.fecha_pedido else None,
+        'subtotal': lambda p: float(p.subtotal or 0),
+        'total_iva': lambda p: float(p.total_iva or 0),
+        'total_recargo': lambda p: float(p.total_recargo or 0),
+        'total': lambda p: float(p.total or 0),
+        'estado': lambda p: p.estado,
+        'observaciones': lambda p: p.observaciones,
+        'items_count': lambda p: p.items_count,
+    }
+    
+    # Columnas de las que depende cada campo calculado de to_dict() (los demás usan la columna de su nombre)
+    COLUMNAS_CAMPOS = {
+        'cliente_nombre': ('cliente_id',),
+        'cliente_codigo': ('cliente_id',),
+        'items_count': (),
+    }
+
+    def to_dict(self, campos=None):
+        """
+        @brief Diccionario del pedido para las APIs
+        @param campos Campos a incluir (por defecto todos los de SERIALIZACION)
+        @return dict Datos del pedido
+        @version 1.1
+        """
+        return serializar(self, campos)
 
 class ItemPedido(db.Model):
     """
@@ -296,10 +397,11 @@ class ItemPedido(db.Model):
     def calcular_totales(self):
         """
         @brief Calcula los totales del item
-        @version 1.3
+        @details Los importes se redondean a céntimos para que la suma de los items coincida con los totales guardados del pedido
+        @version 1.4
         """
-        self.subtotal_sin_iva = Decimal(str(self.cantidad)) * self.precio_unitario_sin_iva
-        self.total_iva = self.subtotal_sin_iva * (self.iva_porcentaje / Decimal('100'))
+        self.subtotal_sin_iva = redondear_importe(Decimal(str(self.cantidad)) * self.precio_unitario_sin_iva)
+        self.total_iva = redondear_importe(self.subtotal_sin_iva * (Decimal(str(self.iva_porcentaje)) / Decimal('100')))
         self.subtotal_con_iva = self.subtotal_sin_iva + self.total_iva
 
     def to_dict(self):
@@ -320,9 +422,17 @@ class Factura(db.Model):
     """
     @brief Modelo para gestionar facturas
     @details Representa las facturas generadas automáticamente a partir de pedidos, con control de envío por email y estado de pago.
-    @version 5.0
+    @version 5.3
     """
     __tablename__ = 'facturas'
+    __table_args__ = (
+        # Orden del listado, usado por la paginación por cursor
+        db.Index('ix_facturas_fecha_factura_id', 'fecha_factura', 'id'),
+        # Sumas de importe por periodo (resumen de facturación) sin leer la tabla
+        db.Index('ix_facturas_fecha_factura_total', 'fecha_factura', 'total'),
+        # Búsqueda global de texto completo
+        db.Index('ix_facturas_busqueda_tsv', 'busqueda_tsv', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     numero_factura = db.Column(db.String(20), unique=True, nullable=False)
@@ -330,6 +440,11 @@ class Factura(db.Model):
     fecha_factura = db.Column(db.DateTime, default=datetime.utcnow)
     total = db.Column(db.Numeric(10, 2), nullable=False)
     enviada_por_email = db.Column(db.Boolean, default=False)
+    # Última escritura del registro, validador HTTP de los datos del home
+    fecha_modificacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # Vector de la búsqueda global, mantenido por un trigger de PostgreSQL (no se carga por defecto)
+    busqueda_tsv = deferred(db.Column(TIPO_TSVECTOR))
     
     # Relaciones
     pedido = db.relationship('Pedido', backref='factura', uselist=False)
@@ -349,4 +464,137 @@ class Albaran(db.Model):
     entregado = db.Column(db.Boolean, default=False)
     
     # Relaciones
-    pedido = db.relationship('Pedido', backref='albaran', uselist=False)
\ No newline at end of file
+    pedido = db.relationship('Pedido', backref='albaran', uselist=False)
+
+class ContadorNumeracion(db.Model):
+    """
+    @brief Contadores de numeración de documentos
+    @details Una fila por serie y periodo (por ejemplo serie 'VF' y año '25') con el último número entregado.
+             El servicio de numeración la incrementa de forma atómica dentro de la transacción del documento.
+    @version 1.0
+    """
+    __tablename__ = 'contadores_numeracion'
+    
+    serie = db.Column(db.String(10), primary_key=True)
+    periodo = db.Column(db.String(10), primary_key=True)
+    ultimo_numero = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ContadorNumeracion {self.serie}/{self.periodo}: {self.ultimo_numero}>'
+
+class RespuestaIdempotente(db.Model):
+    """
+    @brief Respuestas guardadas por clave de idempotencia
+    @details Una fila por ámbito (endpoint) y valor de la cabecera Idempotency-Key. Se inserta en la misma transacción que
+             la operación que protege y guarda la respuesta para devolverla tal cual si el cliente reintenta la petición.
+    @version 1.0
+    """
+    __tablename__ = 'respuestas_idempotentes'
+    __table_args__ = (
+        db.Index('ix_respuestas_idempotentes_expira', 'expira'),
+    )
+    
+    ambito = db.Column(db.String(50), primary_key=True)
+    clave = db.Column(db.String(255), primary_key=True)
+    huella = db.Column(db.String(64), nullable=False)
+    completada = db.Column(db.Boolean, nullable=False, default=False)
+    codigo_estado = db.Column(db.Integer)
+    cuerpo = db.Column(db.Text)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    expira = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<RespuestaIdempotente {self.ambito}/{self.clave}>'
+
+class VentaDiaria(db.Model):
+    """
+    @brief Acumulado de ventas por día, cliente, producto y tipo de IVA
+    @details Tabla resumen que leen las APIs de ventas en lugar de agregar items_pedido. Se mantiene de forma incremental
+             desde las altas, modificaciones y bajas de pedidos (ventas_service) y se puede reconstruir por completo con
+             el comando reconstruir-ventas-diarias. El recargo es el de equivalencia de cada línea redondeado a céntimos.
+    @version 1.0
+    """
+    __tablename__ = 'ventas_diarias'
+    __table_args__ = (
+        db.Index('ix_ventas_diarias_cliente_fecha', 'cliente_id', 'fecha'),
+        db.Index('ix_ventas_diarias_producto_fecha', 'producto_id', 'fecha'),
+    )
+    
+    fecha = db.Column(db.Date, primary_key=True)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), primary_key=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey('productos.id'), primary_key=True)
+    iva_porcentaje = db.Column(db.Numeric(5, 2), primary_key=True)
+    unidades = db.Column(db.Integer, nullable=False, default=0)
+    base = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    iva = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    recargo = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<VentaDiaria {self.fecha} {self.cliente_id}/{self.producto_id} {self.iva_porcentaje}%>'
+
+@event.listens_for(Cliente, 'before_insert')
+@event.listens_for(Cliente, 'before_update')
+@event.listens_for(Producto, 'before_insert')
+@event.listens_for(Producto, 'before_update')
+def actualizar_texto_busqueda(mapper, connection, objetivo):
+    """
+    @brief Recalcula texto_busqueda a partir de CAMPOS_BUSQUEDA antes de guardar
+    @version 1.0
+    """
+    objetivo.texto_busqueda = normalizar_busqueda(*(getattr(objetivo, campo) for campo in objetivo.CAMPOS_BUSQUEDA))
+
+# Expresión del tsvector de cada tabla y columnas que, al cambiar, obligan a recalcularlo. Los textos con palabras pasan
+# por unaccent, como normalizar_busqueda(), para que la búsqueda no distinga tildes ni la ñ
+VECTORES_BUSQUEDA = {
+    'clientes': (
+        "setweight(to_tsvector('spanish', unaccent(coalesce(NEW.nombre, ''))), 'A') || "
+        "setweight(to_tsvector('simple', concat_ws(' ', NEW.codigo, NEW.cif)), 'A') || "
+        "setweight(to_tsvector('spanish', unaccent(concat_ws(' ', NEW.nombre_fiscal, NEW.contacto))), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(NEW.telefono, '')), 'C')",
+        ('nombre', 'codigo', 'cif', 'nombre_fiscal', 'contacto', 'telefono')
+    ),
+    'productos': (
+        "setweight(to_tsvector('spanish', unaccent(coalesce(NEW.nombre, ''))), 'A') || "
+        "setweight(to_tsvector('simple', concat_ws(' ', NEW.codigo, NEW.codigo_nacional, NEW.num_referencia)), 'A') || "
+        "setweight(to_tsvector('spanish', unaccent(concat_ws(' ', NEW.marca, NEW.nombre_proveedor))), 'B') || "
+        "setweight(to_tsvector('spanish', unaccent(coalesce(NEW.descripcion, ''))), 'C')",
+        ('nombre', 'codigo', 'codigo_nacional', 'num_referencia', 'marca', 'nombre_proveedor', 'descripcion')
+    ),
+    'pedidos': (
+        "setweight(to_tsvector('simple', NEW.numero_pedido || ' ' || translate(NEW.numero_pedido, '-', ' ')), 'A')",
+        ('numero_pedido',)
+    ),
+    'facturas': (
+        "setweight(to_tsvector('simple', NEW.numero_factura || ' ' || translate(NEW.numero_factura, '/', ' ')), 'A')",
+        ('numero_factura',)
+    ),
+}
+
+def ddl_trigger_busqueda(tabla):
+    """
+    @brief Sentencias que crean la función y el trigger que mantienen busqueda_tsv de una tabla
+    @details El trigger solo se dispara al insertar o al cambiar alguna de las columnas buscables, así que las
+             actualizaciones de stock o de estado no recalculan el vector.
+    @param tabla Nombre de la tabla
+    @return str SQL de PostgreSQL
+    @version 1.0
+    """
+    expresion, columnas = VECTORES_BUSQUEDA[tabla]
+    return f"""
+CREATE OR REPLACE FUNCTION {tabla}_busqueda_tsv() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda_tsv := {expresion};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_{tabla}_busqueda_tsv ON {tabla};
+CREATE TRIGGER trg_{tabla}_busqueda_tsv BEFORE INSERT OR UPDATE OF {', '.join(columnas)} ON {tabla}
+    FOR EACH ROW EXECUTE FUNCTION {tabla}_busqueda_tsv();
+"""
+
+for modelo in (Cliente, Producto, Pedido, Factura):
+    event.listen(
+        modelo.__table__, 'after_create',
+        DDL(ddl_trigger_busqueda(modelo.__tablename__)).execute_if(dialect='postgresql')
+    )
+
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file busqueda.py
+@brief Rutas de la búsqueda global del ERP de Mega Nevada
+@details Este módulo expone una única búsqueda sobre clientes, productos, pedidos y facturas, para no tener que repetir la
+         búsqueda en cada listado, y los contadores de la caché de resultados de los buscadores.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+from flask import Blueprint, request, jsonify, url_for
+from services.busqueda_service import busqueda_global, TIPOS_BUSQUEDA_GLOBAL
+from services.cache_busqueda_service import obtener_cache
+
+# Crear blueprint para la búsqueda global
+busqueda_bp = Blueprint('busqueda', __name__, url_prefix='/busqueda')
+
+def url_resultado(tipo, registro_id):
+    """
+    @brief Página a la que lleva cada resultado de la búsqueda global
+    @param tipo Tipo del resultado
+    @param registro_id ID del registro
+    @return str URL
+    @version 1.0
+    """
+    if tipo == 'clientes':
+        return url_for('clientes.editar_cliente', id=registro_id)
+    if tipo == 'productos':
+        return url_for('productos.detalle_producto', id=registro_id)
+    if tipo == 'pedidos':
+        return url_for('pedidos.lista_pedidos', ver=registro_id)
+    return url_for('facturas.ver_factura', id=registro_id)
+
+@busqueda_bp.route('/api/global')
+def api_busqueda_global():
+    """
+    @brief API de búsqueda global
+    @details Parámetros: q (texto), limit (resultados por tipo, máximo 20) y tipos (lista separada por comas de
+             clientes, productos, pedidos y facturas). Devuelve los resultados de todos los tipos ordenados por relevancia,
+             cada uno con su tipo y su URL.
+    @return JSON con los resultados y el número de resultados por tipo
+    @version 1.0
+    """
+    try:
+        termino = request.args.get('q', '').strip()
+        limite = min(max(request.args.get('limit', 5, type=int), 1), 20)
+        tipos = [tipo.strip() for tipo in request.args.get('tipos', '').split(',') if tipo.strip()]
+
+        desconocidos = [tipo for tipo in tipos if tipo not in TIPOS_BUSQUEDA_GLOBAL]
+        if desconocidos:
+            return jsonify({
+                'success': False,
+                'message': f"Tipos no válidos: {', '.join(desconocidos)}"
+            }), 400
+
+        resultados = busqueda_global(termino, limite, tipos)
+        for resultado in resultados:
+            resultado['url'] = url_resultado(resultado['tipo'], resultado['id'])
+
+        por_tipo = {tipo: 0 for tipo in (tipos or TIPOS_BUSQUEDA_GLOBAL)}
+        for resultado in resultados:
+            por_tipo[resultado['tipo']] += 1
+
+        return jsonify({
+            'success': True,
+            'resultados': resultados,
+            'por_tipo': por_tipo
+        })
+
+    except Exception as e:
+        print(f"Error en búsqueda global: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error en búsqueda: {str(e)}'
+        }), 500
+
+@busqueda_bp.route('/api/cache')
+def api_estadisticas_cache():
+    """
+    @brief API con los contadores de la caché de resultados de los buscadores
+    @details Aciertos, fallos, entradas y descartes del proceso que atiende la petición, para dimensionar
+             CACHE_BUSQUEDA_ENTRADAS y CACHE_BUSQUEDA_SEGUNDOS.
+    @return JSON con las estadísticas, o activa False si la caché está desactivada
+    @version 1.0
+    """
+    cache = obtener_cache()
+    if cache is None:
+        return jsonify({'success': True, 'activa': False})
+
+    return jsonify({
+        'success': True,
+        'activa': True,
+        'estadisticas': cache.estadisticas()
+    })
@@ -6,13 +6,20 @@
 @brief Rutas para la gestión de clientes del ERP de Mega Nevada
 @details Este módulo contiene todas las rutas relacionadas con la gestión de clientes: crear, listar, editar, eliminar y buscar.
 @author José David Sánchez Fernández
-@version 1.5
+@version 1.8
 @date 2025-06-14
 @copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
 """
 
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from models.models import db, Cliente
+from utils.paginacion import paginar_por_cursor, CursorInvalidoError
+from utils.helpers import es_verdadero
+from utils.campos import leer_campos, opciones_carga, CamposInvalidosError
+from services.busqueda_service import filtrar_por_texto, ordenar_por_relevancia, buscar
+from services.autocompletado_service import actualizar_autocompletado
+from services.estadisticas_service import estadisticas_clientes
+from services.cache_busqueda_service import resultado_en_cache, clave_busqueda
 from datetime import datetime
 import re
 from decimal import Decimal
@@ -20,36 +27,49 @@ from decimal import Decimal
 # Crear blueprint para clientes
 clientes_bp = Blueprint('clientes', __name__, url_prefix='/clientes')
 
+def consulta_lista_clientes(search=''):
+    """
+    @brief Construye la consulta filtrada del listado de clientes
+    @param search Texto a buscar en nombre, código, teléfono, nombre fiscal, CIF o contacto
+    @return Query sin ordenar
+    @version 1.1
+    """
+    query = Cliente.query
+    
+    # Aplicar filtro de búsqueda si existe
+    if search:
+        query = filtrar_por_texto(query, Cliente, search)
+    
+    return query
+
 @clientes_bp.route('/')
 def lista_clientes():
     """
     @brief Lista todos los clientes del sistema
     @details Muestra una tabla paginada con todos los clientes registrados, con opción de búsqueda y filtros.
+             Con paginacion=cursor (o un cursor) se pagina por nombre e id en lugar de OFFSET y el total solo se cuenta
+             si se pide con total=1.
     @return Template HTML con la lista de clientes
-    @version 1.0
+    @version 1.2
     """
     try:
         page = request.args.get('page', 1, type=int)
         search = request.args.get('search', '', type=str)
+        cursor = request.args.get('cursor', '', type=str)
+        por_cursor = bool(cursor) or request.args.get('paginacion') == 'cursor'
         
-        query = Cliente.query
-        
-        # Aplicar filtro de búsqueda si existe
-        if search:
-            search_filter = f"%{search}%"
-            query = query.filter(
-                (Cliente.nombre.ilike(search_filter)) |
-                (Cliente.codigo.ilike(search_filter)) |
-                (Cliente.telefono.ilike(search_filter)) |
-                (Cliente.nombre_fiscal.ilike(search_filter)) |
-                (Cliente.cif.ilike(search_filter)) |
-                (Cliente.contacto.ilike(search_filter))
-            )
+        query = consulta_lista_clientes(search)
         
-        # Paginación
-        clientes = query.order_by(Cliente.nombre).paginate(
-            page=page, per_page=10, error_out=False
-        )
+        if por_cursor:
+            clientes = paginar_por_cursor(
+                query, [Cliente.nombre, Cliente.id],
+                cursor=cursor or None, per_page=10, con_total=es_verdadero(request.args.get('total'))
+            )
+        else:
+            # Paginación
+            clientes = ordenar_por_relevancia(query, Cliente, search, Cliente.nombre, Cliente.id).paginate(
+                page=page, per_page=10, error_out=False
+            )
         
         return render_template('clientes/lista.html', 
                              clientes=clientes, 
@@ -59,6 +79,43 @@ def lista_clientes():
         flash(f'Error al cargar clientes: {str(e)}', 'danger')
         return redirect(url_for('index'))
 
+@clientes_bp.route('/api/listado')
+def api_listado_clientes():
+    """
+    @brief API de listado de clientes paginado por cursor
+    @details Acepta el mismo filtro search que el listado HTML más cursor, limit (máximo 100) y total=1 para incluir
+             el número total de clientes.
+    @return JSON con los clientes de la página y los cursores siguiente y anterior
+    @version 1.0
+    """
+    try:
+        pagina = paginar_por_cursor(
+            consulta_lista_clientes(request.args.get('search', '', type=str)),
+            [Cliente.nombre, Cliente.id],
+            cursor=request.args.get('cursor') or None,
+            per_page=min(max(request.args.get('limit', 10, type=int), 1), 100),
+            con_total=es_verdadero(request.args.get('total'))
+        )
+        
+        return jsonify({
+            'success': True,
+            'clientes': [cliente.to_dict() for cliente in pagina.items],
+            'next_cursor': pagina.next_cursor,
+            'prev_cursor': pagina.prev_cursor,
+            'total': pagina.total
+        })
+        
+    except CursorInvalidoError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Error al obtener clientes: {str(e)}'
+        }), 500
+
 @clientes_bp.route('/nuevo')
 def nuevo_cliente():
     """
@@ -90,7 +147,7 @@ def api_crear_cliente():
     @brief API para crear un nuevo cliente
     @details Procesa los datos del formulario y crea un cliente en la base de datos
     @return JSON con resultado de la operación
-    @version 1.4
+    @version 1.5
     """
     try:
         data = request.get_json()
@@ -141,6 +198,7 @@ def api_crear_cliente():
         
         db.session.commit()
         print("Cambios guardados en base de datos")
+        actualizar_autocompletado(cliente)
         
         return jsonify({
             'success': True,
@@ -162,7 +220,7 @@ def api_actualizar_cliente(id):
     @brief API para actualizar un cliente existente
     @param id ID del cliente a actualizar
     @return JSON con resultado de la operación
-    @version 1.3
+    @version 1.4
     """
     try:
         cliente = Cliente.query.get_or_404(id)
@@ -210,6 +268,7 @@ def api_actualizar_cliente(id):
         cliente.cuenta_bancaria = data.get('cuenta_bancaria', '').strip()
         
         db.session.commit()
+        actualizar_autocompletado(cliente)
         
         return jsonify({
             'success': True,
@@ -230,7 +289,7 @@ def api_eliminar_cliente(id):
     @brief API para eliminar (desactivar) un cliente
     @param id ID del cliente a eliminar
     @return JSON con resultado de la operación
-    @version 1.0
+    @version 1.1
     """
     try:
         cliente = Cliente.query.get_or_404(id)
@@ -238,6 +297,7 @@ def api_eliminar_cliente(id):
         # No eliminar físicamente, solo desactivar
         cliente.activo = False
         db.session.commit()
+        actualizar_autocompletado(cliente)
         
         return jsonify({
             'success': True,
@@ -255,32 +315,32 @@ def api_eliminar_cliente(id):
 def api_buscar_clientes():
     """
     @brief API para buscar clientes
-    @details Busca clientes por código, nombre o teléfono
+    @details Busca clientes activos por código, nombre, teléfono, nombre fiscal, CIF o contacto, los más parecidos primero.
+             Con fields=campo1,campo2 devuelve y carga solo esos campos. Los resultados pasan por la caché de búsquedas.
     @return JSON con lista de clientes encontrados
-    @version 1.1
+    @version 1.4
     """
     try:
         termino = request.args.get('q', '').strip()
         limite = request.args.get('limit', 10, type=int)
+        campos = leer_campos(Cliente.SERIALIZACION)
         
         if not termino:
             return jsonify({'clientes': []})
         
-        search_filter = f"%{termino}%"
-        clientes = Cliente.query.filter(
-            Cliente.activo == True,
-            (Cliente.nombre.ilike(search_filter)) |
-            (Cliente.codigo.ilike(search_filter)) |
-            (Cliente.telefono.ilike(search_filter)) |
-            (Cliente.nombre_fiscal.ilike(search_filter)) |
-            (Cliente.cif.ilike(search_filter)) |
-            (Cliente.contacto.ilike(search_filter))
-        ).limit(limite).all()
+        clientes_data = resultado_en_cache('clientes', clave_busqueda(termino, limite, campos), lambda: [
+            cliente.to_dict(campos)
+            for cliente in buscar(Cliente, termino, limite, opciones=opciones_carga(Cliente, campos))
+        ])
         
         return jsonify({
-            'clientes': [cliente.to_dict() for cliente in clientes]
+            'clientes': clientes_data
         })
         
+    except CamposInvalidosError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'error': f'Error en búsqueda: {str(e)}'
@@ -290,12 +350,14 @@ def api_buscar_clientes():
 def api_detalle_cliente(id):
     """
     @brief API para obtener detalles de un cliente incluyendo todos los campos
+    @details Con fields=campo1,campo2 devuelve y carga solo esos campos del cliente; las estadísticas se incluyen siempre.
     @param id ID del cliente
     @return JSON con datos completos del cliente
-    @version 1.4
+    @version 1.5
     """
     try:
-        cliente = Cliente.query.get_or_404(id)
+        campos = leer_campos(Cliente.SERIALIZACION)
+        cliente = Cliente.query.options(*opciones_carga(Cliente, campos, 'fecha_ultima_visita')).get_or_404(id)
         total_pedidos = 0
         fecha_ultimo_pedido = None
         
@@ -321,13 +383,17 @@ def api_detalle_cliente(id):
             fecha_ultimo_pedido = cliente.fecha_ultima_visita
         
         return jsonify({
-            'cliente': cliente.to_dict(),
+            'cliente': cliente.to_dict(campos),
             'estadisticas': {
                 'total_pedidos': total_pedidos,
                 'fecha_ultimo_pedido': fecha_ultimo_pedido.isoformat() if fecha_ultimo_pedido else None
             }
         })
         
+    except CamposInvalidosError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f"Error en api_detalle_cliente: {str(e)}")
         return jsonify({
@@ -338,30 +404,12 @@ def api_detalle_cliente(id):
 def api_estadisticas_clientes():
     """
     @brief API para obtener estadísticas de clientes
-    @details Proporciona contadores y métricas para el home
+    @details Proporciona contadores y métricas para el home, calculados en una sola consulta por estadisticas_service
     @return JSON con estadísticas de clientes
-    @version 1.0
+    @version 1.1
     """
     try:
-        # Contar clientes totales
-        total_clientes = Cliente.query.filter_by(activo=True).count()
-        
-        # Contar clientes activos e inactivos
-        clientes_activos = Cliente.query.filter_by(activo=True).count()
-        clientes_inactivos = Cliente.query.filter_by(activo=False).count()
-        
-        # Obtener cliente con última visita más reciente
-        cliente_ultima_visita = Cliente.query.filter(
-            Cliente.fecha_ultima_visita.isnot(None)
-        ).order_by(Cliente.fecha_ultima_visita.desc()).first()
-        
-        return jsonify({
-            'total_clientes': total_clientes,
-            'clientes_activos': clientes_activos,
-            'clientes_inactivos': clientes_inactivos,
-            'ultima_visita': cliente_ultima_visita.fecha_ultima_visita.isoformat() if cliente_ultima_visita and cliente_ultima_visita.fecha_ultima_visita else None,
-            'cliente_ultima_visita': cliente_ultima_visita.nombre if cliente_ultima_visita else None
-        })
+        return jsonify(estadisticas_clientes())
         
     except Exception as e:
         return jsonify({
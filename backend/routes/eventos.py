@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file eventos.py
+@brief Canal de eventos en tiempo real del ERP de Mega Nevada
+@details Este módulo expone el flujo Server-Sent Events al que se conectan el home y el listado de pedidos para
+         actualizarse con los eventos de dominio (pedidos, facturas y stock bajo) sin recargar ni consultar
+         periódicamente las APIs.
+@author José David Sánchez Fernández
+@version 1.0
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import queue
+from flask import Blueprint, Response, request, jsonify, current_app
+from services.eventos_service import obtener_bus, formatear_evento
+
+# Crear blueprint para los eventos
+eventos_bp = Blueprint('eventos', __name__, url_prefix='/eventos')
+
+def ultimo_id_visto():
+    """
+    @brief Último evento recibido por el navegador, de la cabecera Last-Event-ID o del parámetro ultimo
+    @return int o None
+    @version 1.0
+    """
+    valor = request.headers.get('Last-Event-ID') or request.args.get('ultimo', '')
+    return int(valor) if valor.isdigit() else None
+
+@eventos_bp.route('/api/stream')
+def api_stream_eventos():
+    """
+    @brief Flujo Server-Sent Events con los eventos de dominio
+    @details Al conectar envía los eventos perdidos desde Last-Event-ID que sigan en el historial. Sin eventos, envía un
+             comentario de latido cada EVENTOS_LATIDO_SEGUNDOS para mantener viva la conexión y detectar a los clientes
+             que se han ido. Si el cliente no consume a tiempo, el servidor cierra el flujo y EventSource reconecta solo.
+    @return Response text/event-stream, o 503 si los eventos están desactivados o no se admiten más conexiones
+    @version 1.0
+    """
+    bus = obtener_bus()
+    if bus is None:
+        return jsonify({
+            'success': False,
+            'message': 'Eventos en tiempo real desactivados'
+        }), 503
+
+    cola, perdidos = bus.suscribir(ultimo_id_visto())
+    if cola is None:
+        return jsonify({
+            'success': False,
+            'message': 'Demasiadas conexiones de eventos abiertas'
+        }), 503
+
+    latido = current_app.config.get('EVENTOS_LATIDO_SEGUNDOS', 15)
+
+    def flujo():
+        try:
+            yield "retry: 5000\n\n"
+            for evento in perdidos:
+                yield formatear_evento(evento)
+            while True:
+                try:
+                    evento = cola.get(timeout=latido)
+                except queue.Empty:
+                    yield ": latido\n\n"
+                    continue
+                if evento is None:
+                    break
+                yield formatear_evento(evento)
+        finally:
+            bus.cancelar(cola)
+
+    return Response(flujo(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@eventos_bp.route('/api/estado')
+def api_estado_eventos():
+    """
+    @brief Suscriptores conectados al canal de eventos de este proceso
+    @return JSON con suscriptores y último id publicado
+    @version 1.0
+    """
+    bus = obtener_bus()
+    return jsonify({
+        'success': True,
+        'activo': bus is not None,
+        **(bus.estadisticas() if bus is not None else {})
+    })
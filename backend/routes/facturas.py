@@ -6,13 +6,25 @@
 @brief Rutas para la gestión de facturas del ERP de Mega Nevada
 @details Este módulo contiene todas las rutas relacionadas con la gestión de facturas: crear, listar, visualizar e imprimir.
 @author José David Sánchez Fernández
-@version 1.2
+@version 1.9
 @date 2025-06-15
 @copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
 """
 
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, make_response
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, make_response, send_file, Response, stream_with_context, current_app
 from models.models import db, Factura, Pedido, Cliente, Producto, ItemPedido
+from sqlalchemy.orm import contains_eager
+from services.numeracion_service import generar_numero_factura
+from services.impuestos_service import desglosar_items
+from services.estadisticas_service import estadisticas_facturas
+from services.facturacion_service import resumen_facturacion, PERIODOS_FACTURACION
+from services.eventos_service import anotar_factura_generada
+from services.pdf_service import obtener_pdf_factura
+from services.exportacion_facturas_service import exportar_facturas_zip
+from services.busqueda_service import condicion_texto
+from utils.paginacion import paginar_por_cursor, CursorInvalidoError
+from utils.helpers import es_verdadero, leer_fecha
+from utils.idempotencia import idempotente, confirmar_operacion
 from datetime import datetime, timedelta
 from decimal import Decimal
 import re
@@ -20,34 +32,58 @@ import re
 # Crear blueprint para facturas
 facturas_bp = Blueprint('facturas', __name__, url_prefix='/facturas')
 
+def consulta_lista_facturas(search=''):
+    """
+    @brief Construye la consulta filtrada del listado de facturas
+    @details Los joins con Pedido y Cliente se usan también para cargar el pedido y el cliente de cada fila.
+    @param search Texto a buscar en número de factura, número de pedido o en los campos buscables del cliente (sin
+           distinguir tildes)
+    @return Query sin ordenar
+    @version 1.1
+    """
+    query = Factura.query.join(Pedido).join(Cliente).options(
+        contains_eager(Factura.pedido).contains_eager(Pedido.cliente)
+    )
+    
+    # Aplicar filtro de búsqueda si existe
+    if search:
+        search_filter = f"%{search}%"
+        query = query.filter(
+            (Factura.numero_factura.ilike(search_filter)) |
+            condicion_texto(Cliente, search) |
+            (Pedido.numero_pedido.ilike(search_filter))
+        )
+    
+    return query
+
 @facturas_bp.route('/')
 def lista_facturas():
     """
     @brief Lista todas las facturas del sistema
     @details Muestra una tabla paginada con todas las facturas generadas, con opción de búsqueda y filtros.
+             Con paginacion=cursor (o un cursor) se pagina por fecha e id en lugar de OFFSET y el total solo se cuenta
+             si se pide con total=1.
     @return Template HTML con la lista de facturas
-    @version 1.0
+    @version 1.1
     """
     try:
         page = request.args.get('page', 1, type=int)
         search = request.args.get('search', '', type=str)
+        cursor = request.args.get('cursor', '', type=str)
+        por_cursor = bool(cursor) or request.args.get('paginacion') == 'cursor'
         
-        query = Factura.query.join(Pedido).join(Cliente)
+        query = consulta_lista_facturas(search)
         
-        # Aplicar filtro de búsqueda si existe
-        if search:
-            search_filter = f"%{search}%"
-            query = query.filter(
-                (Factura.numero_factura.ilike(search_filter)) |
-                (Cliente.nombre.ilike(search_filter)) |
-                (Cliente.codigo.ilike(search_filter)) |
-                (Pedido.numero_pedido.ilike(search_filter))
+        if por_cursor:
+            facturas = paginar_por_cursor(
+                query, [Factura.fecha_factura, Factura.id], descendente=True,
+                cursor=cursor or None, per_page=15, con_total=es_verdadero(request.args.get('total'))
+            )
+        else:
+            # Paginación - ordenar por fecha descendente
+            facturas = query.order_by(Factura.fecha_factura.desc(), Factura.id.desc()).paginate(
+                page=page, per_page=15, error_out=False
             )
-        
-        # Paginación - ordenar por fecha descendente
-        facturas = query.order_by(Factura.fecha_factura.desc()).paginate(
-            page=page, per_page=15, error_out=False
-        )
         
         return render_template('facturas/lista.html', facturas=facturas, search=search)
                              
@@ -55,13 +91,63 @@ def lista_facturas():
         flash(f'Error al cargar facturas: {str(e)}', 'danger')
         return redirect(url_for('index'))
 
+@facturas_bp.route('/api/listado')
+def api_listado_facturas():
+    """
+    @brief API de listado de facturas paginado por cursor
+    @details Acepta el mismo filtro search que el listado HTML más cursor, limit (máximo 100) y total=1 para incluir
+             el número total de facturas.
+    @return JSON con las facturas de la página y los cursores siguiente y anterior
+    @version 1.0
+    """
+    try:
+        pagina = paginar_por_cursor(
+            consulta_lista_facturas(request.args.get('search', '', type=str)),
+            [Factura.fecha_factura, Factura.id], descendente=True,
+            cursor=request.args.get('cursor') or None,
+            per_page=min(max(request.args.get('limit', 15, type=int), 1), 100),
+            con_total=es_verdadero(request.args.get('total'))
+        )
+        
+        return jsonify({
+            'success': True,
+            'facturas': [
+                {
+                    'id': factura.id,
+                    'numero_factura': factura.numero_factura,
+                    'fecha_factura': factura.fecha_factura.isoformat() if factura.fecha_factura else None,
+                    'total': float(factura.total),
+                    'enviada_por_email': factura.enviada_por_email,
+                    'pedido_id': factura.pedido_id,
+                    'numero_pedido': factura.pedido.numero_pedido,
+                    'cliente_nombre': factura.pedido.cliente.nombre,
+                    'cliente_codigo': factura.pedido.cliente.codigo
+                }
+                for factura in pagina.items
+            ],
+            'next_cursor': pagina.next_cursor,
+            'prev_cursor': pagina.prev_cursor,
+            'total': pagina.total
+        })
+        
+    except CursorInvalidoError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Error al obtener facturas: {str(e)}'
+        }), 500
+
 @facturas_bp.route('/ver/<int:id>')
 def ver_factura(id):
     """
     @brief Vista detallada de una factura para visualización/impresión
     @param id ID de la factura
     @return Template HTML con los detalles de la factura
-    @version 1.1
+    @version 1.2
     """
     try:
         print(f"Intentando cargar factura con ID: {id}")
@@ -108,7 +194,10 @@ def ver_factura(id):
         
         print(f"Todos los datos verificados, renderizando template")
         
-        return render_template('facturas/detalle.html', factura=factura)
+        # Desglose por tipo de IVA calculado en una sola pasada sobre los items
+        desglose = desglosar_items(factura.pedido.items)
+        
+        return render_template('facturas/detalle.html', factura=factura, desglose=desglose)
         
     except Exception as e:
         print(f"Error en ver_factura: {str(e)}")
@@ -120,34 +209,112 @@ def ver_factura(id):
 @facturas_bp.route('/pdf/<int:id>')
 def generar_pdf_factura(id):
     """
-    @brief Redirige a la vista HTML de la factura para impresión
+    @brief Descarga la factura en PDF
+    @details El PDF se genera en el servidor con los mismos datos que la vista HTML y se guarda en disco: las descargas
+             siguientes de la factura sin cambios se sirven directamente del fichero. La respuesta lleva como ETag la
+             huella de los datos, así el navegador puede revalidar sin volver a descargarlo.
     @param id ID de la factura
-    @return Redirección a vista HTML con parámetro de impresión
-    @version 2.0
+    @return Response application/pdf
+    @version 3.0
     """
     try:
-        print(f"Redirigiendo a vista HTML para factura ID: {id}")
-        
-        # Verificar que la factura existe
         factura = Factura.query.get(id)
         if not factura:
             print(f"Factura con ID {id} no encontrada")
             return "Factura no encontrada", 404
         
-        # Redirigir a la vista HTML
-        return redirect(url_for('facturas.ver_factura', id=id) + '?print=1')
+        if not factura.pedido or not factura.pedido.cliente or not factura.pedido.items:
+            print(f"Factura {factura.numero_factura} sin pedido, cliente o productos")
+            return "La factura no tiene pedido, cliente o productos", 400
+        
+        ruta, huella = obtener_pdf_factura(factura)
+        respuesta = send_file(
+            ruta,
+            mimetype='application/pdf',
+            as_attachment=es_verdadero(request.args.get('descargar')),
+            download_name=f"{factura.numero_factura.replace('/', '-')}.pdf",
+            etag=huella,
+            conditional=True
+        )
+        respuesta.cache_control.no_cache = True
+        return respuesta
+        
+    except Exception as e:
+        print(f"Error al generar PDF de factura: {str(e)}")
+        return f"Error al generar PDF de factura: {str(e)}", 500
+
+@facturas_bp.route('/exportar-pdf')
+def exportar_facturas_pdf():
+    """
+    @brief Descarga un ZIP con el PDF de cada factura de un rango de fechas o filtro
+    @details Acepta desde y hasta (YYYY-MM-DD, ambos incluidos), cliente_id y el mismo search que el listado. El ZIP se
+             envía mientras se genera: los PDF ya guardados se leen del disco y el resto se generan en paralelo en
+             PDF_EXPORTACION_PROCESOS procesos.
+    @return Response application/zip, o JSON con el error
+    @version 1.0
+    """
+    try:
+        try:
+            desde = leer_fecha(request.args.get('desde', ''))
+            hasta = leer_fecha(request.args.get('hasta', ''))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Fecha no válida, use el formato YYYY-MM-DD'
+            }), 400
+        
+        cliente_id = request.args.get('cliente_id', type=int)
+        
+        query = consulta_lista_facturas(request.args.get('search', '', type=str))
+        if desde:
+            query = query.filter(Factura.fecha_factura >= datetime.combine(desde, datetime.min.time()))
+        if hasta:
+            query = query.filter(Factura.fecha_factura < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+        if cliente_id:
+            query = query.filter(Pedido.cliente_id == cliente_id)
+        
+        factura_ids = [
+            factura_id for (factura_id,) in
+            query.with_entities(Factura.id).order_by(Factura.fecha_factura, Factura.id)
+        ]
+        if not factura_ids:
+            return jsonify({
+                'success': False,
+                'message': 'No hay facturas que exportar con esos filtros'
+            }), 404
+        
+        nombre = 'facturas'
+        if desde or hasta:
+            nombre += f"_{desde.isoformat() if desde else 'inicio'}_{hasta.isoformat() if hasta else 'hoy'}"
+        
+        flujo = exportar_facturas_zip(
+            factura_ids,
+            current_app.config['PDF_CACHE_DIR'],
+            procesos=current_app.config.get('PDF_EXPORTACION_PROCESOS')
+        )
+        return Response(stream_with_context(flujo), mimetype='application/zip', headers={
+            'Content-Disposition': f'attachment; filename="{nombre}.zip"',
+            'X-Accel-Buffering': 'no',
+            'X-Total-Facturas': str(len(factura_ids))
+        })
         
     except Exception as e:
-        print(f"Error al acceder a factura: {str(e)}")
-        return f"Error al acceder a factura: {str(e)}", 500
+        print(f"Error al exportar facturas: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error al exportar facturas: {str(e)}'
+        }), 500
 
 @facturas_bp.route('/api/generar-desde-pedido/<int:pedido_id>', methods=['POST'])
+@idempotente('facturas.generar_desde_pedido')
 def api_generar_factura_desde_pedido(pedido_id):
     """
     @brief API para generar una factura automáticamente desde un pedido
+    @details Admite la cabecera Idempotency-Key: un reintento con la misma clave recibe la respuesta original.
+             Al confirmarse se publica el evento factura_generada.
     @param pedido_id ID del pedido desde el cual generar la factura
     @return JSON con resultado de la operación
-    @version 1.0
+    @version 1.3
     """
     try:
         pedido = Pedido.query.get_or_404(pedido_id)
@@ -179,7 +346,9 @@ def api_generar_factura_desde_pedido(pedido_id):
         )
         
         db.session.add(factura)
-        db.session.commit()
+        db.session.flush()
+        anotar_factura_generada(factura)
+        confirmar_operacion()
         
         return jsonify({
             'success': True,
@@ -229,87 +398,65 @@ def api_marcar_enviada(id):
 def api_estadisticas_facturas():
     """
     @brief API para obtener estadísticas de facturas
-    @details Proporciona contadores y métricas para el home
+    @details Proporciona contadores y métricas para el home, calculados en una sola consulta por estadisticas_service
     @return JSON con estadísticas de facturas
-    @version 1.0
+    @version 1.1
     """
     try:
-        # Obtener fecha actual y del mes
-        hoy = datetime.utcnow()
-        inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        # Contar facturas del mes actual
-        facturas_mes = Factura.query.filter(
-            Factura.fecha_factura >= inicio_mes
-        ).count()
-        
-        # Contar facturas totales
-        total_facturas = Factura.query.count()
-        
-        # Contar facturas enviadas por email
-        facturas_enviadas = Factura.query.filter_by(enviada_por_email=True).count()
-        
-        # Calcular total facturado del mes
-        facturas_mes_data = Factura.query.filter(
-            Factura.fecha_factura >= inicio_mes
-        ).all()
-        
-        total_facturado_mes = sum(factura.total for factura in facturas_mes_data) if facturas_mes_data else Decimal('0')
-        
-        return jsonify({
-            'facturas_mes': facturas_mes,
-            'total_facturas': total_facturas,
-            'facturas_enviadas': facturas_enviadas,
-            'total_facturado_mes': float(total_facturado_mes)
-        })
+        return jsonify(estadisticas_facturas())
         
     except Exception as e:
         return jsonify({
             'error': f'Error al obtener estadísticas: {str(e)}'
         }), 500
 
-def generar_numero_factura():
+@facturas_bp.route('/api/resumen')
+def api_resumen_facturacion():
     """
-    @brief Genera un número de factura único siguiendo el formato VF/XXX/YY
-    @details Utiliza el formato: VF/[número secuencial]/[año de 2 dígitos]
-    @return String con el número de factura generado
+    @brief API de resumen de facturación por periodos
+    @details Agregado en la base de datos por resumen_facturacion. Parámetros: periodo (mes o semana; por defecto mes),
+             desde y hasta (YYYY-MM-DD). Cada periodo incluye su comparación con el anterior y con el del año anterior;
+             el último es el periodo en curso.
+    @return JSON con un registro por periodo y los totales del rango
     @version 1.0
     """
     try:
-        # Obtener el año actual en formato de 2 dígitos
-        anio_actual = datetime.utcnow().strftime('%y')
-        
-        # Buscar la última factura del año actual
-        patron_anio = f'%/{anio_actual}'
-        ultima_factura = Factura.query.filter(
-            Factura.numero_factura.like(patron_anio)
-        ).order_by(Factura.numero_factura.desc()).first()
-        
-        if ultima_factura:
-            # Extraer el número secuencial de la última factura
-            partes = ultima_factura.numero_factura.split('/')
-            if len(partes) == 3:
-                try:
-                    ultimo_numero = int(partes[1])
-                    siguiente_numero = ultimo_numero + 1
-                except ValueError:
-                    siguiente_numero = 1
-            else:
-                siguiente_numero = 1
-        else:
-            siguiente_numero = 1
+        periodo = request.args.get('periodo', 'mes')
+        if periodo not in PERIODOS_FACTURACION:
+            return jsonify({
+                'success': False,
+                'message': f"Periodo no válido, use {', '.join(PERIODOS_FACTURACION)}"
+            }), 400
+        
+        try:
+            desde = leer_fecha(request.args.get('desde', ''))
+            hasta = leer_fecha(request.args.get('hasta', ''))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Fecha no válida, use el formato YYYY-MM-DD'
+            }), 400
         
-        # Generar el nuevo número con formato VF/XXX/YY
-        numero_factura = f"VF/{siguiente_numero:03d}/{anio_actual}"
+        if desde and hasta and desde > hasta:
+            return jsonify({
+                'success': False,
+                'message': 'La fecha desde no puede ser posterior a hasta'
+            }), 400
         
-        # Verificar que no exista
-        while Factura.query.filter_by(numero_factura=numero_factura).first():
-            siguiente_numero += 1
-            numero_factura = f"VF/{siguiente_numero:03d}/{anio_actual}"
+        periodos = resumen_facturacion(periodo, desde, hasta)
         
-        return numero_factura
+        return jsonify({
+            'success': True,
+            'periodo': periodo,
+            'periodos': periodos,
+            'actual': periodos[-1] if periodos else None,
+            'total_facturas': sum(fila['facturas'] for fila in periodos),
+            'total_facturado': round(sum(fila['total'] for fila in periodos), 2)
+        })
         
     except Exception as e:
-        # En caso de error, usar timestamp como fallback
-        timestamp = datetime.utcnow().strftime('%y%m%d%H%M')
-        return f"VF/{timestamp}/ER"
\ No newline at end of file
+        print(f"Error en api_resumen_facturacion: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error al obtener el resumen de facturación: {str(e)}'
+        }), 500
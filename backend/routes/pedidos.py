@@ -6,13 +6,29 @@
 @brief Rutas para la gestión de pedidos del ERP de Mega Nevada
 @details Este módulo contiene todas las rutas relacionadas con la gestión de pedidos: crear, listar, editar, eliminar y control de estado.
 @author José David Sánchez Fernández
-@version 1.6
+@version 2.4
 @date 2025-06-15
 @copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
 """
 
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app
 from models.models import db, Pedido, ItemPedido, Cliente, Producto, Factura
+from sqlalchemy.orm import contains_eager, selectinload
+from services.stock_service import StockInsuficienteError, agrupar_cantidades, ajustar_stock, reservar_stock, liberar_stock
+from services.numeracion_service import generar_numero_pedido, generar_numero_factura
+from services.impuestos_service import desglosar_items
+from services.estadisticas_service import estadisticas_pedidos
+from services.busqueda_service import buscar, condicion_texto
+from services.autocompletado_service import buscar_autocompletado
+from services.cache_busqueda_service import resultado_en_cache, clave_busqueda
+from services.carga_pedidos_service import leer_pedidos_ndjson, leer_pedidos_csv, procesar_carga
+from services.ventas_service import lineas_venta, actualizar_ventas, resumen_ventas, AGRUPACIONES_VENTAS
+from services.eventos_service import anotar_evento, anotar_factura_generada, datos_pedido
+from services.pdf_service import anotar_invalidacion_pdf
+from utils.paginacion import paginar_por_cursor, CursorInvalidoError
+from utils.helpers import es_verdadero, leer_fecha
+from utils.idempotencia import idempotente, confirmar_operacion
+from utils.campos import leer_campos, opciones_carga, CamposInvalidosError
 from datetime import datetime
 import json
 from decimal import Decimal
@@ -20,64 +36,70 @@ from decimal import Decimal
 # Crear blueprint para pedidos
 pedidos_bp = Blueprint('pedidos', __name__, url_prefix='/pedidos')
 
+def consulta_lista_pedidos(search='', estado='', cliente_id=None):
+    """
+    @brief Construye la consulta filtrada del listado de pedidos
+    @details Un único join con Cliente sirve tanto para la búsqueda como para cargar el cliente de cada fila,
+             y los items se cargan en una sola consulta adicional.
+    @param search Texto a buscar en número de pedido o en los campos buscables del cliente (sin distinguir tildes)
+    @param estado Estado del pedido
+    @param cliente_id ID del cliente
+    @return Query sin ordenar
+    @version 1.1
+    """
+    query = Pedido.query.join(Cliente).options(
+        contains_eager(Pedido.cliente),
+        selectinload(Pedido.items)
+    )
+    
+    # Aplicar filtro de búsqueda si existe
+    if search:
+        search_filter = f"%{search}%"
+        query = query.filter(
+            (Pedido.numero_pedido.ilike(search_filter)) |
+            condicion_texto(Cliente, search)
+        )
+    
+    # Filtrar por estado
+    if estado:
+        query = query.filter(Pedido.estado == estado)
+        
+    # Filtrar por cliente específico
+    if cliente_id:
+        query = query.filter(Pedido.cliente_id == cliente_id)
+    
+    return query
+
 @pedidos_bp.route('/')
 def lista_pedidos():
     """
     @brief Lista todos los pedidos del sistema
     @details Muestra una tabla paginada con todos los pedidos registrados, con opción de búsqueda y filtros por estado.
+             El número de sentencias SQL no depende del tamaño de la página. Con paginacion=cursor (o un cursor)
+             se pagina por fecha e id en lugar de OFFSET y el total solo se cuenta si se pide con total=1.
     @return Template HTML con la lista de pedidos
-    @version 1.2
+    @version 1.4
     """
     try:
         page = request.args.get('page', 1, type=int)
         search = request.args.get('search', '', type=str)
         estado = request.args.get('estado', '', type=str)
         cliente_id = request.args.get('cliente', '', type=int)
+        cursor = request.args.get('cursor', '', type=str)
+        por_cursor = bool(cursor) or request.args.get('paginacion') == 'cursor'
         
-        # Verificar si las tablas existen
-        try:
-            query = Pedido.query
-        except Exception as e:
-            print(f"Tabla de pedidos no existe aún: {str(e)}")
-            db.create_all()
-            query = Pedido.query
-        
-        # Intentar hacer join con Cliente si es posible
-        try:
-            query = query.join(Cliente)
-        except Exception as e:
-            print(f"No se puede hacer join con Cliente: {str(e)}")
-            pass
+        query = consulta_lista_pedidos(search, estado, cliente_id)
         
-        # Aplicar filtro de búsqueda si existe
-        if search:
-            search_filter = f"%{search}%"
-            try:
-                query = query.filter(
-                    (Pedido.numero_pedido.ilike(search_filter))
-                )
-                if Cliente.query.first() is not None:
-                    query = query.join(Cliente).filter(
-                        (Pedido.numero_pedido.ilike(search_filter)) |
-                        (Cliente.nombre.ilike(search_filter)) |
-                        (Cliente.codigo.ilike(search_filter))
-                    )
-            except Exception as e:
-                print(f"Error en filtro de búsqueda: {str(e)}")
-                query = Pedido.query.filter(Pedido.numero_pedido.ilike(search_filter))
-        
-        # Filtrar por estado
-        if estado:
-            query = query.filter(Pedido.estado == estado)
-            
-        # Filtrar por cliente específico
-        if cliente_id:
-            query = query.filter(Pedido.cliente_id == cliente_id)
-        
-        # Paginación - ordenar por fecha más reciente primero
-        pedidos = query.order_by(Pedido.fecha_pedido.desc()).paginate(
-            page=page, per_page=15, error_out=False
-        )
+        if por_cursor:
+            pedidos = paginar_por_cursor(
+                query, [Pedido.fecha_pedido, Pedido.id], descendente=True,
+                cursor=cursor or None, per_page=15, con_total=es_verdadero(request.args.get('total'))
+            )
+        else:
+            # Paginación - ordenar por fecha más reciente primero
+            pedidos = query.order_by(Pedido.fecha_pedido.desc(), Pedido.id.desc()).paginate(
+                page=page, per_page=15, error_out=False
+            )
         
         # Obtener estados para el filtro
         estados = ['pendiente', 'confirmado', 'entregado', 'facturado']
@@ -108,6 +130,47 @@ def lista_pedidos():
         
         return render_template('pedidos/lista.html', pedidos=pedidos_vacios, search='', estado='', estados=estados, cliente_id=None)
 
+@pedidos_bp.route('/api/listado')
+def api_listado_pedidos():
+    """
+    @brief API de listado de pedidos paginado por cursor
+    @details Acepta los mismos filtros que el listado HTML (search, estado, cliente) más cursor, limit (máximo 100)
+             y total=1 para incluir el número total de pedidos.
+    @return JSON con los pedidos de la página y los cursores siguiente y anterior
+    @version 1.0
+    """
+    try:
+        query = consulta_lista_pedidos(
+            request.args.get('search', '', type=str),
+            request.args.get('estado', '', type=str),
+            request.args.get('cliente', None, type=int)
+        )
+        pagina = paginar_por_cursor(
+            query, [Pedido.fecha_pedido, Pedido.id], descendente=True,
+            cursor=request.args.get('cursor') or None,
+            per_page=min(max(request.args.get('limit', 15, type=int), 1), 100),
+            con_total=es_verdadero(request.args.get('total'))
+        )
+        
+        return jsonify({
+            'success': True,
+            'pedidos': [pedido.to_dict() for pedido in pagina.items],
+            'next_cursor': pagina.next_cursor,
+            'prev_cursor': pagina.prev_cursor,
+            'total': pagina.total
+        })
+        
+    except CursorInvalidoError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Error al obtener pedidos: {str(e)}'
+        }), 500
+
 @pedidos_bp.route('/nuevo')
 def nuevo_pedido():
     """
@@ -153,12 +216,17 @@ def editar_pedido(id):
     return render_template('pedidos/formulario.html', pedido=pedido)
 
 @pedidos_bp.route('/api/crear', methods=['POST'])
+@idempotente('pedidos.crear')
 def api_crear_pedido():
     """
     @brief API para crear un nuevo pedido
-    @details Procesa los datos del formulario y crea un pedido en la base de datos
+    @details Procesa los datos del formulario y crea un pedido en la base de datos. El stock de todo el carrito
+             se reserva de una vez con stock_service y, si falta alguno, se informa de todos los faltantes.
+             Admite la cabecera Idempotency-Key: un reintento con la misma clave recibe la respuesta original.
+             Las ventas del pedido se suman a ventas_diarias en la misma transacción. Al confirmarse se publican los
+             eventos pedido_creado y factura_generada.
     @return JSON con resultado de la operación
-    @version 1.4
+    @version 2.0
     """
     try:
         data = request.get_json()
@@ -200,6 +268,7 @@ def api_crear_pedido():
         db.session.flush()
         
         # Procesar items del pedido
+        lineas_stock = []
         for item_data in data['items']:
             if not item_data.get('producto_id') or not item_data.get('cantidad'):
                 continue
@@ -223,20 +292,29 @@ def api_crear_pedido():
             
             item.calcular_totales()
             
-            # Actualizar stock si no es depósito
+            # El stock se descuenta al final para todo el carrito si no es depósito
             if not producto.es_deposito:
-                if producto.stock < cantidad:
-                    return jsonify({
-                        'success': False,
-                        'message': f'Stock insuficiente para {producto.nombre}. Disponible: {producto.stock}'
-                    }), 400
-                producto.stock -= cantidad
+                lineas_stock.append((producto.id, cantidad))
             
-            db.session.add(item)
+            pedido.items.append(item)
         
-        # Calcular totales del pedido
+        # Reservar stock de todo el carrito de una vez
+        try:
+            reservar_stock(agrupar_cantidades(lineas_stock))
+        except StockInsuficienteError as e:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'message': str(e),
+                'faltantes': e.faltantes
+            }), 400
+        
+        # Calcular y guardar totales del pedido
         pedido.calcular_totales()
         
+        # Sumar las ventas del pedido al acumulado diario
+        actualizar_ventas(nuevas=lineas_venta(pedido))
+        
         # Actualizar fecha de última visita del cliente
         cliente.fecha_ultima_visita = datetime.utcnow()
         
@@ -257,8 +335,14 @@ def api_crear_pedido():
                 'message': f'Error al generar factura: {str(e)}'
             }), 500
         
-        # Hacer commit de todo junto
-        db.session.commit()
+        # Eventos en tiempo real, publicados al confirmar
+        db.session.flush()
+        anotar_evento('pedido_creado', **datos_pedido(pedido))
+        if factura:
+            anotar_factura_generada(factura)
+        
+        # Hacer commit de todo junto (con Idempotency-Key, junto con la respuesta guardada)
+        confirmar_operacion()
         print(f"Pedido {numero_pedido} creado correctamente")
         
         return jsonify({
@@ -277,68 +361,154 @@ def api_crear_pedido():
             'message': f'Error al crear pedido: {str(e)}'
         }), 500
 
+@pedidos_bp.route('/api/carga-masiva', methods=['POST'])
+def api_carga_masiva_pedidos():
+    """
+    @brief API para cargar muchos pedidos de una vez
+    @details Recibe pedidos en NDJSON (Content-Type application/x-ndjson, un pedido por línea con el mismo formato que
+             /api/crear, aceptando también cliente_codigo y producto_codigo) o en CSV (Content-Type text/csv, una fila por
+             item agrupadas por referencia). Los pedidos se procesan y confirman por lotes y cada uno se factura
+             automáticamente igual que en /api/crear.
+    @return JSON con un resultado por pedido
+    @version 1.0
+    """
+    try:
+        tipo = (request.mimetype or '').lower()
+        if tipo in ('text/csv', 'application/csv'):
+            pedidos = leer_pedidos_csv(request.stream)
+        elif tipo in ('application/x-ndjson', 'application/jsonl', 'application/json-lines'):
+            pedidos = leer_pedidos_ndjson(request.stream)
+        else:
+            return jsonify({
+                'success': False,
+                'message': 'Formato no soportado, use application/x-ndjson o text/csv'
+            }), 415
+        
+        tamano_lote = request.args.get('lote', current_app.config['CARGA_PEDIDOS_LOTE'], type=int)
+        resultados = procesar_carga(pedidos, max(1, tamano_lote))
+        creados = sum(1 for resultado in resultados if resultado['success'])
+        print(f"Carga masiva: {creados} de {len(resultados)} pedidos creados")
+        
+        return jsonify({
+            'success': True,
+            'message': f'{creados} de {len(resultados)} pedidos creados',
+            'total': len(resultados),
+            'creados': creados,
+            'errores': len(resultados) - creados,
+            'resultados': resultados
+        })
+        
+    except Exception as e:
+        print(f"Error en api_carga_masiva_pedidos: {str(e)}")
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Error en la carga masiva: {str(e)}'
+        }), 500
+
 @pedidos_bp.route('/api/actualizar/<int:id>', methods=['PUT'])
 def api_actualizar_pedido(id):
     """
     @brief API para actualizar un pedido existente
+    @details Compara las líneas recibidas con las actuales por producto y solo inserta, modifica o borra las que cambian.
+             Las líneas modificadas conservan el precio con el que se pidieron. El stock se ajusta por la variación neta
+             de cada producto y los totales y la factura se recalculan una sola vez al final. ventas_diarias recibe solo la
+             diferencia entre las líneas de venta anteriores y las nuevas. Si cambia el estado se publica pedido_estado.
     @param id ID del pedido a actualizar
     @return JSON con resultado de la operación
-    @version 1.2
+    @version 2.2
     """
     try:
-        pedido = Pedido.query.get_or_404(id)
+        pedido = Pedido.query.options(
+            selectinload(Pedido.items).joinedload(ItemPedido.producto)
+        ).get_or_404(id)
         data = request.get_json()
+        ventas_anteriores = lineas_venta(pedido)
         
         # Verificar si tiene items para poder procesar la actualización
         if data.get('items'):
-            # Eliminar items existentes
-            for item in pedido.items:
-                if not item.producto.es_deposito:
-                    item.producto.stock += item.cantidad
-                db.session.delete(item)
-            
-            # Procesar nuevos items
+            # Cantidades pedidas por producto (las líneas repetidas de un mismo producto se suman)
+            cantidades_pedidas = {}
             for item_data in data['items']:
                 if not item_data.get('producto_id') or not item_data.get('cantidad'):
                     continue
-                    
-                producto = Producto.query.get(item_data['producto_id'])
-                if not producto:
-                    continue
-                    
                 cantidad = int(item_data['cantidad'])
                 if cantidad <= 0:
                     continue
+                producto_id = int(item_data['producto_id'])
+                cantidades_pedidas[producto_id] = cantidades_pedidas.get(producto_id, 0) + cantidad
+            
+            # Items actuales agrupados por producto
+            items_actuales = {}
+            for item in pedido.items:
+                items_actuales.setdefault(item.producto_id, []).append(item)
+            
+            # Productos nuevos en el pedido, cargados en una sola consulta
+            ids_nuevos = [producto_id for producto_id in cantidades_pedidas if producto_id not in items_actuales]
+            productos_nuevos = {
+                producto.id: producto
+                for producto in Producto.query.filter(Producto.id.in_(ids_nuevos)).all()
+            } if ids_nuevos else {}
+            
+            deltas = {}
+            
+            # Líneas eliminadas o con cantidad distinta
+            for producto_id, items in items_actuales.items():
+                cantidad_anterior = sum(item.cantidad for item in items)
+                cantidad_nueva = cantidades_pedidas.get(producto_id, 0)
+                if cantidad_nueva == cantidad_anterior and len(items) == 1:
+                    continue
                 
-                # Crear nuevo item
+                if not items[0].producto.es_deposito:
+                    deltas[producto_id] = cantidad_nueva - cantidad_anterior
+                
+                # Se conserva un único item por producto con su precio original
+                sobrantes = items if cantidad_nueva == 0 else items[1:]
+                for item in sobrantes:
+                    pedido.items.remove(item)
+                if cantidad_nueva > 0:
+                    items[0].cantidad = cantidad_nueva
+                    items[0].calcular_totales()
+            
+            # Líneas añadidas, con los precios actuales del producto
+            for producto_id, producto in productos_nuevos.items():
+                cantidad = cantidades_pedidas[producto_id]
                 item = ItemPedido(
-                    pedido_id=pedido.id,
-                    producto_id=producto.id,
+                    producto=producto,
                     cantidad=cantidad,
                     precio_unitario_sin_iva=producto.pvf_sin_iva,
                     iva_porcentaje=producto.iva_porcentaje
                 )
-                
                 item.calcular_totales()
+                pedido.items.append(item)
                 
-                # Actualizar stock si no es depósito
                 if not producto.es_deposito:
-                    if producto.stock < cantidad:
-                        return jsonify({
-                            'success': False,
-                            'message': f'Stock insuficiente para {producto.nombre}. Disponible: {producto.stock}'
-                        }), 400
-                    producto.stock -= cantidad
-                
-                db.session.add(item)
+                    deltas[producto_id] = cantidad
+            
+            # Aplicar solo la variación neta de stock por producto
+            try:
+                ajustar_stock(deltas)
+            except StockInsuficienteError as e:
+                db.session.rollback()
+                return jsonify({
+                    'success': False,
+                    'message': str(e),
+                    'faltantes': e.faltantes
+                }), 400
         
         # Actualizar campos del pedido
+        estado_anterior = pedido.estado
         pedido.estado = data.get('estado', pedido.estado)
         pedido.observaciones = data.get('observaciones', pedido.observaciones)
+        if pedido.estado != estado_anterior:
+            anotar_evento('pedido_estado', estado_anterior=estado_anterior, **datos_pedido(pedido))
         
         # Recalcular totales
         pedido.calcular_totales()
         
+        # Aplicar al acumulado diario la variación de las ventas del pedido
+        actualizar_ventas(ventas_anteriores, lineas_venta(pedido))
+        
         # Actualizar factura automáticamente si existe
         try:
             factura_actual = obtener_factura_pedido(pedido)
@@ -367,9 +537,11 @@ def api_actualizar_pedido(id):
 def api_eliminar_pedido(id):
     """
     @brief API para eliminar un pedido
+    @details Las ventas del pedido se restan de ventas_diarias en la misma transacción. Al confirmarse se publica
+             pedido_eliminado y se borran los PDF guardados de su factura.
     @param id ID del pedido a eliminar
     @return JSON con resultado de la operación
-    @version 1.0
+    @version 1.4
     """
     try:
         pedido = Pedido.query.get_or_404(id)
@@ -382,15 +554,21 @@ def api_eliminar_pedido(id):
             }), 400
         
         # Restaurar stock de productos no depósito
-        for item in pedido.items:
-            if not item.producto.es_deposito:
-                item.producto.stock += item.cantidad
+        liberar_stock(agrupar_cantidades(
+            (item.producto_id, item.cantidad) for item in pedido.items if not item.producto.es_deposito
+        ))
         
         # Eliminar factura asociada si existe
         factura_actual = obtener_factura_pedido(pedido)
         if factura_actual:
+            anotar_invalidacion_pdf(factura_actual.id)
             db.session.delete(factura_actual)
         
+        # Restar las ventas del pedido del acumulado diario
+        actualizar_ventas(anteriores=lineas_venta(pedido))
+        
+        anotar_evento('pedido_eliminado', **datos_pedido(pedido))
+        
         # Eliminar pedido (los items se eliminan automáticamente por cascade)
         db.session.delete(pedido)
         db.session.commit()
@@ -407,59 +585,77 @@ def api_eliminar_pedido(id):
             'message': f'Error al eliminar pedido: {str(e)}'
         }), 500
 
+# Campos que admite fields= en el detalle de pedido: los de Pedido.to_dict() y las secciones que añade la API
+CAMPOS_DETALLE_PEDIDO = (*Pedido.SERIALIZACION, 'items', 'desglose_impuestos', 'factura')
+
 @pedidos_bp.route('/api/detalle/<int:id>')
 def api_detalle_pedido(id):
     """
     @brief API para obtener detalles completos de un pedido
+    @details Con fields=campo1,campo2 devuelve solo esos campos del pedido y las secciones items, desglose_impuestos y
+             factura que se pidan; las columnas y secciones no pedidas no se cargan.
     @param id ID del pedido
-    @return JSON con datos completos del pedido incluyendo items
-    @version 1.3
+    @return JSON con datos completos del pedido incluyendo items y desglose de impuestos
+    @version 1.5
     """
     try:
-        pedido = Pedido.query.get_or_404(id)
+        campos = leer_campos(CAMPOS_DETALLE_PEDIDO)
+        campos_pedido = None if campos is None else [campo for campo in campos if campo in Pedido.SERIALIZACION]
+        pedido = Pedido.query.options(*opciones_carga(Pedido, campos_pedido)).get_or_404(id)
         
         # Convertir pedido a diccionario con items
-        pedido_data = pedido.to_dict()
+        pedido_data = pedido.to_dict(campos_pedido)
         
         # Manejo de items
-        try:
-            if pedido.items:
-                pedido_data['items'] = []
-                for item in pedido.items:
-                    try:
-                        pedido_data['items'].append(item.to_dict())
-                    except Exception as item_error:
-                        print(f"Error al serializar item {getattr(item, 'id', 'unknown')}: {str(item_error)}")
-                        continue
-            else:
+        if campos is None or 'items' in campos:
+            try:
+                if pedido.items:
+                    pedido_data['items'] = []
+                    for item in pedido.items:
+                        try:
+                            pedido_data['items'].append(item.to_dict())
+                        except Exception as item_error:
+                            print(f"Error al serializar item {getattr(item, 'id', 'unknown')}: {str(item_error)}")
+                            continue
+                else:
+                    pedido_data['items'] = []
+            except Exception as items_error:
+                print(f"Error al acceder a items del pedido {id}: {str(items_error)}")
                 pedido_data['items'] = []
-        except Exception as items_error:
-            print(f"Error al acceder a items del pedido {id}: {str(items_error)}")
-            pedido_data['items'] = []
         
-        try:
-            factura_actual = obtener_factura_pedido(pedido)
-            if factura_actual:
-                pedido_data['factura'] = {
-                    'id': factura_actual.id,
-                    'numero_factura': factura_actual.numero_factura,
-                    'fecha_factura': factura_actual.fecha_factura.isoformat(),
-                    'total': float(factura_actual.total),
-                    'enviada_por_email': factura_actual.enviada_por_email
-                }
-                print(f"Factura {factura_actual.numero_factura} encontrada para pedido {id}")
-            else:
+        # Desglose por tipo de IVA, el mismo que muestra la factura
+        if campos is None or 'desglose_impuestos' in campos:
+            pedido_data['desglose_impuestos'] = desglosar_items(pedido.items).to_dict()
+        
+        if campos is None or 'factura' in campos:
+            try:
+                factura_actual = obtener_factura_pedido(pedido)
+                if factura_actual:
+                    pedido_data['factura'] = {
+                        'id': factura_actual.id,
+                        'numero_factura': factura_actual.numero_factura,
+                        'fecha_factura': factura_actual.fecha_factura.isoformat(),
+                        'total': float(factura_actual.total),
+                        'enviada_por_email': factura_actual.enviada_por_email
+                    }
+                    print(f"Factura {factura_actual.numero_factura} encontrada para pedido {id}")
+                else:
+                    pedido_data['factura'] = None
+                    print(f"No se encontró factura para el pedido {id}")
+            except Exception as factura_error:
+                print(f"Error al acceder a factura del pedido {id}: {str(factura_error)}")
                 pedido_data['factura'] = None
-                print(f"No se encontró factura para el pedido {id}")
-        except Exception as factura_error:
-            print(f"Error al acceder a factura del pedido {id}: {str(factura_error)}")
-            pedido_data['factura'] = None
         
         return jsonify({
             'success': True,
             'pedido': pedido_data
         })
         
+    except CamposInvalidosError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f"Error general en api_detalle_pedido: {str(e)}")
         return jsonify({
@@ -471,28 +667,41 @@ def api_detalle_pedido(id):
 def api_buscar_clientes():
     """
     @brief API para buscar clientes para pedidos
-    @details Busca clientes activos por código o nombre
+    @details Busca clientes activos por código o nombre en el índice en memoria de autocompletado_service. Si el índice
+             está desactivado busca en la base de datos con busqueda_service.
+             Con fields=campo1,campo2 devuelve solo esos campos; si el índice no los guarda se cargan de la base de datos.
+             Los resultados pasan por la caché de búsquedas.
     @return JSON con lista de clientes encontrados
-    @version 1.0
+    @version 1.4
     """
     try:
         termino = request.args.get('q', '').strip()
         limite = request.args.get('limit', 10, type=int)
+        campos = leer_campos(Cliente.SERIALIZACION)
         
         if not termino:
             return jsonify({'clientes': []})
         
-        search_filter = f"%{termino}%"
-        clientes = Cliente.query.filter(
-            Cliente.activo == True,
-            (Cliente.nombre.ilike(search_filter)) |
-            (Cliente.codigo.ilike(search_filter))
-        ).limit(limite).all()
+        # Índice en memoria; si no está disponible se busca en la base de datos
+        def buscar_clientes():
+            clientes = buscar_autocompletado('clientes', termino, limite, campos)
+            if clientes is None:
+                clientes = [
+                    cliente.to_dict(campos)
+                    for cliente in buscar(Cliente, termino, limite, opciones=opciones_carga(Cliente, campos))
+                ]
+            return clientes
+        
+        clientes = resultado_en_cache('clientes', clave_busqueda(termino, limite, campos), buscar_clientes)
         
         return jsonify({
-            'clientes': [cliente.to_dict() for cliente in clientes]
+            'clientes': clientes
         })
         
+    except CamposInvalidosError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'error': f'Error en búsqueda: {str(e)}'
@@ -502,33 +711,41 @@ def api_buscar_clientes():
 def api_buscar_productos():
     """
     @brief API para buscar productos para pedidos
-    @details Busca productos activos por código o nombre
+    @details Busca productos activos por código, nombre o código nacional en el índice en memoria de
+             autocompletado_service. Si el índice está desactivado busca en la base de datos con busqueda_service.
+             Con fields=campo1,campo2 devuelve solo esos campos; si el índice no los guarda se cargan de la base de datos.
+             Los resultados pasan por la caché de búsquedas.
     @return JSON con lista de productos encontrados
-    @version 1.2
+    @version 1.6
     """
     try:
         termino = request.args.get('q', '').strip()
         limite = request.args.get('limit', 20, type=int)
+        campos = leer_campos(Producto.SERIALIZACION)
         
         if not termino:
             return jsonify({'productos': []})
         
-        search_filter = f"%{termino}%"
-        productos = Producto.query.filter(
-            Producto.activo == True,
-            (Producto.nombre.ilike(search_filter)) |
-            (Producto.codigo.ilike(search_filter))
-        ).limit(limite).all()
+        # Índice en memoria; si no está disponible se busca en la base de datos
+        def buscar_productos():
+            productos_data = buscar_autocompletado('productos', termino, limite, campos)
+            if productos_data is None:
+                productos_data = [
+                    producto.to_dict(campos)
+                    for producto in buscar(Producto, termino, limite, opciones=opciones_carga(Producto, campos))
+                ]
+            return productos_data
         
-        productos_data = []
-        for producto in productos:
-            producto_dict = producto.to_dict()
-            productos_data.append(producto_dict)
+        productos_data = resultado_en_cache('productos', clave_busqueda(termino, limite, campos), buscar_productos)
         
         return jsonify({
             'productos': productos_data
         })
         
+    except CamposInvalidosError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f"Error en búsqueda de productos: {str(e)}")
         return jsonify({
@@ -539,9 +756,10 @@ def api_buscar_productos():
 def api_cambiar_estado_pedido(id):
     """
     @brief API para cambiar el estado de un pedido
+    @details Al confirmarse se publica el evento pedido_estado.
     @param id ID del pedido
     @return JSON con resultado de la operación
-    @version 1.0
+    @version 1.1
     """
     try:
         pedido = Pedido.query.get_or_404(id)
@@ -561,7 +779,10 @@ def api_cambiar_estado_pedido(id):
                 'message': 'Estado no válido'
             }), 400
         
+        estado_anterior = pedido.estado
         pedido.estado = nuevo_estado
+        if nuevo_estado != estado_anterior:
+            anotar_evento('pedido_estado', estado_anterior=estado_anterior, **datos_pedido(pedido))
         db.session.commit()
         
         return jsonify({
@@ -581,44 +802,70 @@ def api_cambiar_estado_pedido(id):
 def api_estadisticas_pedidos():
     """
     @brief API para obtener estadísticas de pedidos
-    @details Proporciona contadores y métricas para el home
+    @details Proporciona contadores y métricas para el home, calculados en una sola consulta por estadisticas_service
     @return JSON con estadísticas de pedidos
-    @version 1.0
+    @version 1.1
     """
     try:
-        from datetime import datetime, timedelta
-        from sqlalchemy import func
+        return jsonify(estadisticas_pedidos())
         
-        # Pedidos totales
-        total_pedidos = Pedido.query.count()
+    except Exception as e:
+        return jsonify({
+            'error': f'Error al obtener estadísticas: {str(e)}'
+        }), 500
+
+@pedidos_bp.route('/api/ventas')
+def api_ventas():
+    """
+    @brief API de ventas acumuladas
+    @details Lee ventas_diarias, no los items de pedido. Parámetros: agrupar (dia, mes, cliente, producto o iva; por
+             defecto dia), desde y hasta (YYYY-MM-DD, incluidos), cliente_id y producto_id.
+    @return JSON con un registro por grupo (unidades, base, iva, recargo y total) y los totales del periodo
+    @version 1.0
+    """
+    try:
+        agrupar = request.args.get('agrupar', 'dia')
+        if agrupar not in AGRUPACIONES_VENTAS:
+            return jsonify({
+                'success': False,
+                'message': f"Agrupación no válida, use {', '.join(AGRUPACIONES_VENTAS)}"
+            }), 400
         
-        # Pedidos por estado
-        pedidos_pendientes = Pedido.query.filter_by(estado='pendiente').count()
-        pedidos_confirmados = Pedido.query.filter_by(estado='confirmado').count()
-        pedidos_entregados = Pedido.query.filter_by(estado='entregado').count()
+        try:
+            desde = leer_fecha(request.args.get('desde', ''))
+            hasta = leer_fecha(request.args.get('hasta', ''))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Fecha no válida, use el formato YYYY-MM-DD'
+            }), 400
         
-        # Pedidos del mes actual
-        inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        pedidos_mes = Pedido.query.filter(Pedido.fecha_pedido >= inicio_mes).count()
+        ventas = resumen_ventas(
+            agrupar,
+            desde=desde,
+            hasta=hasta,
+            cliente_id=request.args.get('cliente_id', type=int),
+            producto_id=request.args.get('producto_id', type=int)
+        )
         
-        # Valor total de pedidos pendientes
-        try:
-            total_pendiente = db.session.query(func.sum(Pedido.total)).filter_by(estado='pendiente').scalar() or 0
-        except:
-            total_pendiente = 0
+        totales = {
+            campo: round(sum(venta[campo] for venta in ventas), 2)
+            for campo in ('base', 'iva', 'recargo', 'total')
+        }
+        totales['unidades'] = sum(venta['unidades'] for venta in ventas)
         
         return jsonify({
-            'total_pedidos': total_pedidos,
-            'pedidos_pendientes': pedidos_pendientes,
-            'pedidos_confirmados': pedidos_confirmados,
-            'pedidos_entregados': pedidos_entregados,
-            'pedidos_mes': pedidos_mes,
-            'valor_pendiente': float(total_pendiente)
+            'success': True,
+            'agrupar': agrupar,
+            'ventas': ventas,
+            'totales': totales
         })
         
     except Exception as e:
+        print(f"Error en api_ventas: {str(e)}")
         return jsonify({
-            'error': f'Error al obtener estadísticas: {str(e)}'
+            'success': False,
+            'message': f'Error al obtener ventas: {str(e)}'
         }), 500
 
 def obtener_factura_pedido(pedido):
@@ -659,34 +906,6 @@ def obtener_factura_pedido(pedido):
         except:
             return None
 
-def generar_numero_pedido():
-    """
-    @brief Genera un número único para el pedido
-    @details Crea un número de pedido con formato P-YYYYMMDD-XXX
-    @return str Número de pedido único
-    @version 1.0
-    """
-    from datetime import datetime
-    
-    fecha_actual = datetime.now()
-    prefijo = f"P-{fecha_actual.strftime('%Y%m%d')}"
-    
-    # Buscar el último pedido del día
-    ultimo_pedido = Pedido.query.filter(
-        Pedido.numero_pedido.like(f"{prefijo}%")
-    ).order_by(Pedido.numero_pedido.desc()).first()
-    
-    if ultimo_pedido:
-        try:
-            ultimo_numero = int(ultimo_pedido.numero_pedido.split('-')[-1])
-            nuevo_numero = ultimo_numero + 1
-        except:
-            nuevo_numero = 1
-    else:
-        nuevo_numero = 1
-    
-    return f"{prefijo}-{nuevo_numero:03d}"
-
 def generar_factura_automatica(pedido):
     """
     @brief Genera automáticamente una factura para un pedido
@@ -725,52 +944,16 @@ def generar_factura_automatica(pedido):
 def actualizar_factura_automatica(pedido):
     """
     @brief Actualiza automáticamente la factura cuando se modifica un pedido
+    @details Si el total cambia, los PDF guardados de la factura se borran al confirmar la transacción.
     @param pedido Objeto Pedido modificado
     @return Factura Objeto factura actualizado
-    @version 1.1
+    @version 1.2
     """
     factura_actual = obtener_factura_pedido(pedido)
     if not factura_actual:
         return generar_factura_automatica(pedido)
     
+    if factura_actual.total != pedido.total:
+        anotar_invalidacion_pdf(factura_actual.id)
     factura_actual.total = pedido.total
-    return factura_actual
-
-def generar_numero_factura():
-    """
-    @brief Genera un número de factura único siguiendo el formato VF/XXX/YY
-    @details Utiliza el formato: VF/[número secuencial]/[año de 2 dígitos]
-    @return String con el número de factura generado
-    @version 1.0
-    """
-    try:
-        anio_actual = datetime.utcnow().strftime('%y')
-        patron_anio = f'%/{anio_actual}'
-        ultima_factura = Factura.query.filter(
-            Factura.numero_factura.like(patron_anio)
-        ).order_by(Factura.numero_factura.desc()).first()
-        
-        if ultima_factura:
-            partes = ultima_factura.numero_factura.split('/')
-            if len(partes) == 3:
-                try:
-                    ultimo_numero = int(partes[1])
-                    siguiente_numero = ultimo_numero + 1
-                except ValueError:
-                    siguiente_numero = 1
-            else:
-                siguiente_numero = 1
-        else:
-            siguiente_numero = 1
-        
-        numero_factura = f"VF/{siguiente_numero:03d}/{anio_actual}"
-        
-        while Factura.query.filter_by(numero_factura=numero_factura).first():
-            siguiente_numero += 1
-            numero_factura = f"VF/{siguiente_numero:03d}/{anio_actual}"
-        
-        return numero_factura
-        
-    except Exception as e:
-        timestamp = datetime.utcnow().strftime('%y%m%d%H%M')
-        return f"VF/{timestamp}/ER"
\ No newline at end of file
+    return factura_actual
\ No newline at end of file
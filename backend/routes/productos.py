@@ -6,13 +6,21 @@
 @brief Rutas para la gestión de productos del ERP de Mega Nevada
 @details Este módulo contiene todas las rutas relacionadas con la gestión de productos: crear, listar, editar, eliminar y control de stock.
 @author José David Sánchez Fernández
-@version 1.3
+@version 1.9
 @date 2025-06-13
 @copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
 """
 
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from models.models import db, Producto
+from utils.paginacion import paginar_por_cursor, CursorInvalidoError
+from utils.helpers import es_verdadero
+from utils.campos import leer_campos, opciones_carga, CamposInvalidosError
+from services.busqueda_service import filtrar_por_texto, ordenar_por_relevancia, buscar, buscar_por_codigos
+from services.autocompletado_service import actualizar_autocompletado
+from services.estadisticas_service import estadisticas_productos, valoracion_inventario, AGRUPACIONES_INVENTARIO
+from services.cache_busqueda_service import resultado_en_cache, clave_busqueda
+from services.eventos_service import anotar_evento
 from datetime import datetime, date
 import re
 from decimal import Decimal
@@ -20,53 +28,66 @@ from decimal import Decimal
 # Crear blueprint para productos
 productos_bp = Blueprint('productos', __name__, url_prefix='/productos')
 
+def consulta_lista_productos(search='', categoria='', stock_bajo=False):
+    """
+    @brief Construye la consulta filtrada del listado de productos
+    @param search Texto a buscar en nombre, códigos, descripción, proveedor o marca
+    @param categoria Categoría del producto
+    @param stock_bajo True para mostrar solo productos con stock igual o inferior al mínimo
+    @return Query sin ordenar
+    @version 1.1
+    """
+    query = Producto.query
+    
+    # Aplicar filtro de búsqueda si existe
+    if search:
+        query = filtrar_por_texto(query, Producto, search)
+    
+    # Filtrar por categoría
+    if categoria:
+        query = query.filter(Producto.categoria.ilike(f"%{categoria}%"))
+    
+    # Filtrar productos con stock bajo
+    if stock_bajo:
+        query = query.filter(Producto.stock <= Producto.stock_minimo)
+    
+    # Mostrar productos activos e inactivos
+    # query = query.filter(Producto.activo == True)
+    
+    return query
+
 @productos_bp.route('/')
 def lista_productos():
     """
     @brief Lista todos los productos del catálogo
     @details Muestra una tabla paginada con todos los productos registrados, con opción de búsqueda y filtros por categoría y stock.
+             Con paginacion=cursor (o un cursor) se pagina por nombre e id en lugar de OFFSET y el total solo se cuenta
+             si se pide con total=1.
     @return Template HTML con la lista de productos
-    @version 1.1
+    @version 1.3
     """
     try:
         page = request.args.get('page', 1, type=int)
         search = request.args.get('search', '', type=str)
         categoria = request.args.get('categoria', '', type=str)
+        cursor = request.args.get('cursor', '', type=str)
+        por_cursor = bool(cursor) or request.args.get('paginacion') == 'cursor'
         
         # Corregir el manejo del parámetro stock_bajo
-        stock_bajo_param = request.args.get('stock_bajo', '').lower()
-        stock_bajo = stock_bajo_param in ['true', '1', 'on', 'yes']
-        
-        query = Producto.query
-        
-        # Aplicar filtro de búsqueda si existe
-        if search:
-            search_filter = f"%{search}%"
-            query = query.filter(
-                (Producto.nombre.ilike(search_filter)) |
-                (Producto.codigo.ilike(search_filter)) |
-                (Producto.descripcion.ilike(search_filter)) |
-                (Producto.codigo_nacional.ilike(search_filter)) |
-                (Producto.num_referencia.ilike(search_filter)) |
-                (Producto.nombre_proveedor.ilike(search_filter)) |
-                (Producto.marca.ilike(search_filter))
-            )
-        
-        # Filtrar por categoría
-        if categoria:
-            query = query.filter(Producto.categoria.ilike(f"%{categoria}%"))
+        stock_bajo = es_verdadero(request.args.get('stock_bajo'))
         
-        # Filtrar productos con stock bajo
-        if stock_bajo:
-            query = query.filter(Producto.stock <= Producto.stock_minimo)
+        query = consulta_lista_productos(search, categoria, stock_bajo)
         
-        # Mostrar productos activos e inactivos
-        # query = query.filter(Producto.activo == True)
-        
-        # Paginación
-        productos = query.order_by(Producto.nombre).paginate(
-            page=page, per_page=12, error_out=False
-        )
+        if por_cursor:
+            productos = paginar_por_cursor(
+                query, [Producto.nombre, Producto.id],
+                cursor=cursor or None, per_page=12, con_total=es_verdadero(request.args.get('total'))
+            )
+        else:
+            # Paginación, con los resultados más parecidos a la búsqueda primero
+            productos = ordenar_por_relevancia(query, Producto, search, Producto.nombre, Producto.id).paginate(
+                page=page, per_page=12, error_out=False
+            )
         
         # Obtener categorías para el filtro (solo de productos activos)
         try:
@@ -90,6 +111,47 @@ def lista_productos():
         flash(f'Error al cargar productos: {str(e)}', 'danger')
         return redirect(url_for('index'))
 
+@productos_bp.route('/api/listado')
+def api_listado_productos():
+    """
+    @brief API de listado de productos paginado por cursor
+    @details Acepta los mismos filtros que el listado HTML (search, categoria, stock_bajo) más cursor, limit (máximo 100)
+             y total=1 para incluir el número total de productos.
+    @return JSON con los productos de la página y los cursores siguiente y anterior
+    @version 1.0
+    """
+    try:
+        query = consulta_lista_productos(
+            request.args.get('search', '', type=str),
+            request.args.get('categoria', '', type=str),
+            es_verdadero(request.args.get('stock_bajo'))
+        )
+        pagina = paginar_por_cursor(
+            query, [Producto.nombre, Producto.id],
+            cursor=request.args.get('cursor') or None,
+            per_page=min(max(request.args.get('limit', 12, type=int), 1), 100),
+            con_total=es_verdadero(request.args.get('total'))
+        )
+        
+        return jsonify({
+            'success': True,
+            'productos': [producto.to_dict() for producto in pagina.items],
+            'next_cursor': pagina.next_cursor,
+            'prev_cursor': pagina.prev_cursor,
+            'total': pagina.total
+        })
+        
+    except CursorInvalidoError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Error al obtener productos: {str(e)}'
+        }), 500
+
 @productos_bp.route('/nuevo')
 def nuevo_producto():
     """
@@ -126,18 +188,25 @@ def detalle_producto(id):
 def api_detalle_producto(id):
     """
     @brief API para obtener detalles de un producto incluyendo todos los campos
+    @details Con fields=campo1,campo2 devuelve y carga solo esos campos.
     @param id ID del producto
     @return JSON con datos completos del producto
-    @version 1.1
+    @version 1.2
     """
     try:
-        producto = Producto.query.get_or_404(id)
+        campos = leer_campos(Producto.SERIALIZACION)
+        producto = Producto.query.options(*opciones_carga(Producto, campos)).get_or_404(id)
         
         return jsonify({
             'success': True,
-            'producto': producto.to_dict()
+            'producto': producto.to_dict(campos)
         })
         
+    except CamposInvalidosError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -150,7 +219,7 @@ def api_crear_producto():
     @brief API para crear un nuevo producto
     @details Procesa los datos del formulario y crea un producto en la base de datos
     @return JSON con resultado de la operación
-    @version 1.2
+    @version 1.4
     """
     try:
         data = request.get_json()
@@ -171,6 +240,14 @@ def api_crear_producto():
                 'message': 'Ya existe un producto con ese código'
             }), 400
         
+        # Verificar que el código nacional, si se indica, no exista
+        codigo_nacional = (data.get('codigo_nacional') or '').strip() or None
+        if codigo_nacional and Producto.query.filter_by(codigo_nacional=codigo_nacional).first():
+            return jsonify({
+                'success': False,
+                'message': 'Ya existe un producto con ese código nacional'
+            }), 400
+        
         # Validar precio
         try:
             precio = Decimal(str(data['precio']))
@@ -254,7 +331,7 @@ def api_crear_producto():
             fecha_caducidad=fecha_caducidad,
             categoria=data.get('categoria', '').strip(),
             imagen_url=data.get('imagen_url', '').strip(),
-            codigo_nacional=data.get('codigo_nacional', '').strip(),
+            codigo_nacional=codigo_nacional,
             num_referencia=data.get('num_referencia', '').strip(),
             nombre_proveedor=data.get('nombre_proveedor', '').strip(),
             marca=data.get('marca', '').strip(),
@@ -266,6 +343,7 @@ def api_crear_producto():
         
         db.session.add(producto)
         db.session.commit()
+        actualizar_autocompletado(producto)
         
         print("Producto guardado en base de datos")
         
@@ -287,9 +365,10 @@ def api_crear_producto():
 def api_actualizar_producto(id):
     """
     @brief API para actualizar un producto existente
+    @details Si el stock queda en el mínimo o por debajo se publica el evento stock_bajo al confirmar.
     @param id ID del producto a actualizar
     @return JSON con resultado de la operación
-    @version 1.2
+    @version 1.5
     """
     try:
         producto = Producto.query.get_or_404(id)
@@ -314,6 +393,17 @@ def api_actualizar_producto(id):
                 'message': 'Ya existe otro producto con ese código'
             }), 400
         
+        # Verificar código nacional único (excepto el actual)
+        codigo_nacional = (data.get('codigo_nacional') or '').strip() or None
+        if codigo_nacional and Producto.query.filter(
+            Producto.codigo_nacional == codigo_nacional,
+            Producto.id != id
+        ).first():
+            return jsonify({
+                'success': False,
+                'message': 'Ya existe otro producto con ese código nacional'
+            }), 400
+        
         # Validar precio
         try:
             precio = Decimal(str(data['precio']))
@@ -380,6 +470,9 @@ def api_actualizar_producto(id):
                     'message': 'Formato de fecha de caducidad inválido'
                 }), 400
         
+        # Un producto que pasa a estar en su stock mínimo o por debajo genera el evento stock_bajo
+        estaba_sobre_minimo = (producto.stock or 0) > (producto.stock_minimo or 0)
+        
         # Actualizar datos básicos
         producto.codigo = data['codigo'].strip().upper()
         producto.nombre = data['nombre'].strip()
@@ -394,7 +487,7 @@ def api_actualizar_producto(id):
         producto.activo = data.get('activo', True)
         
         # Actualizar campos de identificación
-        producto.codigo_nacional = data.get('codigo_nacional', '').strip()
+        producto.codigo_nacional = codigo_nacional
         producto.num_referencia = data.get('num_referencia', '').strip()
         producto.nombre_proveedor = data.get('nombre_proveedor', '').strip()
         producto.marca = data.get('marca', '').strip()
@@ -403,7 +496,12 @@ def api_actualizar_producto(id):
         producto.iva_porcentaje = iva_porcentaje
         producto.recargo_equivalencia = recargo_equivalencia
         
+        if estaba_sobre_minimo and producto.activo and stock <= stock_minimo:
+            anotar_evento('stock_bajo', id=producto.id, codigo=producto.codigo, nombre=producto.nombre,
+                          stock=stock, stock_minimo=stock_minimo)
+        
         db.session.commit()
+        actualizar_autocompletado(producto)
         
         return jsonify({
             'success': True,
@@ -424,7 +522,7 @@ def api_eliminar_producto(id):
     @brief API para eliminar (desactivar) un producto
     @param id ID del producto a eliminar
     @return JSON con resultado de la operación
-    @version 1.0
+    @version 1.1
     """
     try:
         producto = Producto.query.get_or_404(id)
@@ -432,6 +530,7 @@ def api_eliminar_producto(id):
         # No eliminar físicamente, solo desactivar
         producto.activo = False
         db.session.commit()
+        actualizar_autocompletado(producto)
         
         return jsonify({
             'success': True,
@@ -449,56 +548,164 @@ def api_eliminar_producto(id):
 def api_buscar_productos():
     """
     @brief API para buscar productos
-    @details Busca productos por código, nombre, descripción y nuevos campos
+    @details Busca productos activos por código, nombre, descripción y nuevos campos, los más parecidos primero.
+             Con fields=campo1,campo2 devuelve y carga solo esos campos. Los resultados pasan por la caché de búsquedas.
     @return JSON con lista de productos encontrados
-    @version 1.1
+    @version 1.4
     """
     try:
         termino = request.args.get('q', '').strip()
         limite = request.args.get('limit', 10, type=int)
+        campos = leer_campos(Producto.SERIALIZACION)
         
         if not termino:
             return jsonify({'productos': []})
         
-        search_filter = f"%{termino}%"
-        productos = Producto.query.filter(
-            Producto.activo == True,
-            (Producto.nombre.ilike(search_filter)) |
-            (Producto.codigo.ilike(search_filter)) |
-            (Producto.descripcion.ilike(search_filter)) |
-            (Producto.codigo_nacional.ilike(search_filter)) |
-            (Producto.num_referencia.ilike(search_filter)) |
-            (Producto.nombre_proveedor.ilike(search_filter)) |
-            (Producto.marca.ilike(search_filter))
-        ).limit(limite).all()
+        productos_data = resultado_en_cache('productos', clave_busqueda(termino, limite, campos), lambda: [
+            producto.to_dict(campos)
+            for producto in buscar(Producto, termino, limite, opciones=opciones_carga(Producto, campos))
+        ])
         
         return jsonify({
-            'productos': [producto.to_dict() for producto in productos]
+            'productos': productos_data
         })
         
+    except CamposInvalidosError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'error': f'Error en búsqueda: {str(e)}'
         }), 500
 
+# Lecturas máximas por petición de la consulta por lotes del escáner
+MAX_CODIGOS_ESCANEO = 500
+
+@productos_bp.route('/api/codigo/<path:codigo>')
+def api_producto_por_codigo(codigo):
+    """
+    @brief API de lectura del escáner: producto activo con ese código nacional o código interno
+    @details Búsqueda exacta por los índices únicos, sin pasar por la búsqueda de texto. Acepta también el EAN-13 de
+             medicamento, del que se extrae el código nacional. Con fields=campo1,campo2 devuelve y carga solo esos campos.
+    @param codigo Código leído
+    @return JSON con el producto, o 404 si no hay ninguno
+    @version 1.0
+    """
+    try:
+        campos = leer_campos(Producto.SERIALIZACION)
+        encontrados, desconocidos = buscar_por_codigos(
+            [codigo], opciones_carga(Producto, campos, 'codigo', 'codigo_nacional')
+        )
+        
+        if not encontrados:
+            return jsonify({
+                'success': False,
+                'message': f'No hay ningún producto activo con el código {codigo.strip()}'
+            }), 404
+        
+        producto = next(iter(encontrados.values()))
+        return jsonify({
+            'success': True,
+            'producto': producto.to_dict(campos)
+        })
+        
+    except CamposInvalidosError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Error al buscar el código: {str(e)}'
+        }), 500
+
+@productos_bp.route('/api/codigos', methods=['POST'])
+def api_productos_por_codigos():
+    """
+    @brief API de lectura del escáner por lotes
+    @details Recibe {"codigos": [...]} con todas las lecturas de una sesión de escaneo y las resuelve en una sola
+             consulta. Las lecturas repetidas se agrupan y su número se devuelve como cantidad. Con fields=campo1,campo2
+             devuelve y carga solo esos campos de cada producto.
+    @return JSON con los productos encontrados (código leído, cantidad y producto) y los códigos desconocidos
+    @version 1.0
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        codigos = data.get('codigos')
+        
+        if not isinstance(codigos, list) or not all(isinstance(codigo, (str, int)) for codigo in codigos):
+            return jsonify({
+                'success': False,
+                'message': 'Se esperaba una lista de códigos en "codigos"'
+            }), 400
+        
+        if len(codigos) > MAX_CODIGOS_ESCANEO:
+            return jsonify({
+                'success': False,
+                'message': f'Como máximo {MAX_CODIGOS_ESCANEO} códigos por petición'
+            }), 400
+        
+        campos = leer_campos(Producto.SERIALIZACION)
+        lecturas = [str(codigo).strip() for codigo in codigos if str(codigo).strip()]
+        encontrados, desconocidos = buscar_por_codigos(
+            lecturas, opciones_carga(Producto, campos, 'codigo', 'codigo_nacional')
+        )
+        
+        cantidades = {}
+        for lectura in lecturas:
+            cantidades[lectura] = cantidades.get(lectura, 0) + 1
+        
+        return jsonify({
+            'success': True,
+            'productos': [
+                {
+                    'codigo': lectura,
+                    'cantidad': cantidades[lectura],
+                    'producto': producto.to_dict(campos)
+                }
+                for lectura, producto in encontrados.items()
+            ],
+            'desconocidos': desconocidos,
+            'total_lecturas': len(lecturas)
+        })
+        
+    except CamposInvalidosError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Error al buscar los códigos: {str(e)}'
+        }), 500
+
 @productos_bp.route('/api/stock-bajo')
 def api_productos_stock_bajo():
     """
     @brief API para obtener productos con stock bajo
+    @details Con fields=campo1,campo2 devuelve y carga solo esos campos.
     @return JSON con lista de productos con stock bajo o agotado
-    @version 1.0
+    @version 1.1
     """
     try:
-        productos_stock_bajo = Producto.query.filter(
+        campos = leer_campos(Producto.SERIALIZACION)
+        productos_stock_bajo = Producto.query.options(*opciones_carga(Producto, campos)).filter(
             Producto.activo == True,
             Producto.stock <= Producto.stock_minimo
         ).order_by(Producto.stock.asc()).all()
         
         return jsonify({
-            'productos': [producto.to_dict() for producto in productos_stock_bajo],
+            'productos': [producto.to_dict(campos) for producto in productos_stock_bajo],
             'total': len(productos_stock_bajo)
         })
         
+    except CamposInvalidosError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'error': f'Error al obtener productos con stock bajo: {str(e)}'
@@ -508,45 +715,46 @@ def api_productos_stock_bajo():
 def api_estadisticas_productos():
     """
     @brief API para obtener estadísticas de productos
-    @details Proporciona contadores y métricas para el home
+    @details Proporciona contadores y métricas para el home, calculados en una sola consulta por estadisticas_service
+             (el valor del inventario se suma en la base de datos sin cargar los productos)
     @return JSON con estadísticas de productos
-    @version 1.0
+    @version 1.1
     """
     try:
-        # Contar productos totales
-        total_productos = Producto.query.filter_by(activo=True).count()
-        
-        # Productos con stock bajo
-        productos_stock_bajo = Producto.query.filter(
-            Producto.activo == True,
-            Producto.stock <= Producto.stock_minimo
-        ).count()
+        return jsonify(estadisticas_productos())
         
-        # Productos agotados
-        productos_agotados = Producto.query.filter(
-            Producto.activo == True,
-            Producto.stock == 0
-        ).count()
-        
-        # Valor total del inventario
-        try:
-            productos_con_stock = Producto.query.filter(
-                Producto.activo == True,
-                Producto.stock > 0
-            ).all()
-            
-            valor_inventario = sum(float(p.precio) * p.stock for p in productos_con_stock)
-        except:
-            valor_inventario = 0
+    except Exception as e:
+        return jsonify({
+            'error': f'Error al obtener estadísticas: {str(e)}'
+        }), 500
+
+@productos_bp.route('/api/valoracion-inventario')
+def api_valoracion_inventario():
+    """
+    @brief API de valoración del inventario
+    @details Valor del stock de los productos activos a PVF sin IVA y con IVA, agregado en la base de datos. Con
+             agrupar=categoria, marca o nombre_proveedor incluye el desglose por grupo. Los importes se devuelven como
+             cadenas decimales exactas ("1234.56").
+    @return JSON con los totales y, si se pide, los grupos
+    @version 1.0
+    """
+    try:
+        agrupar = request.args.get('agrupar', '').strip() or None
+        if agrupar is not None and agrupar not in AGRUPACIONES_INVENTARIO:
+            return jsonify({
+                'success': False,
+                'message': f"Agrupación no válida, use {', '.join(AGRUPACIONES_INVENTARIO)}"
+            }), 400
         
         return jsonify({
-            'total_productos': total_productos,
-            'productos_stock_bajo': productos_stock_bajo,
-            'productos_agotados': productos_agotados,
-            'valor_inventario': round(valor_inventario, 2)
+            'success': True,
+            'agrupar': agrupar,
+            **valoracion_inventario(agrupar)
         })
         
     except Exception as e:
+        print(f"Error en api_valoracion_inventario: {str(e)}")
         return jsonify({
-            'error': f'Error al obtener estadísticas: {str(e)}'
-        }), 500
\ No newline at end of file
+            'success': False,
+            'message': f'Error al valorar el inventario: {str(e)}'
+        }), 500
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file autocompletado_service.py
+@brief Índice en memoria para los buscadores de productos y clientes del formulario de pedidos
+@details Los buscadores del formulario de pedidos consultan en cada pulsación. Este módulo mantiene en memoria, por
+         proceso, un índice de n-gramas de los productos activos (código, nombre y código nacional) y de los clientes
+         activos (código y nombre), junto con los datos que muestra el buscador, de modo que la respuesta no toca la
+         base de datos. El índice se construye al arrancar la aplicación, se actualiza desde las altas, modificaciones y
+         bajas de productos y clientes, aplica las variaciones de stock de cada transacción al confirmarse y se vuelve a
+         cargar entero en segundo plano cada AUTOCOMPLETADO_RECARGA_SEGUNDOS para recoger los cambios de otros procesos.
+         Los cambios que llegan mientras se recarga se aplican también al índice nuevo antes de sustituir al anterior.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import bisect
+import heapq
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models.models import db, Cliente, Producto
+from services.stock_service import CLAVE_DELTAS_SESION
+from utils.helpers import normalizar_busqueda
+from utils.campos import recortar
+
+# Longitud de los n-gramas; las palabras más cortas se buscan como prefijo
+LONGITUD_NGRAMA = 3
+
+def ngramas(palabra):
+    """
+    @brief N-gramas de una palabra
+    @param palabra Palabra normalizada
+    @return set N-gramas de LONGITUD_NGRAMA caracteres
+    @version 1.0
+    """
+    return {palabra[i:i + LONGITUD_NGRAMA] for i in range(len(palabra) - LONGITUD_NGRAMA + 1)}
+
+def datos_producto(producto):
+    """
+    @brief Datos de un producto que necesita el buscador del formulario de pedidos
+    @version 1.0
+    """
+    return {
+        'id': producto.id,
+        'codigo': producto.codigo,
+        'nombre': producto.nombre,
+        'descripcion': (producto.descripcion or '')[:100] or None,
+        'codigo_nacional': producto.codigo_nacional,
+        'pvf_sin_iva': float(producto.pvf_sin_iva) if producto.pvf_sin_iva else 0,
+        'iva_porcentaje': float(producto.iva_porcentaje) if producto.iva_porcentaje else 21.0,
+        'recargo_equivalencia_calculado': float(producto.recargo_equivalencia_calculado),
+        'stock': producto.stock,
+        'stock_minimo': producto.stock_minimo,
+        'es_deposito': producto.es_deposito
+    }
+
+def datos_cliente(cliente):
+    """
+    @brief Datos de un cliente que necesita el buscador del formulario de pedidos
+    @version 1.0
+    """
+    return {
+        'id': cliente.id,
+        'codigo': cliente.codigo,
+        'nombre': cliente.nombre,
+        'direccion': cliente.direccion
+    }
+
+class IndiceAutocompletado:
+    """
+    @brief Índice de n-gramas en memoria de los registros activos de un modelo
+    @details Cada palabra se indexa por sus n-gramas (para buscar subcadenas) y por sus prefijos de hasta
+             LONGITUD_NGRAMA - 1 caracteres (para las búsquedas cortas). Además se guarda la lista de registros ordenada
+             por nombre, que permite devolver los primeros resultados sin ordenar todos los candidatos de una búsqueda
+             amplia, y los códigos exactos. Las lecturas y escrituras se serializan con un cerrojo; la recarga completa se
+             construye aparte y se intercambia de golpe. Mientras se construye, las escrituras se anotan en pendientes
+             y se repiten sobre el índice nuevo justo antes del intercambio, para no perderlas.
+    @version 1.1
+    """
+
+    def __init__(self, modelo, campos, campos_codigo, datos):
+        """
+        @param modelo Clase del modelo (Producto o Cliente)
+        @param campos Campos que se indexan
+        @param campos_codigo Campos cuya coincidencia exacta pone el registro el primero
+        @param datos Función registro -> diccionario devuelto al buscador
+        """
+        self.modelo = modelo
+        self.campos = campos
+        self.campos_codigo = campos_codigo
+        self.datos = datos
+        self.cerrojo = threading.RLock()
+        self.entradas = {}
+        self.por_ngrama = {}
+        self.por_prefijo = {}
+        self.por_codigo = {}
+        self.por_nombre = []
+        self.cargado_en = None
+        self.recargando = False
+        self.pendientes = None
+
+    def leer(self, registro):
+        """
+        @brief Lo que el índice guarda de un registro, independiente de la sesión de base de datos
+        @param registro Instancia del modelo
+        @return tuple (id, activo, texto, códigos, nombre, datos)
+        @version 1.0
+        """
+        texto = normalizar_busqueda(*(getattr(registro, campo) for campo in self.campos))
+        codigos = {normalizar_busqueda(getattr(registro, campo)) for campo in self.campos_codigo} - {''}
+        return (registro.id, registro.activo, texto, codigos, normalizar_busqueda(registro.nombre), self.datos(registro))
+
+    def poner(self, lectura, ordenado=True):
+        """
+        @brief Añade un registro al índice (sin cerrojo)
+        @param lectura Resultado de leer()
+        @param ordenado False para añadirlo al final de por_nombre y ordenar después (carga completa)
+        @version 1.1
+        """
+        registro_id, _, texto, codigos, nombre, datos = lectura
+        self.entradas[registro_id] = (texto, codigos, nombre, datos)
+        if ordenado:
+            bisect.insort(self.por_nombre, (nombre, registro_id))
+        else:
+            self.por_nombre.append((nombre, registro_id))
+        for codigo in codigos:
+            self.por_codigo.setdefault(codigo, set()).add(registro_id)
+
+        for palabra in set(texto.split()):
+            for longitud in range(1, min(len(palabra), LONGITUD_NGRAMA - 1) + 1):
+                self.por_prefijo.setdefault(palabra[:longitud], set()).add(registro_id)
+            for ngrama in ngramas(palabra):
+                self.por_ngrama.setdefault(ngrama, set()).add(registro_id)
+
+    def quitar(self, registro_id):
+        """
+        @brief Quita un registro del índice (sin cerrojo)
+        @version 1.0
+        """
+        entrada = self.entradas.pop(registro_id, None)
+        if entrada is None:
+            return
+
+        texto, codigos, nombre, _ = entrada
+        posicion = bisect.bisect_left(self.por_nombre, (nombre, registro_id))
+        if posicion < len(self.por_nombre) and self.por_nombre[posicion] == (nombre, registro_id):
+            del self.por_nombre[posicion]
+        for codigo in codigos:
+            ids = self.por_codigo.get(codigo)
+            if ids is not None:
+                ids.discard(registro_id)
+                if not ids:
+                    del self.por_codigo[codigo]
+
+        for palabra in set(texto.split()):
+            claves = [(self.por_prefijo, palabra[:longitud])
+                      for longitud in range(1, min(len(palabra), LONGITUD_NGRAMA - 1) + 1)]
+            claves += [(self.por_ngrama, ngrama) for ngrama in ngramas(palabra)]
+            for mapa, clave in claves:
+                ids = mapa.get(clave)
+                if ids is not None:
+                    ids.discard(registro_id)
+                    if not ids:
+                        del mapa[clave]
+
+    def cambiar(self, lectura):
+        """
+        @brief Sustituye lo guardado de un registro (sin cerrojo); los inactivos solo se quitan
+        @param lectura Resultado de leer()
+        @version 1.0
+        """
+        self.quitar(lectura[0])
+        if lectura[1]:
+            # Copia de los datos: la misma lectura se repite sobre el índice de la recarga, y el stock de cada uno se
+            # descuenta por separado
+            self.poner(lectura[:5] + (dict(lectura[5]),))
+
+    def descontar(self, deltas):
+        """
+        @brief Descuenta variaciones de stock de los datos guardados (sin cerrojo)
+        @param deltas dict producto_id -> unidades descontadas (negativo si se devolvieron)
+        @version 1.0
+        """
+        for producto_id, delta in deltas.items():
+            entrada = self.entradas.get(producto_id)
+            if entrada is not None and entrada[3].get('stock') is not None:
+                entrada[3]['stock'] -= delta
+
+    def escribir(self, operacion, argumento):
+        """
+        @brief Aplica una escritura al índice y, si se está recargando, la anota para repetirla en el nuevo
+        @param operacion Nombre del método que escribe ('cambiar' o 'descontar')
+        @param argumento Argumento del método
+        @version 1.0
+        """
+        with self.cerrojo:
+            getattr(self, operacion)(argumento)
+            if self.pendientes is not None:
+                self.pendientes.append((operacion, argumento))
+
+    def actualizar(self, registro):
+        """
+        @brief Refleja en el índice el estado actual de un registro
+        @details Los registros inactivos se quitan del índice.
+        @param registro Instancia del modelo ya guardada
+        @version 1.1
+        """
+        self.escribir('cambiar', self.leer(registro))
+
+    def aplicar_deltas_stock(self, deltas):
+        """
+        @brief Descuenta del stock en memoria las variaciones confirmadas
+        @param deltas dict producto_id -> unidades descontadas (negativo si se devolvieron)
+        @version 1.1
+        """
+        self.escribir('descontar', dict(deltas))
+
+    def cargar(self):
+        """
+        @brief Construye el índice completo desde la base de datos y lo sustituye de una vez
+        @details Las escrituras anotadas desde que empieza la lectura se repiten sobre el índice nuevo dentro del
+                 cerrojo, antes del intercambio. Una escritura confirmada en la base de datos justo antes de la lectura,
+                 pero cuyo aviso llega ya empezada, se aplicaría dos veces; la ventana es de microsegundos y la siguiente
+                 recarga lo corrige.
+        @version 1.1
+        """
+        with self.cerrojo:
+            self.pendientes = []
+        try:
+            nuevo = IndiceAutocompletado(self.modelo, self.campos, self.campos_codigo, self.datos)
+            registros = self.modelo.query.filter(self.modelo.activo == True).order_by(self.modelo.id).yield_per(5000)
+            for registro in registros:
+                nuevo.poner(nuevo.leer(registro), ordenado=False)
+            nuevo.por_nombre.sort()
+
+            with self.cerrojo:
+                for operacion, argumento in self.pendientes:
+                    getattr(nuevo, operacion)(argumento)
+                self.entradas = nuevo.entradas
+                self.por_ngrama = nuevo.por_ngrama
+                self.por_prefijo = nuevo.por_prefijo
+                self.por_codigo = nuevo.por_codigo
+                self.por_nombre = nuevo.por_nombre
+                self.cargado_en = time.monotonic()
+        finally:
+            with self.cerrojo:
+                self.pendientes = None
+
+    def recargar_si_caducado(self, segundos):
+        """
+        @brief Lanza una recarga en segundo plano si el índice es más antiguo que los segundos indicados
+        @details Mientras se recarga se sigue respondiendo con el índice anterior.
+        @param segundos Antigüedad máxima del índice (0 para no recargar nunca)
+        @version 1.0
+        """
+        if not segundos or self.cargado_en is None or time.monotonic() - self.cargado_en < segundos:
+            return
+
+        with self.cerrojo:
+            if self.recargando:
+                return
+            self.recargando = True
+
+        app = current_app._get_current_object()
+
+        def recargar():
+            try:
+                with app.app_context():
+                    self.cargar()
+            except Exception as e:
+                print(f"Error al recargar el índice de autocompletado de {self.modelo.__tablename__}: {str(e)}")
+            finally:
+                self.recargando = False
+
+        threading.Thread(target=recargar, daemon=True).start()
+
+    def candidatos(self, palabra):
+        """
+        @brief IDs que pueden contener la palabra (sin cerrojo)
+        @version 1.0
+        """
+        if len(palabra) < LONGITUD_NGRAMA:
+            return self.por_prefijo.get(palabra, set())
+
+        conjuntos = sorted((self.por_ngrama.get(ngrama, set()) for ngrama in ngramas(palabra)), key=len)
+        return set.intersection(*conjuntos)
+
+    def buscar(self, texto, limite=10):
+        """
+        @brief Busca en el índice
+        @details Cada palabra debe aparecer en el registro (las de menos de LONGITUD_NGRAMA caracteres, al principio de
+                 alguna palabra). Primero van las coincidencias exactas de código, después los nombres que empiezan por
+                 lo escrito y después el resto, por nombre.
+        @param texto Texto buscado
+        @param limite Número máximo de resultados
+        @return list Diccionarios con los datos de cada registro encontrado
+        @version 1.0
+        """
+        consulta = normalizar_busqueda(texto)
+        palabras = set(consulta.split())
+        if not palabras:
+            return []
+
+        with self.cerrojo:
+            conjuntos = sorted((self.candidatos(palabra) for palabra in palabras), key=len)
+            ids = conjuntos[0].intersection(*conjuntos[1:]) if len(conjuntos) > 1 else conjuntos[0]
+            if not ids:
+                return []
+
+            largas = [palabra for palabra in palabras if len(palabra) >= LONGITUD_NGRAMA]
+            entradas = self.entradas
+            elegidos = []
+            vistos = set()
+
+            def elegir(registro_id):
+                if (registro_id in ids and registro_id not in vistos
+                        and all(palabra in entradas[registro_id][0] for palabra in largas)):
+                    elegidos.append(registro_id)
+                    vistos.add(registro_id)
+
+            # 1. Coincidencia exacta de código
+            for registro_id in sorted(self.por_codigo.get(consulta, ())):
+                elegir(registro_id)
+
+            # 2. Nombres que empiezan por lo escrito: son un tramo contiguo de la lista ordenada
+            posicion = bisect.bisect_left(self.por_nombre, (consulta,))
+            while (len(elegidos) < limite and posicion < len(self.por_nombre)
+                   and self.por_nombre[posicion][0].startswith(consulta)):
+                elegir(self.por_nombre[posicion][1])
+                posicion += 1
+
+            # 3. El resto por nombre: con muchos candidatos se recorre la lista ordenada hasta completar el límite,
+            #    con pocos se ordenan los candidatos directamente
+            faltan = limite - len(elegidos)
+            if faltan > 0 and len(ids) ** 2 > limite * len(self.por_nombre):
+                for _, registro_id in self.por_nombre:
+                    elegir(registro_id)
+                    if len(elegidos) >= limite:
+                        break
+            elif faltan > 0:
+                restantes = (registro_id for registro_id in ids if registro_id not in vistos
+                             and all(palabra in entradas[registro_id][0] for palabra in largas))
+                elegidos += heapq.nsmallest(faltan, restantes, key=lambda registro_id: (entradas[registro_id][2], registro_id))
+
+            return [entradas[registro_id][3] for registro_id in elegidos[:limite]]
+
+def obtener_indice(nombre):
+    """
+    @brief Índice de autocompletado de la aplicación actual
+    @param nombre 'productos' o 'clientes'
+    @return IndiceAutocompletado o None si el autocompletado en memoria está desactivado
+    @version 1.0
+    """
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('autocompletado', {}).get(nombre)
+
+def buscar_autocompletado(nombre, texto, limite=10, campos=None):
+    """
+    @brief Busca en el índice en memoria
+    @param nombre 'productos' o 'clientes'
+    @param texto Texto buscado
+    @param limite Número máximo de resultados
+    @param campos Campos a devolver (None para todos los que guarda el índice)
+    @return list Resultados, o None si el índice no está disponible o no guarda alguno de los campos pedidos y hay que
+            buscar en la base de datos
+    @version 1.1
+    """
+    indice = obtener_indice(nombre)
+    if indice is None or indice.cargado_en is None:
+        return None
+
+    indice.recargar_si_caducado(current_app.config.get('AUTOCOMPLETADO_RECARGA_SEGUNDOS', 0))
+    resultados = indice.buscar(texto, limite)
+    if campos is None:
+        return resultados
+    if resultados and not set(campos) <= resultados[0].keys():
+        return None
+    return [recortar(resultado, campos) for resultado in resultados]
+
+def actualizar_autocompletado(registro):
+    """
+    @brief Refleja en el índice un producto o cliente recién guardado
+    @details Se llama desde los blueprints de productos y clientes después del commit.
+    @param registro Producto o Cliente
+    @version 1.0
+    """
+    indice = obtener_indice('productos' if isinstance(registro, Producto) else 'clientes')
+    if indice is not None:
+        indice.actualizar(registro)
+
+def confirmar_deltas_stock(sesion):
+    """
+    @brief Aplica al índice de productos las variaciones de stock de la transacción confirmada
+    @version 1.0
+    """
+    deltas = sesion.info.pop(CLAVE_DELTAS_SESION, None)
+    indice = obtener_indice('productos') if deltas else None
+    if indice is not None:
+        indice.aplicar_deltas_stock(deltas)
+
+def descartar_deltas_stock(sesion):
+    """
+    @brief Olvida las variaciones de stock de una transacción deshecha
+    @version 1.0
+    """
+    sesion.info.pop(CLAVE_DELTAS_SESION, None)
+
+def iniciar_autocompletado(app):
+    """
+    @brief Construye los índices de autocompletado al arrancar la aplicación
+    @details No hace nada si AUTOCOMPLETADO_EN_MEMORIA está desactivado; en ese caso los buscadores consultan la base de
+             datos con busqueda_service.
+    @param app Instancia de Flask
+    @version 1.0
+    """
+    if not app.config.get('AUTOCOMPLETADO_EN_MEMORIA'):
+        return
+
+    indices = {
+        'productos': IndiceAutocompletado(Producto, ('codigo', 'nombre', 'codigo_nacional'),
+                                          ('codigo', 'codigo_nacional'), datos_producto),
+        'clientes': IndiceAutocompletado(Cliente, ('codigo', 'nombre'), ('codigo',), datos_cliente)
+    }
+    app.extensions['autocompletado'] = indices
+
+    if not event.contains(Session, 'after_commit', confirmar_deltas_stock):
+        event.listen(Session, 'after_commit', confirmar_deltas_stock)
+        event.listen(Session, 'after_rollback', descartar_deltas_stock)
+
+    with app.app_context():
+        try:
+            for nombre, indice in indices.items():
+                indice.cargar()
+                print(f"Índice de autocompletado de {nombre} cargado: {len(indice.entradas)} registros")
+        except Exception as e:
+            print(f"Error al cargar los índices de autocompletado: {str(e)}")
+        finally:
+            db.session.remove()
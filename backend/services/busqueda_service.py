@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file busqueda_service.py
+@brief Búsqueda de texto de productos y clientes del ERP de Mega Nevada
+@details Todas las búsquedas por texto de productos y clientes pasan por este módulo. En lugar de un ILIKE '%término%' por
+         cada campo, se busca en la columna texto_busqueda, que guarda los campos buscables ya normalizados, con un LIKE
+         por palabra. En PostgreSQL esa columna tiene un índice GIN de trigramas (pg_trgm), de modo que la búsqueda por
+         subcadena no recorre la tabla, y los resultados se ordenan por similitud con lo escrito. Las claves se guardan
+         sin tildes (normalizar_busqueda) y lo escrito se normaliza igual, así que no distinguir tildes no añade coste.
+         La búsqueda global (clientes, productos, pedidos y facturas a la vez) usa en cambio la columna busqueda_tsv de
+         texto completo con la configuración 'spanish' y resuelve los cuatro tipos en una sola consulta.
+         Con términos muy frecuentes ('normon', 'ibu') decenas de miles de filas coinciden, y calcular la similitud de
+         todas para quedarse con diez costaba cientos de milisegundos (comando flask medir-busqueda). Por eso buscar(),
+         cuando hay más de CANDIDATOS_BUSQUEDA coincidencias, toma las más parecidas con el índice GiST de trigramas
+         (orden por distancia <<->, que es 1 - word_similarity) y ordena solo esas. El índice GiST es sobre
+         lower(texto_busqueda), que es la misma columna (ya está en minúsculas): así el planificador no lo usa para los
+         LIKE, que resuelve mucho mejor el GIN. Las coincidencias exactas de código o nombre van siempre las primeras.
+@author José David Sánchez Fernández
+@version 1.3
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import re
+from sqlalchemy import func, literal, select, union, union_all, cast, Float, and_, or_, true, case
+from models.models import db, Cliente, Producto, Pedido, Factura
+from utils.helpers import normalizar_busqueda
+
+# Coincidencias más parecidas que buscar() ordena cuando hay más que estas
+CANDIDATOS_BUSQUEDA = 200
+
+def escapar_like(texto):
+    """
+    @brief Escapa los comodines de LIKE para buscar el texto literalmente
+    @param texto Texto a escapar
+    @return str Texto con %, _ y \\ escapados
+    @version 1.0
+    """
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def es_postgresql():
+    """
+    @brief Indica si la base de datos es PostgreSQL (trigramas y texto completo disponibles)
+    @return bool True en PostgreSQL
+    @version 1.0
+    """
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+def condicion_texto(modelo, texto):
+    """
+    @brief Condición de búsqueda por texto sobre texto_busqueda
+    @details Cada palabra del texto, normalizada sin tildes, debe aparecer en texto_busqueda del modelo, en cualquier
+             campo y en cualquier orden. Al comparar claves ya normalizadas no hace falta lower() ni unaccent() en la
+             consulta y se aprovecha el índice de trigramas.
+    @param modelo Clase del modelo (Producto o Cliente)
+    @param texto Texto buscado
+    @return Expresión booleana
+    @version 1.0
+    """
+    return and_(true(), *(
+        modelo.texto_busqueda.like(f"%{escapar_like(palabra)}%", escape='\\')
+        for palabra in normalizar_busqueda(texto).split()
+    ))
+
+def filtrar_por_texto(query, modelo, texto):
+    """
+    @brief Filtra una consulta por el texto escrito por el usuario
+    @details Aplica condicion_texto(); un texto sin palabras no filtra.
+    @param query Consulta sobre el modelo
+    @param modelo Clase del modelo (Producto o Cliente)
+    @param texto Texto buscado
+    @return Query Consulta filtrada
+    @version 1.1
+    """
+    if not normalizar_busqueda(texto):
+        return query
+    return query.filter(condicion_texto(modelo, texto))
+
+def formas_exactas(texto):
+    """
+    @brief Formas en que lo escrito puede coincidir exactamente con un código o un nombre
+    @details Tal cual, en mayúsculas y con mayúscula inicial. Se comparan con igualdad, que usa los índices de codigo y
+             de (nombre, id).
+    @param texto Texto buscado
+    @return list Formas distintas del texto
+    @version 1.0
+    """
+    texto = ' '.join(texto.split())
+    return list(dict.fromkeys([texto, texto.upper(), texto.capitalize(), texto.title()]))
+
+def coincidencia_exacta(modelo, texto):
+    """
+    @brief Condición de coincidencia exacta con el código o el nombre
+    @param modelo Clase del modelo (Producto o Cliente)
+    @param texto Texto buscado
+    @return Expresión booleana
+    @version 1.0
+    """
+    formas = formas_exactas(texto)
+    return or_(modelo.codigo.in_(formas), modelo.nombre.in_(formas))
+
+def ordenar_por_relevancia(query, modelo, texto, *desempate):
+    """
+    @brief Ordena una consulta por similitud con el texto buscado
+    @details Primero las coincidencias exactas de código o nombre. Después, en PostgreSQL, por word_similarity de
+             pg_trgm; en otras bases de datos solo por el desempate.
+    @param query Consulta sobre el modelo
+    @param modelo Clase del modelo (Producto o Cliente)
+    @param texto Texto buscado
+    @param desempate Columnas de ordenación tras la similitud (por ejemplo nombre e id)
+    @return Query Consulta ordenada
+    @version 1.1
+    """
+    normalizado = normalizar_busqueda(texto)
+    if not normalizado:
+        return query.order_by(*desempate)
+
+    exacta = case((coincidencia_exacta(modelo, texto), 0), else_=1)
+    if es_postgresql():
+        return query.order_by(exacta, func.word_similarity(normalizado, modelo.texto_busqueda).desc(), *desempate)
+    return query.order_by(exacta, *desempate)
+
+def buscar(modelo, texto, limite=10, solo_activos=True, opciones=()):
+    """
+    @brief Búsqueda rápida para autocompletado
+    @details En PostgreSQL, si hay más de CANDIDATOS_BUSQUEDA coincidencias (el índice GIN lo dice leyendo solo esas),
+             se ordenan únicamente las CANDIDATOS_BUSQUEDA más parecidas, que da el índice GiST por distancia sin
+             calcular la similitud de todas, más las coincidencias exactas de código o nombre. El orden por similitud es
+             el mismo que sin límite; solo entre empates de similitud más allá de los candidatos puede no salir el
+             primero por nombre.
+    @param modelo Clase del modelo (Producto o Cliente)
+    @param texto Texto buscado
+    @param limite Número máximo de resultados
+    @param solo_activos True para excluir los registros inactivos
+    @param opciones Opciones de carga de la consulta (por ejemplo load_only de utils.campos)
+    @return list Registros encontrados, los más parecidos primero
+    @version 1.3
+    """
+    normalizado = normalizar_busqueda(texto)
+    if not normalizado:
+        return []
+
+    query = modelo.query.options(*opciones)
+    if solo_activos:
+        query = query.filter(modelo.activo == True)
+    query = filtrar_por_texto(query, modelo, texto)
+    if es_postgresql() and query.with_entities(modelo.id).offset(CANDIDATOS_BUSQUEDA).limit(1).first():
+        cercanos = query.with_entities(modelo.id).order_by(
+            literal(normalizado).op('<<->')(func.lower(modelo.texto_busqueda))
+        ).limit(CANDIDATOS_BUSQUEDA).subquery().select()
+        exactos = query.with_entities(modelo.id).filter(coincidencia_exacta(modelo, texto)).subquery().select()
+        # Un solo IN sobre la unión: con OR de dos IN PostgreSQL recorre la tabla entera
+        query = modelo.query.options(*opciones).filter(modelo.id.in_(union(cercanos, exactos)))
+    query = ordenar_por_relevancia(query, modelo, texto, modelo.nombre, modelo.id)
+    return query.limit(limite).all()
+
+# Prefijo de los EAN-13 de medicamentos españoles: 847000 + código nacional (6 dígitos) + dígito de control
+PREFIJO_EAN_MEDICAMENTO = '847000'
+
+def variantes_codigo(escaneado):
+    """
+    @brief Códigos con los que puede corresponder una lectura del escáner
+    @details La lectura tal cual (código nacional o código interno, en mayúsculas) y, si es un EAN-13 de medicamento, el
+             código nacional que contiene.
+    @param escaneado Código leído
+    @return list Variantes, de la más a la menos exacta
+    @version 1.0
+    """
+    codigo = (escaneado or '').strip().upper()
+    variantes = [codigo] if codigo else []
+    if len(codigo) == 13 and codigo.isdigit() and codigo.startswith(PREFIJO_EAN_MEDICAMENTO):
+        variantes.append(codigo[len(PREFIJO_EAN_MEDICAMENTO):-1])
+    return variantes
+
+def buscar_por_codigos(escaneados, opciones=()):
+    """
+    @brief Resuelve una lista de lecturas del escáner con una sola consulta
+    @details Cada lectura se busca exactamente por código nacional y, si no, por código interno, entre los productos
+             activos. Usa los índices únicos de codigo_nacional y codigo.
+    @param escaneados Códigos leídos
+    @param opciones Opciones de carga de la consulta (por ejemplo load_only de utils.campos)
+    @return tuple (dict lectura -> Producto, list lecturas sin producto), en el orden de lectura y sin repetir
+    @version 1.0
+    """
+    lecturas = list(dict.fromkeys(str(codigo).strip() for codigo in escaneados if str(codigo or '').strip()))
+    buscados = {variante for codigo in lecturas for variante in variantes_codigo(codigo)}
+    if not buscados:
+        return {}, []
+
+    productos = Producto.query.options(*opciones).filter(
+        Producto.activo == True,
+        or_(Producto.codigo_nacional.in_(buscados), Producto.codigo.in_(buscados))
+    ).all()
+    por_codigo_nacional = {producto.codigo_nacional: producto for producto in productos if producto.codigo_nacional}
+    por_codigo = {producto.codigo: producto for producto in productos}
+
+    encontrados = {}
+    desconocidos = []
+    for codigo in lecturas:
+        variantes = variantes_codigo(codigo)
+        producto = next((por_codigo_nacional[v] for v in variantes if v in por_codigo_nacional), None) or \
+            next((por_codigo[v] for v in variantes if v in por_codigo), None)
+        if producto is None:
+            desconocidos.append(codigo)
+        else:
+            encontrados[codigo] = producto
+    return encontrados, desconocidos
+
+# Tipos de la búsqueda global, en el orden en que se presentan a igualdad de relevancia
+TIPOS_BUSQUEDA_GLOBAL = ('clientes', 'productos', 'pedidos', 'facturas')
+
+def consulta_texto_completo(texto):
+    """
+    @brief Convierte lo escrito por el usuario en una consulta tsquery por prefijos
+    @details Cada palabra se busca como prefijo (palabra:*) y todas deben aparecer. Se combinan las configuraciones
+             'spanish' (nombres, con raíces) y 'simple' (códigos y números de documento, sin transformar).
+    @param texto Texto buscado
+    @return Expresión tsquery o None si el texto no tiene palabras buscables
+    @version 1.0
+    """
+    palabras = re.findall(r'\w+', normalizar_busqueda(texto))
+    if not palabras:
+        return None
+    consulta = ' & '.join(f"{palabra}:*" for palabra in palabras)
+    return func.to_tsquery('spanish', consulta).op('||')(func.to_tsquery('simple', consulta))
+
+def selects_texto_completo(tsquery):
+    """
+    @brief Una consulta por tipo con columnas comunes y su relevancia
+    @param tsquery Consulta de consulta_texto_completo
+    @return dict tipo -> Select (tipo, id, titulo, subtitulo, rango)
+    @version 1.0
+    """
+    def rango(modelo):
+        return cast(func.ts_rank_cd(modelo.busqueda_tsv, tsquery), Float).label('rango')
+
+    def coincide(modelo):
+        return modelo.busqueda_tsv.op('@@')(tsquery)
+
+    return {
+        'clientes': select(
+            literal('clientes').label('tipo'), Cliente.id, Cliente.nombre.label('titulo'),
+            Cliente.codigo.label('subtitulo'), rango(Cliente)
+        ).where(coincide(Cliente)),
+        'productos': select(
+            literal('productos').label('tipo'), Producto.id, Producto.nombre.label('titulo'),
+            Producto.codigo.label('subtitulo'), rango(Producto)
+        ).where(coincide(Producto)),
+        'pedidos': select(
+            literal('pedidos').label('tipo'), Pedido.id, Pedido.numero_pedido.label('titulo'),
+            Cliente.nombre.label('subtitulo'), rango(Pedido)
+        ).join(Cliente, Pedido.cliente_id == Cliente.id).where(coincide(Pedido)),
+        'facturas': select(
+            literal('facturas').label('tipo'), Factura.id, Factura.numero_factura.label('titulo'),
+            Cliente.nombre.label('subtitulo'), rango(Factura)
+        ).join(Pedido, Factura.pedido_id == Pedido.id).join(Cliente, Pedido.cliente_id == Cliente.id).where(coincide(Factura)),
+    }
+
+def selects_subcadena(texto):
+    """
+    @brief Equivalente sin texto completo (bases de datos distintas de PostgreSQL)
+    @details Clientes y productos se buscan en texto_busqueda y pedidos y facturas por su número. El rango es 0.
+    @param texto Texto buscado
+    @return dict tipo -> Select (tipo, id, titulo, subtitulo, rango)
+    @version 1.0
+    """
+    patron = f"%{escapar_like(normalizar_busqueda(texto))}%"
+    sin_rango = literal(0.0).label('rango')
+
+    return {
+        'clientes': filtrar_por_texto(select(
+            literal('clientes').label('tipo'), Cliente.id, Cliente.nombre.label('titulo'),
+            Cliente.codigo.label('subtitulo'), sin_rango
+        ), Cliente, texto),
+        'productos': filtrar_por_texto(select(
+            literal('productos').label('tipo'), Producto.id, Producto.nombre.label('titulo'),
+            Producto.codigo.label('subtitulo'), sin_rango
+        ), Producto, texto),
+        'pedidos': select(
+            literal('pedidos').label('tipo'), Pedido.id, Pedido.numero_pedido.label('titulo'),
+            Cliente.nombre.label('subtitulo'), sin_rango
+        ).join(Cliente, Pedido.cliente_id == Cliente.id).where(func.lower(Pedido.numero_pedido).like(patron, escape='\\')),
+        'facturas': select(
+            literal('facturas').label('tipo'), Factura.id, Factura.numero_factura.label('titulo'),
+            Cliente.nombre.label('subtitulo'), sin_rango
+        ).join(Pedido, Factura.pedido_id == Pedido.id).join(Cliente, Pedido.cliente_id == Cliente.id).where(
+            func.lower(Factura.numero_factura).like(patron, escape='\\')),
+    }
+
+def busqueda_global(texto, limite=5, tipos=None):
+    """
+    @brief Busca a la vez en clientes, productos, pedidos y facturas
+    @details En PostgreSQL usa los vectores busqueda_tsv (índices GIN) y ordena por ts_rank_cd. Las consultas de cada
+             tipo, con su propio límite, se unen con UNION ALL y se resuelven en un único viaje a la base de datos.
+    @param texto Texto buscado
+    @param limite Resultados máximos por tipo
+    @param tipos Tipos a buscar (por defecto todos los de TIPOS_BUSQUEDA_GLOBAL)
+    @return list Diccionarios con tipo, id, titulo, subtitulo y rango, de más a menos relevante
+    @version 1.2
+    """
+    tipos = [tipo for tipo in TIPOS_BUSQUEDA_GLOBAL if not tipos or tipo in tipos]
+    if not tipos or not normalizar_busqueda(texto):
+        return []
+
+    if es_postgresql():
+        tsquery = consulta_texto_completo(texto)
+        if tsquery is None:
+            return []
+        consultas = selects_texto_completo(tsquery)
+    else:
+        consultas = selects_subcadena(texto)
+
+    partes = []
+    for tipo in tipos:
+        consulta = consultas[tipo]
+        columnas = consulta.selected_columns
+        partes.append(consulta.order_by(columnas.rango.desc(), columnas.titulo).limit(limite).subquery().select())
+
+    filas = db.session.execute(union_all(*partes)).all()
+    orden_tipo = {tipo: posicion for posicion, tipo in enumerate(TIPOS_BUSQUEDA_GLOBAL)}
+    filas = sorted(filas, key=lambda fila: (-fila.rango, orden_tipo[fila.tipo]))
+
+    return [
+        {
+            'tipo': fila.tipo,
+            'id': fila.id,
+            'titulo': fila.titulo,
+            'subtitulo': fila.subtitulo,
+            'rango': round(fila.rango, 4)
+        }
+        for fila in filas
+    ]
+
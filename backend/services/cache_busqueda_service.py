@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file cache_busqueda_service.py
+@brief Caché de resultados de los buscadores de productos y clientes del ERP de Mega Nevada
+@details Los mismos prefijos se buscan cientos de veces al día. Este módulo guarda, por proceso, los resultados de las APIs
+         de búsqueda en una caché LRU acotada (CACHE_BUSQUEDA_ENTRADAS) con caducidad corta (CACHE_BUSQUEDA_SEGUNDOS),
+         indexada por endpoint, término normalizado, límite y campos. Cada espacio ('productos', 'clientes') tiene un
+         contador de generación que se incrementa al confirmarse cualquier transacción que escriba en su tabla (altas,
+         modificaciones, bajas y movimientos de stock); los resultados de una generación anterior dejan de servirse.
+         Los cambios hechos por otros procesos se recogen al caducar las entradas.
+         Los mismos contadores de generación invalidan la caché del home (cache_home_service), en su espacio 'home'.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models.models import Cliente, Producto, Pedido, ItemPedido, Factura, Albaran, VentaDiaria
+from utils.helpers import normalizar_busqueda
+
+# Clave de db.session.info donde se anotan los espacios de caché afectados por la transacción en curso
+CLAVE_ESPACIOS_SESION = 'espacios_cache_busqueda'
+
+# Espacios de caché que invalidan las escrituras en cada tabla
+ESPACIOS_POR_TABLA = {
+    Producto.__tablename__: ('productos', 'home'),
+    Cliente.__tablename__: ('clientes', 'home'),
+    Pedido.__tablename__: ('home',),
+    ItemPedido.__tablename__: ('home',),
+    Factura.__tablename__: ('home',),
+    Albaran.__tablename__: ('home',),
+    VentaDiaria.__tablename__: ('home',),
+}
+
+# Claves de app.extensions de las cachés que se invalidan al confirmar una transacción
+CACHES_INVALIDABLES = ('cache_busqueda', 'cache_home')
+
+class CacheResultados:
+    """
+    @brief Caché LRU con caducidad e invalidación por generaciones
+    @details Cada entrada guarda la generación de su espacio en el momento en que empezó a calcularse; si el espacio ha
+             cambiado de generación la entrada se descarta al leerla. Lecturas y escrituras se serializan con un cerrojo.
+    @version 1.0
+    """
+
+    def __init__(self, capacidad, segundos):
+        self.capacidad = capacidad
+        self.segundos = segundos
+        self.entradas = OrderedDict()  # (espacio, clave) -> (expira, generacion, valor)
+        self.generaciones = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.caducadas = 0
+        self.expulsadas = 0
+        self.invalidaciones = 0
+        self.cerrojo = threading.Lock()
+
+    def generacion(self, espacio):
+        """
+        @brief Generación actual de un espacio
+        @param espacio Nombre del espacio
+        @return int Generación
+        @version 1.0
+        """
+        return self.generaciones.get(espacio, 0)
+
+    def obtener(self, espacio, clave):
+        """
+        @brief Busca un resultado vigente
+        @param espacio Nombre del espacio
+        @param clave Clave del resultado (hashable)
+        @return tuple (encontrado, valor)
+        @version 1.0
+        """
+        with self.cerrojo:
+            entrada = self.entradas.get((espacio, clave))
+            if entrada is not None:
+                expira, generacion, valor = entrada
+                if expira > time.monotonic() and generacion == self.generacion(espacio):
+                    self.entradas.move_to_end((espacio, clave))
+                    self.aciertos += 1
+                    return True, valor
+                del self.entradas[(espacio, clave)]
+                self.caducadas += 1
+            self.fallos += 1
+            return False, None
+
+    def guardar(self, espacio, clave, valor, generacion):
+        """
+        @brief Guarda un resultado calculado con la generación indicada
+        @details Si el espacio ha cambiado de generación mientras se calculaba, el resultado no se guarda.
+        @param espacio Nombre del espacio
+        @param clave Clave del resultado (hashable)
+        @param valor Resultado
+        @param generacion Generación leída antes de calcular el resultado
+        @version 1.0
+        """
+        with self.cerrojo:
+            if generacion != self.generacion(espacio):
+                return
+            self.entradas[(espacio, clave)] = (time.monotonic() + self.segundos, generacion, valor)
+            self.entradas.move_to_end((espacio, clave))
+            while len(self.entradas) > self.capacidad:
+                self.entradas.popitem(last=False)
+                self.expulsadas += 1
+
+    def invalidar(self, *espacios):
+        """
+        @brief Pasa los espacios indicados a una nueva generación
+        @param espacios Nombres de los espacios
+        @version 1.0
+        """
+        with self.cerrojo:
+            for espacio in espacios:
+                self.generaciones[espacio] = self.generacion(espacio) + 1
+                self.invalidaciones += 1
+
+    def estadisticas(self):
+        """
+        @brief Contadores de uso de la caché, para dimensionarla
+        @return dict Capacidad, entradas, aciertos, fallos, porcentaje de aciertos y descartes
+        @version 1.0
+        """
+        with self.cerrojo:
+            consultas = self.aciertos + self.fallos
+            return {
+                'capacidad': self.capacidad,
+                'segundos': self.segundos,
+                'entradas': len(self.entradas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'porcentaje_aciertos': round(100 * self.aciertos / consultas, 1) if consultas else 0.0,
+                'caducadas': self.caducadas,
+                'expulsadas': self.expulsadas,
+                'invalidaciones': self.invalidaciones,
+                'generaciones': dict(self.generaciones)
+            }
+
+def obtener_cache(nombre='cache_busqueda'):
+    """
+    @brief Caché de la aplicación actual
+    @param nombre Clave de app.extensions ('cache_busqueda' o 'cache_home')
+    @return CacheResultados o None si la caché está desactivada
+    @version 1.1
+    """
+    if not has_app_context():
+        return None
+    return current_app.extensions.get(nombre)
+
+def clave_busqueda(termino, limite, campos=None):
+    """
+    @brief Clave de caché de una búsqueda de la petición actual
+    @param termino Texto buscado
+    @param limite Número máximo de resultados
+    @param campos Campos pedidos con fields= (None para todos)
+    @return tuple Endpoint, término normalizado, límite y campos
+    @version 1.0
+    """
+    return (request.endpoint, normalizar_busqueda(termino), limite, tuple(campos) if campos else None)
+
+def resultado_en_cache(espacio, clave, calcular):
+    """
+    @brief Devuelve el resultado guardado o lo calcula y lo guarda
+    @param espacio 'productos' o 'clientes'
+    @param clave Clave de clave_busqueda()
+    @param calcular Función sin argumentos que calcula el resultado
+    @return Resultado (no debe modificarse, se comparte entre peticiones)
+    @version 1.0
+    """
+    cache = obtener_cache()
+    if cache is None:
+        return calcular()
+
+    encontrado, valor = cache.obtener(espacio, clave)
+    if encontrado:
+        return valor
+
+    generacion = cache.generacion(espacio)
+    valor = calcular()
+    cache.guardar(espacio, clave, valor, generacion)
+    return valor
+
+def anotar_espacio(sesion, tabla):
+    """
+    @brief Anota en la sesión los espacios de caché afectados por una escritura en la tabla indicada
+    @version 1.1
+    """
+    espacios = ESPACIOS_POR_TABLA.get(tabla)
+    if espacios:
+        sesion.info.setdefault(CLAVE_ESPACIOS_SESION, set()).update(espacios)
+
+def anotar_escrituras_flush(sesion, contexto_flush):
+    """
+    @brief Anota los espacios de los registros insertados, modificados o borrados en un flush
+    @version 1.0
+    """
+    for registro in (*sesion.new, *sesion.dirty, *sesion.deleted):
+        anotar_espacio(sesion, getattr(registro, '__tablename__', None))
+
+def anotar_escrituras_sentencia(estado):
+    """
+    @brief Anota los espacios de los UPDATE, DELETE e INSERT masivos del ORM (por ejemplo los de stock_service)
+    @version 1.0
+    """
+    if (estado.is_update or estado.is_delete or estado.is_insert) and estado.bind_mapper is not None:
+        anotar_espacio(estado.session, estado.bind_mapper.persist_selectable.name)
+
+def confirmar_invalidaciones(sesion):
+    """
+    @brief Invalida en todas las cachés los espacios escritos por la transacción confirmada
+    @version 1.1
+    """
+    espacios = sesion.info.pop(CLAVE_ESPACIOS_SESION, None)
+    if not espacios:
+        return
+    for nombre in CACHES_INVALIDABLES:
+        cache = obtener_cache(nombre)
+        if cache is not None:
+            cache.invalidar(*espacios)
+
+def descartar_invalidaciones(sesion):
+    """
+    @brief Olvida los espacios anotados por una transacción deshecha
+    @version 1.0
+    """
+    sesion.info.pop(CLAVE_ESPACIOS_SESION, None)
+
+def iniciar_cache_busqueda(app):
+    """
+    @brief Crea la caché de búsquedas al arrancar la aplicación
+    @details No hace nada si CACHE_BUSQUEDA_ENTRADAS es 0.
+    @param app Instancia de Flask
+    @version 1.0
+    """
+    capacidad = app.config.get('CACHE_BUSQUEDA_ENTRADAS', 0)
+    if capacidad <= 0:
+        return
+
+    app.extensions['cache_busqueda'] = CacheResultados(capacidad, app.config.get('CACHE_BUSQUEDA_SEGUNDOS', 60))
+    registrar_invalidaciones()
+
+def registrar_invalidaciones():
+    """
+    @brief Registra (una sola vez) los eventos de sesión que invalidan las cachés al confirmar escrituras
+    @version 1.0
+    """
+    if not event.contains(Session, 'after_commit', confirmar_invalidaciones):
+        event.listen(Session, 'after_flush', anotar_escrituras_flush)
+        event.listen(Session, 'do_orm_execute', anotar_escrituras_sentencia)
+        event.listen(Session, 'after_commit', confirmar_invalidaciones)
+        event.listen(Session, 'after_rollback', descartar_invalidaciones)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file cache_home_service.py
+@brief Caché de las APIs del home del ERP de Mega Nevada
+@details El home pide estadísticas, actividad y stock bajo en cada carga y para cada usuario. Las respuestas de las APIs
+         /api/home/* se guardan por proceso durante CACHE_HOME_SEGUNDOS y se invalidan explícitamente en cuanto se
+         confirma una escritura en pedidos, facturas, albaranes, productos o clientes (contadores de generación de
+         cache_busqueda_service). Todas las respuestas llevan ETag y Last-Modified con Cache-Control: no-cache, de modo
+         que el navegador revalida y, si nada ha cambiado, recibe un 304 sin cuerpo. Los validadores salen de la versión
+         de los datos (home_service.version_datos_home), no del cuerpo ni de la hora en que se calculó: son los mismos
+         en todos los procesos y no cambian al caducar la caché, y si coinciden no se llega a calcular la respuesta.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import request, make_response, current_app
+from models.models import db
+from services.cache_busqueda_service import CacheResultados, obtener_cache, registrar_invalidaciones
+from services.home_service import iniciar_lectura_coherente, version_datos_home
+
+# Espacio de la caché del home en los contadores de generación
+ESPACIO_HOME = 'home'
+
+class RespuestaGuardada:
+    """
+    @brief Respuesta JSON del home ya serializada, con sus validadores HTTP
+    @version 1.1
+    """
+
+    def __init__(self, cuerpo, etag, modificada):
+        """
+        @param cuerpo Bytes del JSON
+        @param etag ETag de validadores_home()
+        @param modificada Last-Modified de validadores_home() (o None)
+        """
+        self.cuerpo = cuerpo
+        self.etag = etag
+        self.modificada = modificada
+
+def validadores_home():
+    """
+    @brief ETag y Last-Modified de la respuesta de la petición actual
+    @details Abre la transacción de lectura del home antes de consultar la versión, así en PostgreSQL la versión y los
+             datos de la respuesta salen de la misma foto. El ETag combina la ruta con sus parámetros y la versión de
+             los datos; Last-Modified es la última modificación de los datos, en UTC y sin fracciones de segundo.
+    @return tuple (etag, modificada)
+    @version 1.0
+    """
+    iniciar_lectura_coherente()
+    version, ultima = version_datos_home()
+    etag = hashlib.sha1(f'{request.full_path}|{version}'.encode()).hexdigest()
+    modificada = ultima.replace(tzinfo=timezone.utc, microsecond=0) if ultima else None
+    return etag, modificada
+
+def respuesta_condicional(guardada):
+    """
+    @brief Construye la respuesta de una RespuestaGuardada atendiendo If-None-Match e If-Modified-Since
+    @param guardada RespuestaGuardada
+    @return Response 200 con el cuerpo o 304 sin él
+    @version 1.0
+    """
+    respuesta = current_app.response_class(guardada.cuerpo, mimetype='application/json')
+    respuesta.set_etag(guardada.etag)
+    if guardada.modificada is not None:
+        respuesta.last_modified = guardada.modificada
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    return respuesta.make_conditional(request)
+
+def cache_home(vista):
+    """
+    @brief Decorador de las APIs del home: sirve la respuesta guardada o la calcula y la guarda
+    @details Solo se guardan las respuestas 200 con success verdadero. La clave es la ruta con sus parámetros. Sin
+             respuesta guardada se consulta primero la versión de los datos: si el navegador ya tiene esa versión
+             (If-None-Match) se responde 304 sin ejecutar la vista; si no, se calcula. Con la caché desactivada se hace
+             siempre así.
+    @param vista Función de vista que devuelve un JSON
+    @return Función decorada
+    @version 1.1
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        cache = obtener_cache('cache_home')
+        clave = (request.path, request.query_string)
+
+        if cache is not None:
+            encontrado, guardada = cache.obtener(ESPACIO_HOME, clave)
+            if encontrado:
+                return respuesta_condicional(guardada)
+            generacion = cache.generacion(ESPACIO_HOME)
+
+        try:
+            etag, modificada = validadores_home()
+        except Exception as e:
+            # Sin versión no hay validadores: la vista responde (o informa del error) como sin caché
+            print(f"Error al leer la versión de los datos del home: {str(e)}")
+            db.session.rollback()
+            return vista(*args, **kwargs)
+        if request.if_none_match.contains_weak(etag):
+            return respuesta_condicional(RespuestaGuardada(b'', etag, modificada))
+
+        respuesta = make_response(vista(*args, **kwargs))
+        datos = respuesta.get_json(silent=True)
+        if respuesta.status_code != 200 or not isinstance(datos, dict) or not datos.get('success'):
+            return respuesta
+
+        guardada = RespuestaGuardada(respuesta.get_data(), etag, modificada)
+        if cache is not None:
+            cache.guardar(ESPACIO_HOME, clave, guardada, generacion)
+        return respuesta_condicional(guardada)
+
+    return envoltura
+
+def iniciar_cache_home(app):
+    """
+    @brief Crea la caché del home al arrancar la aplicación
+    @details No hace nada si CACHE_HOME_SEGUNDOS es 0.
+    @param app Instancia de Flask
+    @version 1.0
+    """
+    segundos = app.config.get('CACHE_HOME_SEGUNDOS', 0)
+    if segundos <= 0:
+        return
+
+    app.extensions['cache_home'] = CacheResultados(app.config.get('CACHE_HOME_ENTRADAS', 50), segundos)
+    registrar_invalidaciones()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file carga_pedidos_service.py
+@brief Servicio de carga masiva de pedidos del ERP de Mega Nevada
+@details Este módulo procesa los pedidos que los comerciales recogen sin conexión en las farmacias y sincronizan al final
+         del día. Los pedidos llegan como NDJSON (un pedido por línea) o CSV (una línea por item, agrupadas por referencia)
+         y se procesan por lotes: clientes y productos se resuelven con consultas IN, los números de pedido y factura se
+         reservan por rangos, los items se insertan en bloque y se hace un commit por lote.
+@author José David Sánchez Fernández
+@version 1.2
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import groupby, islice
+from sqlalchemy import update, or_
+from models.models import db, Cliente, Producto, Pedido, ItemPedido, Factura
+from services.stock_service import StockInsuficienteError, ajustar_stock
+from services.ventas_service import lineas_venta, actualizar_ventas
+from services.eventos_service import anotar_evento
+from services.numeracion_service import (
+    SERIE_PEDIDOS, SERIE_FACTURAS, reservar_numeros,
+    periodo_pedidos, periodo_facturas, formatear_numero_pedido, formatear_numero_factura
+)
+
+ESTADOS_VALIDOS = ['pendiente', 'confirmado', 'entregado', 'facturado']
+
+def leer_pedidos_ndjson(flujo):
+    """
+    @brief Lee pedidos en formato NDJSON
+    @details Cada línea no vacía es un objeto JSON con cliente_id o cliente_codigo, items (con producto_id o
+             producto_codigo y cantidad) y opcionalmente referencia, estado y observaciones.
+    @param flujo Flujo binario o de texto de entrada
+    @return generator Diccionarios de pedido; las líneas inválidas llevan la clave 'error'
+    @version 1.0
+    """
+    for numero_linea, linea in enumerate(flujo, start=1):
+        if isinstance(linea, bytes):
+            linea = linea.decode('utf-8')
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            pedido = json.loads(linea)
+            if not isinstance(pedido, dict):
+                raise ValueError('la línea no es un objeto JSON')
+        except ValueError as e:
+            yield {'referencia': str(numero_linea), 'error': f'JSON inválido: {str(e)}'}
+            continue
+        pedido.setdefault('referencia', str(numero_linea))
+        yield pedido
+
+def leer_pedidos_csv(flujo):
+    """
+    @brief Lee pedidos en formato CSV
+    @details Una fila por item con las columnas referencia, cliente_codigo (o cliente_id), producto_codigo (o producto_id),
+             cantidad y opcionalmente estado y observaciones. Las filas consecutivas con la misma referencia forman un pedido.
+    @param flujo Flujo binario de entrada
+    @return generator Diccionarios de pedido
+    @version 1.0
+    """
+    texto = io.TextIOWrapper(flujo, encoding='utf-8-sig', newline='')
+    lector = csv.DictReader(texto)
+    for referencia, filas in groupby(lector, key=lambda fila: (fila.get('referencia') or '').strip()):
+        filas = list(filas)
+        cabecera = filas[0]
+        yield {
+            'referencia': referencia,
+            'cliente_id': cabecera.get('cliente_id') or None,
+            'cliente_codigo': cabecera.get('cliente_codigo') or None,
+            'estado': cabecera.get('estado') or 'pendiente',
+            'observaciones': cabecera.get('observaciones') or '',
+            'items': [
+                {
+                    'producto_id': fila.get('producto_id') or None,
+                    'producto_codigo': fila.get('producto_codigo') or None,
+                    'cantidad': fila.get('cantidad')
+                }
+                for fila in filas
+            ]
+        }
+
+def procesar_carga(pedidos, tamano_lote=500):
+    """
+    @brief Procesa una secuencia de pedidos por lotes
+    @param pedidos Iterable de diccionarios de pedido (ver leer_pedidos_ndjson / leer_pedidos_csv)
+    @param tamano_lote Pedidos por lote y por commit
+    @return list Un resultado por pedido, en el orden de entrada
+    @version 1.0
+    """
+    resultados = []
+    pedidos = iter(pedidos)
+    while True:
+        lote = list(islice(pedidos, tamano_lote))
+        if not lote:
+            break
+        resultados.extend(procesar_lote(lote))
+    return resultados
+
+def procesar_lote(lote):
+    """
+    @brief Procesa y guarda un lote de pedidos en una transacción
+    @details Los pedidos con errores de datos o sin stock se rechazan individualmente sin afectar al resto del lote.
+    @param lote Lista de diccionarios de pedido
+    @return list Resultados del lote
+    @version 1.0
+    """
+    resultados = [{'referencia': str(pedido.get('referencia', '')), 'success': False} for pedido in lote]
+
+    try:
+        clientes_por_id, clientes_por_codigo = cargar_clientes(lote)
+        productos_por_id, productos_por_codigo = cargar_productos(lote)
+
+        # Validar y resolver cada pedido
+        validos = []
+        for indice, datos in enumerate(lote):
+            if datos.get('error'):
+                resultados[indice]['message'] = datos['error']
+                continue
+            try:
+                pedido = resolver_pedido(datos, clientes_por_id, clientes_por_codigo, productos_por_id, productos_por_codigo)
+            except ValueError as e:
+                resultados[indice]['message'] = str(e)
+                continue
+            validos.append((indice, pedido))
+
+        validos = reservar_stock_lote(validos, resultados)
+
+        if validos:
+            guardar_pedidos(validos, resultados)
+
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error al procesar lote de pedidos: {str(e)}")
+        for resultado in resultados:
+            if resultado['success'] or not resultado.get('message'):
+                resultado.update({'success': False, 'message': f'Error al guardar el lote: {str(e)}'})
+                resultado.pop('numero_pedido', None)
+                resultado.pop('numero_factura', None)
+                resultado.pop('pedido_id', None)
+
+    return resultados
+
+def cargar_clientes(lote):
+    """
+    @brief Carga los clientes referenciados por el lote
+    @return tuple (clientes por id, clientes por código)
+    @version 1.0
+    """
+    ids = {entero(pedido.get('cliente_id')) for pedido in lote} - {None}
+    codigos = {str(pedido['cliente_codigo']).strip().upper() for pedido in lote if pedido.get('cliente_codigo')}
+
+    condiciones = []
+    if ids:
+        condiciones.append(Cliente.id.in_(ids))
+    if codigos:
+        condiciones.append(Cliente.codigo.in_(codigos))
+    if not condiciones:
+        return {}, {}
+
+    clientes = Cliente.query.filter(or_(*condiciones)).all()
+    return {c.id: c for c in clientes}, {c.codigo: c for c in clientes}
+
+def cargar_productos(lote):
+    """
+    @brief Carga los productos referenciados por el lote
+    @return tuple (productos por id, productos por código)
+    @version 1.0
+    """
+    ids = set()
+    codigos = set()
+    for pedido in lote:
+        for item in pedido.get('items') or []:
+            if not isinstance(item, dict):
+                continue
+            producto_id = entero(item.get('producto_id'))
+            if producto_id is not None:
+                ids.add(producto_id)
+            elif item.get('producto_codigo'):
+                codigos.add(str(item['producto_codigo']).strip().upper())
+
+    condiciones = []
+    if ids:
+        condiciones.append(Producto.id.in_(ids))
+    if codigos:
+        condiciones.append(Producto.codigo.in_(codigos))
+    if not condiciones:
+        return {}, {}
+
+    productos = Producto.query.filter(or_(*condiciones)).all()
+    return {p.id: p for p in productos}, {p.codigo: p for p in productos}
+
+def resolver_pedido(datos, clientes_por_id, clientes_por_codigo, productos_por_id, productos_por_codigo):
+    """
+    @brief Valida un pedido y resuelve su cliente y productos
+    @return dict Pedido con cliente, estado, observaciones y lista de (producto, cantidad)
+    @exception ValueError Si el pedido no es válido
+    @version 1.0
+    """
+    cliente_id = entero(datos.get('cliente_id'))
+    if cliente_id is not None:
+        cliente = clientes_por_id.get(cliente_id)
+    elif datos.get('cliente_codigo'):
+        cliente = clientes_por_codigo.get(str(datos['cliente_codigo']).strip().upper())
+    else:
+        raise ValueError('Cliente es obligatorio')
+    if not cliente:
+        raise ValueError('Cliente no encontrado')
+
+    estado = datos.get('estado') or 'pendiente'
+    if estado not in ESTADOS_VALIDOS:
+        raise ValueError(f'Estado no válido: {estado}')
+
+    lineas = []
+    for item in datos.get('items') or []:
+        if not isinstance(item, dict):
+            raise ValueError('Formato de item inválido')
+        producto_id = entero(item.get('producto_id'))
+        if producto_id is not None:
+            producto = productos_por_id.get(producto_id)
+            referencia_producto = producto_id
+        else:
+            referencia_producto = str(item.get('producto_codigo') or '').strip().upper()
+            producto = productos_por_codigo.get(referencia_producto)
+        if not producto:
+            raise ValueError(f'Producto no encontrado: {referencia_producto}')
+
+        cantidad = entero(item.get('cantidad'))
+        if cantidad is None or cantidad <= 0:
+            raise ValueError(f'Cantidad no válida para {producto.codigo}')
+        lineas.append((producto, cantidad))
+
+    if not lineas:
+        raise ValueError('El pedido debe tener al menos un producto')
+
+    return {
+        'cliente': cliente,
+        'estado': estado,
+        'observaciones': str(datos.get('observaciones') or '').strip(),
+        'lineas': lineas
+    }
+
+def cantidades_pedido(pedido):
+    """
+    @brief Unidades a descontar de stock por producto para un pedido
+    @version 1.0
+    """
+    cantidades = {}
+    for producto, cantidad in pedido['lineas']:
+        if not producto.es_deposito:
+            cantidades[producto.id] = cantidades.get(producto.id, 0) + cantidad
+    return cantidades
+
+def reservar_stock_lote(validos, resultados):
+    """
+    @brief Reserva el stock de todos los pedidos válidos del lote
+    @details Primero intenta descontar el total del lote en una sola pasada. Solo si falta stock se repite pedido a pedido,
+             cada uno en su propio savepoint, para rechazar únicamente los pedidos que no se pueden servir.
+    @return list Pedidos con stock reservado
+    @version 1.0
+    """
+    total = {}
+    for _, pedido in validos:
+        for producto_id, cantidad in cantidades_pedido(pedido).items():
+            total[producto_id] = total.get(producto_id, 0) + cantidad
+
+    punto = db.session.begin_nested()
+    try:
+        ajustar_stock(total)
+        punto.commit()
+        return validos
+    except StockInsuficienteError:
+        punto.rollback()
+
+    reservados = []
+    for indice, pedido in validos:
+        punto = db.session.begin_nested()
+        try:
+            ajustar_stock(cantidades_pedido(pedido))
+            punto.commit()
+            reservados.append((indice, pedido))
+        except StockInsuficienteError as e:
+            punto.rollback()
+            resultados[indice].update({'message': str(e), 'faltantes': e.faltantes})
+    return reservados
+
+def guardar_pedidos(validos, resultados):
+    """
+    @brief Numera, crea e inserta en bloque los pedidos, sus items y sus facturas
+    @details Las ventas de todo el lote se suman a ventas_diarias con una sola sentencia. En lugar de un evento por
+             pedido se publica un único pedidos_cargados por lote.
+    @version 1.2
+    """
+    ahora = datetime.utcnow()
+    periodo_pedido = periodo_pedidos()
+    periodo_factura = periodo_facturas()
+    numeros_pedido = reservar_numeros(SERIE_PEDIDOS, periodo_pedido, len(validos))
+    numeros_factura = reservar_numeros(SERIE_FACTURAS, periodo_factura, len(validos))
+
+    nuevos = []
+    for (indice, datos), numero_pedido, numero_factura in zip(validos, numeros_pedido, numeros_factura):
+        pedido = Pedido(
+            numero_pedido=formatear_numero_pedido(periodo_pedido, numero_pedido),
+            cliente=datos['cliente'],
+            estado=datos['estado'],
+            observaciones=datos['observaciones']
+        )
+        for producto, cantidad in datos['lineas']:
+            item = ItemPedido(
+                producto=producto,
+                cantidad=cantidad,
+                precio_unitario_sin_iva=producto.pvf_sin_iva,
+                iva_porcentaje=producto.iva_porcentaje
+            )
+            item.calcular_totales()
+            pedido.items.append(item)
+        pedido.calcular_totales()
+
+        factura = Factura(
+            numero_factura=formatear_numero_factura(periodo_factura, numero_factura),
+            pedido=pedido,
+            fecha_factura=ahora,
+            total=pedido.total,
+            enviada_por_email=False
+        )
+        nuevos.append((indice, pedido, factura))
+
+    db.session.add_all([factura for _, _, factura in nuevos])
+    db.session.flush()
+
+    actualizar_ventas(nuevas=lineas_venta(*(pedido for _, pedido, _ in nuevos)))
+    anotar_evento(
+        'pedidos_cargados',
+        creados=len(nuevos),
+        pendientes=sum(1 for _, pedido, _ in nuevos if pedido.estado == 'pendiente'),
+        facturas=len(nuevos)
+    )
+
+    # Última visita de todos los clientes del lote con una sola sentencia
+    db.session.execute(
+        update(Cliente)
+        .where(Cliente.id.in_({datos['cliente'].id for _, datos in validos}))
+        .values(fecha_ultima_visita=ahora)
+        .execution_options(synchronize_session=False)
+    )
+
+    for indice, pedido, factura in nuevos:
+        resultados[indice].update({
+            'success': True,
+            'pedido_id': pedido.id,
+            'numero_pedido': pedido.numero_pedido,
+            'numero_factura': factura.numero_factura,
+            'total': float(pedido.total)
+        })
+
+def entero(valor):
+    """
+    @brief Convierte un valor a entero
+    @return int o None si no es un entero válido
+    @version 1.0
+    """
+    if valor is None or valor == '':
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file estadisticas_service.py
+@brief Estadísticas de los paneles del ERP de Mega Nevada
+@details Cada panel (home, clientes, productos, pedidos y facturas) se calcula con una única sentencia SQL. Los contadores
+         de una misma tabla son agregados condicionales (COUNT(*) FILTER (WHERE ...)) sobre una sola pasada, y cuando un
+         panel necesita varias tablas sus agregados se combinan en la misma sentencia, de modo que cada panel cuesta un
+         único viaje a la base de datos.
+         La valoración del inventario (total y desglosada por categoría, marca o proveedor) también se agrega en SQL y
+         se devuelve en Decimal exacto, a PVF sin IVA y con IVA.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import func, select, true
+from models.models import db, Cliente, Producto, Pedido, Factura, redondear_importe
+from services.impuestos_service import a_decimal
+
+# Columnas de Producto por las que se puede desglosar la valoración del inventario
+AGRUPACIONES_INVENTARIO = ('categoria', 'marca', 'nombre_proveedor')
+
+def inicio_mes(ahora=None):
+    """
+    @brief Primer instante del mes en curso
+    @param ahora Fecha de referencia (por defecto, ahora)
+    @return datetime Día 1 del mes a las 00:00
+    @version 1.0
+    """
+    return (ahora or datetime.now()).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def contar_si(condicion):
+    """
+    @brief COUNT(*) FILTER (WHERE condicion)
+    @param condicion Expresión booleana
+    @return Agregado
+    @version 1.0
+    """
+    return func.count().filter(condicion)
+
+def sumar_si(expresion, condicion):
+    """
+    @brief SUM(expresion) FILTER (WHERE condicion), 0 si no hay filas
+    @param expresion Expresión a sumar
+    @param condicion Expresión booleana
+    @return Agregado
+    @version 1.0
+    """
+    return func.coalesce(func.sum(expresion).filter(condicion), 0)
+
+def agregados_clientes():
+    """
+    @brief Contadores de clientes en una pasada
+    @return Select de una fila
+    @version 1.0
+    """
+    return select(
+        contar_si(Cliente.activo == True).label('clientes_activos'),
+        contar_si(Cliente.activo == False).label('clientes_inactivos')
+    )
+
+def agregados_productos():
+    """
+    @brief Contadores y valor del inventario de los productos activos en una pasada
+    @return Select de una fila
+    @version 1.0
+    """
+    return select(
+        func.count().label('total_productos'),
+        contar_si(Producto.stock <= Producto.stock_minimo).label('productos_stock_bajo'),
+        contar_si(Producto.stock == 0).label('productos_agotados'),
+        sumar_si(Producto.precio * Producto.stock, Producto.stock > 0).label('valor_inventario')
+    ).where(Producto.activo == True)
+
+def importe_exacto(valor, divisor=1):
+    """
+    @brief Convierte una suma devuelta por la base de datos en un importe Decimal redondeado a céntimos
+    @param valor Suma (Decimal en PostgreSQL; puede llegar como float en SQLite)
+    @param divisor Divisor que se aplica en Decimal antes de redondear
+    @return Decimal Importe con dos decimales
+    @version 1.0
+    """
+    return redondear_importe(a_decimal(valor) / Decimal(divisor))
+
+def valoracion_inventario(agrupar=None):
+    """
+    @brief Valor del stock de los productos activos a PVF sin IVA y con IVA
+    @details Una sola consulta agregada sobre los productos activos con stock. El valor con IVA se suma como
+             precio * stock * (100 + iva) y se divide entre 100 en Decimal, de modo que solo se redondea una vez por
+             grupo; los totales se redondean sobre las sumas exactas, así que coinciden con los de la consulta sin agrupar
+             aunque la suma de los grupos redondeados pueda diferir en algún céntimo. Los productos sin valor en la columna
+             de agrupación forman el grupo None.
+    @param agrupar None para el total, o 'categoria', 'marca' o 'nombre_proveedor'
+    @return dict Totales (productos, unidades, valor_sin_iva, valor_con_iva) y, si se agrupa, la lista grupos
+    @exception ValueError Si la agrupación no es válida
+    @version 1.0
+    """
+    if agrupar is not None and agrupar not in AGRUPACIONES_INVENTARIO:
+        raise ValueError(f"Agrupación no válida: {agrupar}")
+
+    columnas = [
+        func.count().label('productos'),
+        func.coalesce(func.sum(Producto.stock), 0).label('unidades'),
+        func.coalesce(func.sum(Producto.precio * Producto.stock), 0).label('valor_sin_iva'),
+        func.coalesce(
+            func.sum(Producto.precio * Producto.stock * (100 + func.coalesce(Producto.iva_porcentaje, 0))), 0
+        ).label('valor_con_iva_100')
+    ]
+    consulta = select(*columnas).where(Producto.activo == True, Producto.stock > 0)
+
+    def fila_valoracion(fila):
+        return {
+            'productos': int(fila['productos']),
+            'unidades': int(fila['unidades']),
+            'valor_sin_iva': importe_exacto(fila['valor_sin_iva']),
+            'valor_con_iva': importe_exacto(fila['valor_con_iva_100'], 100)
+        }
+
+    if agrupar is None:
+        return fila_valoracion(db.session.execute(consulta).mappings().one())
+
+    grupo = getattr(Producto, agrupar)
+    consulta = consulta.add_columns(grupo.label('grupo')).group_by(grupo).order_by(grupo)
+    filas = db.session.execute(consulta).mappings().all()
+
+    # Los totales se redondean una sola vez sobre las sumas sin redondear, igual que sin agrupar
+    totales = {'productos': 0, 'unidades': 0, 'valor_sin_iva': Decimal('0'), 'valor_con_iva_100': Decimal('0')}
+    for fila in filas:
+        for campo in totales:
+            totales[campo] += a_decimal(fila[campo])
+
+    return {
+        **fila_valoracion(totales),
+        'grupos': [{agrupar: fila['grupo'], **fila_valoracion(fila)} for fila in filas]
+    }
+
+def agregados_pedidos(desde):
+    """
+    @brief Contadores de pedidos por estado y del mes en una pasada
+    @param desde Inicio del mes
+    @return Select de una fila
+    @version 1.0
+    """
+    return select(
+        func.count().label('total_pedidos'),
+        contar_si(Pedido.estado == 'pendiente').label('pedidos_pendientes'),
+        contar_si(Pedido.estado == 'confirmado').label('pedidos_confirmados'),
+        contar_si(Pedido.estado == 'entregado').label('pedidos_entregados'),
+        contar_si(Pedido.fecha_pedido >= desde).label('pedidos_mes'),
+        sumar_si(Pedido.total, Pedido.estado == 'pendiente').label('valor_pendiente')
+    )
+
+def agregados_facturas(desde):
+    """
+    @brief Contadores e importe de facturas en una pasada
+    @param desde Inicio del mes
+    @return Select de una fila
+    @version 1.0
+    """
+    return select(
+        func.count().label('total_facturas'),
+        contar_si(Factura.fecha_factura >= desde).label('facturas_mes'),
+        contar_si(Factura.enviada_por_email == True).label('facturas_enviadas'),
+        sumar_si(Factura.total, Factura.fecha_factura >= desde).label('total_facturado_mes')
+    )
+
+def ejecutar_agregados(*consultas, **escalares):
+    """
+    @brief Ejecuta varias consultas de una fila como una única sentencia
+    @details Cada consulta se convierte en subconsulta y se unen con CROSS JOIN (una fila por una fila); las subconsultas
+             escalares se añaden como columnas.
+    @param consultas Select de una fila cada uno
+    @param escalares Nombre -> subconsulta escalar
+    @return dict Columna -> valor
+    @version 1.0
+    """
+    subconsultas = [consulta.subquery() for consulta in consultas]
+    origen = subconsultas[0]
+    for subconsulta in subconsultas[1:]:
+        origen = origen.join(subconsulta, true())
+
+    columnas = [columna for subconsulta in subconsultas for columna in subconsulta.c]
+    columnas += [escalar.label(nombre) for nombre, escalar in escalares.items()]
+    return dict(db.session.execute(select(*columnas).select_from(origen)).mappings().one())
+
+def estadisticas_home(ahora=None):
+    """
+    @brief Contadores del home
+    @param ahora Fecha de referencia (por defecto, ahora)
+    @return dict total_clientes, total_productos, total_pedidos, pedidos_pendientes y facturas_mes
+    @version 1.0
+    """
+    desde = inicio_mes(ahora)
+    fila = ejecutar_agregados(
+        select(func.count().label('total_clientes')).where(Cliente.activo == True),
+        select(func.count().label('total_productos')).where(Producto.activo == True),
+        select(
+            func.count().label('total_pedidos'),
+            contar_si(Pedido.estado == 'pendiente').label('pedidos_pendientes')
+        ),
+        select(func.count().label('facturas_mes')).where(Factura.fecha_factura >= desde)
+    )
+    return {
+        'total_clientes': fila['total_clientes'],
+        'total_productos': fila['total_productos'],
+        'total_pedidos': fila['total_pedidos'],
+        'pedidos_pendientes': fila['pedidos_pendientes'],
+        'facturas_mes': fila['facturas_mes']
+    }
+
+def estadisticas_clientes():
+    """
+    @brief Contadores de clientes y última visita
+    @return dict Con las claves de la API de estadísticas de clientes
+    @version 1.0
+    """
+    ultima_visita = select(Cliente.fecha_ultima_visita, Cliente.nombre).where(
+        Cliente.fecha_ultima_visita.isnot(None)
+    ).order_by(Cliente.fecha_ultima_visita.desc()).limit(1).subquery()
+
+    fila = ejecutar_agregados(
+        agregados_clientes(),
+        ultima_visita=select(ultima_visita.c.fecha_ultima_visita).scalar_subquery(),
+        cliente_ultima_visita=select(ultima_visita.c.nombre).scalar_subquery()
+    )
+    return {
+        'total_clientes': fila['clientes_activos'],
+        'clientes_activos': fila['clientes_activos'],
+        'clientes_inactivos': fila['clientes_inactivos'],
+        'ultima_visita': fila['ultima_visita'].isoformat() if fila['ultima_visita'] else None,
+        'cliente_ultima_visita': fila['cliente_ultima_visita']
+    }
+
+def estadisticas_productos():
+    """
+    @brief Contadores y valor del inventario de productos
+    @return dict Con las claves de la API de estadísticas de productos
+    @version 1.1
+    """
+    fila = ejecutar_agregados(agregados_productos())
+    return {
+        'total_productos': fila['total_productos'],
+        'productos_stock_bajo': fila['productos_stock_bajo'],
+        'productos_agotados': fila['productos_agotados'],
+        'valor_inventario': float(importe_exacto(fila['valor_inventario']))
+    }
+
+def estadisticas_pedidos(ahora=None):
+    """
+    @brief Contadores de pedidos por estado, del mes y valor pendiente
+    @param ahora Fecha de referencia (por defecto, ahora)
+    @return dict Con las claves de la API de estadísticas de pedidos
+    @version 1.0
+    """
+    fila = ejecutar_agregados(agregados_pedidos(inicio_mes(ahora)))
+    return {
+        'total_pedidos': fila['total_pedidos'],
+        'pedidos_pendientes': fila['pedidos_pendientes'],
+        'pedidos_confirmados': fila['pedidos_confirmados'],
+        'pedidos_entregados': fila['pedidos_entregados'],
+        'pedidos_mes': fila['pedidos_mes'],
+        'valor_pendiente': float(fila['valor_pendiente'])
+    }
+
+def estadisticas_facturas(ahora=None):
+    """
+    @brief Contadores de facturas e importe facturado del mes
+    @param ahora Fecha de referencia (por defecto, ahora)
+    @return dict Con las claves de la API de estadísticas de facturas
+    @version 1.0
+    """
+    fila = ejecutar_agregados(agregados_facturas(inicio_mes(ahora)))
+    return {
+        'facturas_mes': fila['facturas_mes'],
+        'total_facturas': fila['total_facturas'],
+        'facturas_enviadas': fila['facturas_enviadas'],
+        'total_facturado_mes': float(fila['total_facturado_mes'])
+    }
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file eventos_service.py
+@brief Eventos de dominio en tiempo real del ERP de Mega Nevada
+@details Publicación y suscripción en el propio proceso para el canal Server-Sent Events (/eventos/api/stream) del home
+         y del listado de pedidos. Las rutas de escritura anotan los eventos en la sesión con anotar_evento() y solo se
+         publican cuando la transacción se confirma; si se deshace, se descartan. Cada suscriptor tiene una cola acotada:
+         si no la vacía a tiempo se le desconecta y, al reconectar con Last-Event-ID, recibe lo que se perdió mientras
+         siga en el historial. Los eventos no salen del proceso: con varios procesos de servidor cada navegador solo ve
+         los de las escrituras atendidas por su proceso.
+         Tipos: pedido_creado, pedido_estado, pedido_eliminado, pedidos_cargados, factura_generada y stock_bajo.
+@author José David Sánchez Fernández
+@version 1.0
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import json
+import queue
+import threading
+from collections import deque
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models.models import db, Producto
+
+# Clave de db.session.info donde se anotan los eventos de la transacción en curso
+CLAVE_EVENTOS_SESION = 'eventos_pendientes'
+
+class BusEventos:
+    """
+    @brief Publicación y suscripción de eventos en memoria
+    @details Los identificadores son consecutivos dentro del proceso. Publicar nunca bloquea: un suscriptor con la cola
+             llena se desconecta (recibe None) en lugar de frenar a quien escribe.
+    @version 1.0
+    """
+
+    def __init__(self, historial=200, max_suscriptores=100, tamano_cola=100):
+        self.historial = deque(maxlen=historial)
+        self.max_suscriptores = max_suscriptores
+        self.tamano_cola = tamano_cola
+        self.suscriptores = set()
+        self.ultimo_id = 0
+        self.cerrojo = threading.Lock()
+
+    def suscribir(self, ultimo_visto=None):
+        """
+        @brief Da de alta un suscriptor
+        @param ultimo_visto Último id recibido por el cliente (cabecera Last-Event-ID) o None
+        @return tuple (cola, eventos perdidos a reenviar) o (None, []) si se ha alcanzado el máximo de suscriptores
+        @version 1.0
+        """
+        with self.cerrojo:
+            if len(self.suscriptores) >= self.max_suscriptores:
+                return None, []
+            cola = queue.Queue(self.tamano_cola)
+            self.suscriptores.add(cola)
+            # Un id mayor que el último publicado es de otro arranque del proceso: no hay nada que reenviar
+            if ultimo_visto is None or ultimo_visto > self.ultimo_id:
+                return cola, []
+            return cola, [evento for evento in self.historial if evento['id'] > ultimo_visto]
+
+    def cancelar(self, cola):
+        """
+        @brief Da de baja un suscriptor
+        @version 1.0
+        """
+        with self.cerrojo:
+            self.suscriptores.discard(cola)
+
+    def publicar(self, tipo, datos):
+        """
+        @brief Publica un evento a todos los suscriptores
+        @param tipo Tipo del evento
+        @param datos Diccionario serializable a JSON
+        @return dict Evento publicado (id, tipo, datos)
+        @version 1.0
+        """
+        with self.cerrojo:
+            self.ultimo_id += 1
+            evento = {'id': self.ultimo_id, 'tipo': tipo, 'datos': datos}
+            self.historial.append(evento)
+            for cola in list(self.suscriptores):
+                try:
+                    cola.put_nowait(evento)
+                except queue.Full:
+                    self.suscriptores.discard(cola)
+                    vaciar_y_cerrar(cola)
+            return evento
+
+    def estadisticas(self):
+        """
+        @brief Suscriptores conectados y último id publicado
+        @version 1.0
+        """
+        with self.cerrojo:
+            return {'suscriptores': len(self.suscriptores), 'ultimo_id': self.ultimo_id}
+
+def vaciar_y_cerrar(cola):
+    """
+    @brief Deja en la cola de un suscriptor desconectado solo la marca de cierre (None)
+    @version 1.0
+    """
+    try:
+        while True:
+            cola.get_nowait()
+    except queue.Empty:
+        pass
+    cola.put_nowait(None)
+
+def formatear_evento(evento):
+    """
+    @brief Texto de un evento en formato Server-Sent Events
+    @param evento Diccionario de BusEventos.publicar()
+    @return str Bloque id/event/data terminado en línea en blanco
+    @version 1.0
+    """
+    datos = json.dumps(evento['datos'], ensure_ascii=False, default=str)
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
+
+def obtener_bus():
+    """
+    @brief Bus de eventos de la aplicación actual
+    @return BusEventos o None si los eventos están desactivados
+    @version 1.0
+    """
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('eventos')
+
+def anotar_evento(tipo, **datos):
+    """
+    @brief Anota un evento para publicarlo cuando se confirme la transacción en curso
+    @param tipo Tipo del evento
+    @param datos Contenido del evento
+    @version 1.0
+    """
+    if obtener_bus() is not None:
+        db.session.info.setdefault(CLAVE_EVENTOS_SESION, []).append((tipo, datos))
+
+def datos_pedido(pedido):
+    """
+    @brief Contenido de los eventos de pedido
+    @param pedido Pedido ya volcado con flush
+    @return dict
+    @version 1.0
+    """
+    return {
+        'id': pedido.id,
+        'numero_pedido': pedido.numero_pedido,
+        'cliente_id': pedido.cliente_id,
+        'cliente_nombre': pedido.cliente.nombre if pedido.cliente else '',
+        'estado': pedido.estado,
+        'total': float(pedido.total or 0),
+        'fecha_pedido': pedido.fecha_pedido.isoformat() if pedido.fecha_pedido else None
+    }
+
+def anotar_factura_generada(factura):
+    """
+    @brief Anota el evento factura_generada
+    @param factura Factura ya volcada con flush
+    @version 1.0
+    """
+    anotar_evento(
+        'factura_generada',
+        id=factura.id,
+        numero_factura=factura.numero_factura,
+        pedido_id=factura.pedido_id,
+        total=float(factura.total or 0),
+        fecha_factura=factura.fecha_factura.isoformat() if factura.fecha_factura else None
+    )
+
+def anotar_stock_bajo(descuentos):
+    """
+    @brief Anota stock_bajo para los productos que acaban de quedar en su stock mínimo o por debajo
+    @details Se llama después de descontar stock. Un producto cruza el mínimo si su stock actual es menor o igual que
+             stock_minimo y antes del descuento no lo era. Una sola consulta para todos los productos.
+    @param descuentos dict producto_id -> unidades descontadas (solo se consideran las positivas)
+    @version 1.0
+    """
+    if obtener_bus() is None:
+        return
+    descontados = {producto_id: cantidad for producto_id, cantidad in descuentos.items() if cantidad > 0}
+    if not descontados:
+        return
+
+    filas = db.session.execute(
+        select(Producto.id, Producto.codigo, Producto.nombre, Producto.stock, Producto.stock_minimo).where(
+            Producto.id.in_(descontados),
+            Producto.activo == True,
+            Producto.stock <= Producto.stock_minimo
+        )
+    ).all()
+    for producto_id, codigo, nombre, stock, stock_minimo in filas:
+        if stock + descontados[producto_id] > stock_minimo:
+            anotar_evento('stock_bajo', id=producto_id, codigo=codigo, nombre=nombre,
+                          stock=stock, stock_minimo=stock_minimo)
+
+def publicar_eventos(sesion):
+    """
+    @brief Publica los eventos anotados por la transacción confirmada
+    @version 1.0
+    """
+    eventos = sesion.info.pop(CLAVE_EVENTOS_SESION, None)
+    bus = obtener_bus() if eventos else None
+    if bus is not None:
+        for tipo, datos in eventos:
+            bus.publicar(tipo, datos)
+
+def descartar_eventos(sesion):
+    """
+    @brief Olvida los eventos de una transacción deshecha
+    @version 1.0
+    """
+    sesion.info.pop(CLAVE_EVENTOS_SESION, None)
+
+def iniciar_eventos(app):
+    """
+    @brief Crea el bus de eventos al arrancar la aplicación
+    @details No hace nada si EVENTOS_MAX_SUSCRIPTORES es 0.
+    @param app Instancia de Flask
+    @version 1.0
+    """
+    max_suscriptores = app.config.get('EVENTOS_MAX_SUSCRIPTORES', 0)
+    if max_suscriptores <= 0:
+        return
+
+    app.extensions['eventos'] = BusEventos(app.config.get('EVENTOS_HISTORIAL', 200), max_suscriptores)
+
+    if not event.contains(Session, 'after_commit', publicar_eventos):
+        event.listen(Session, 'after_commit', publicar_eventos)
+        event.listen(Session, 'after_rollback', descartar_eventos)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file exportacion_facturas_service.py
+@brief Exportación masiva de facturas en PDF del ERP de Mega Nevada
+@details Genera un ZIP con el PDF de cada factura de un rango o filtro (el cierre de mes para la gestoría) y lo envía
+         mientras se construye. Las facturas se leen de la base de datos por lotes y los PDF que no están en la caché
+         de disco de pdf_service se generan en un grupo de procesos, uno por núcleo. Los que ya están se leen del
+         fichero sin pasar por el grupo. Como mucho hay unas pocas facturas por proceso en curso a la vez, y cada PDF se
+         escribe en el ZIP y se envía en cuanto está listo, de modo que la memoria no crece con el número de facturas.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import io
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy.orm import joinedload, selectinload
+from models.models import Factura, Pedido, ItemPedido
+from services.pdf_service import datos_factura, huella_datos, ruta_pdf, guardar_pdf, renderizar_pdf
+
+# Facturas que se cargan de la base de datos en cada consulta
+LOTE_EXPORTACION = 100
+
+class FlujoZip(io.RawIOBase):
+    """
+    @brief Destino de escritura de zipfile que acumula los bytes hasta que se recogen
+    @details No admite seek ni tell, así zipfile escribe cada fichero con descriptor de datos al final y nunca vuelve
+             atrás sobre lo ya enviado.
+    @version 1.0
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.pendiente = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self.pendiente += datos
+        return len(datos)
+
+    def recoger(self):
+        """
+        @brief Devuelve y vacía los bytes escritos desde la última llamada
+        @return bytes
+        @version 1.0
+        """
+        datos = bytes(self.pendiente)
+        self.pendiente.clear()
+        return datos
+
+def nombre_en_zip(numero_factura):
+    """
+    @brief Nombre del PDF de una factura dentro del ZIP (sin barras, que crearían carpetas)
+    @version 1.0
+    """
+    return f"{numero_factura.replace('/', '-')}.pdf"
+
+def facturas_por_lotes(factura_ids):
+    """
+    @brief Datos de impresión de las facturas, cargadas por lotes con su pedido, cliente, items y productos
+    @param factura_ids IDs de las facturas en el orden de exportación
+    @return Generador de diccionarios de datos_factura()
+    @version 1.0
+    """
+    for inicio in range(0, len(factura_ids), LOTE_EXPORTACION):
+        lote = factura_ids[inicio:inicio + LOTE_EXPORTACION]
+        facturas = {
+            factura.id: factura
+            for factura in Factura.query.options(
+                joinedload(Factura.pedido).options(
+                    joinedload(Pedido.cliente),
+                    selectinload(Pedido.items).joinedload(ItemPedido.producto)
+                )
+            ).filter(Factura.id.in_(lote))
+        }
+        for factura_id in lote:
+            factura = facturas.get(factura_id)
+            if factura is not None and factura.pedido and factura.pedido.cliente and factura.pedido.items:
+                yield datos_factura(factura)
+
+def exportar_facturas_zip(factura_ids, directorio, procesos=None, ventana=None):
+    """
+    @brief Genera el ZIP con los PDF de unas facturas como un flujo de bytes
+    @details Los PDF se añaden en el orden de factura_ids. Si un PDF no se puede generar, el resto se exporta igual y al
+             final se añade ERRORES.txt con las facturas que faltan. El grupo de procesos solo se crea si hay algún PDF
+             que generar, y se cierra al terminar o si el cliente corta la descarga. Con un solo proceso cada PDF se genera
+             al escribirlo en el ZIP, así un fallo también acaba en ERRORES.txt en lugar de cortar la descarga.
+    @param factura_ids Lista de IDs de las facturas
+    @param directorio Directorio de la caché de PDF
+    @param procesos Procesos para generar PDF (por defecto, uno por núcleo); con 1 se generan en este proceso
+    @param ventana Facturas en curso como máximo (por defecto, cuatro por proceso)
+    @return Generador de bytes del ZIP
+    @version 1.1
+    """
+    procesos = procesos or os.cpu_count() or 1
+    ventana = ventana or procesos * 4
+    grupo = None
+    en_curso = deque()
+    errores = []
+    salida = FlujoZip()
+    archivo = zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def escribir(numero_factura, datos, ruta, futuro):
+        try:
+            if futuro is not None:
+                ruta = futuro.result()[0]
+            elif ruta is None:
+                ruta = guardar_pdf(directorio, datos)[0]
+            try:
+                archivo.write(ruta, nombre_en_zip(numero_factura))
+                return
+            except FileNotFoundError:
+                # El PDF se ha borrado entre la comprobación y la lectura (la factura acaba de cambiar)
+                pass
+            archivo.writestr(nombre_en_zip(numero_factura), renderizar_pdf(datos))
+        except Exception as e:
+            print(f"Error al exportar la factura {numero_factura}: {str(e)}")
+            errores.append(f"{numero_factura}: {str(e)}")
+
+    try:
+        for datos in facturas_por_lotes(factura_ids):
+            ruta = ruta_pdf(directorio, datos['id'], huella_datos(datos))
+            futuro = None
+            if not os.path.exists(ruta):
+                if procesos > 1:
+                    if grupo is None:
+                        # spawn y no fork: el servidor tiene hilos y conexiones abiertas que no deben copiarse
+                        grupo = ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('spawn'))
+                    futuro = grupo.submit(guardar_pdf, directorio, datos)
+                else:
+                    ruta = None
+            en_curso.append((datos['numero_factura'], datos, ruta, futuro))
+
+            while len(en_curso) >= ventana:
+                escribir(*en_curso.popleft())
+                yield salida.recoger()
+
+        while en_curso:
+            escribir(*en_curso.popleft())
+            yield salida.recoger()
+
+        if errores:
+            archivo.writestr('ERRORES.txt', '\n'.join(errores) + '\n')
+        archivo.close()
+        yield salida.recoger()
+    finally:
+        if grupo is not None:
+            grupo.shutdown(wait=False, cancel_futures=True)
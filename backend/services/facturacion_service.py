@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file facturacion_service.py
+@brief Resumen de facturación por periodos del ERP de Mega Nevada
+@details Agrega las facturas por mes o por semana en la base de datos (número de facturas e importe) con una única
+         consulta sobre el índice (fecha_factura, total), y compara cada periodo con el anterior y con el mismo periodo
+         del año anterior. La consulta abarca también el año previo al rango pedido para tener esas comparaciones sin
+         más viajes a la base de datos.
+@author José David Sánchez Fernández
+@version 1.0
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import func, select
+from models.models import db, Factura
+from services.busqueda_service import es_postgresql
+from services.impuestos_service import a_decimal
+
+# Periodos que admite resumen_facturacion
+PERIODOS_FACTURACION = ('mes', 'semana')
+
+# Periodos que se devuelven si no se indica desde
+PERIODOS_POR_DEFECTO = 12
+
+def inicio_periodo(fecha, periodo):
+    """
+    @brief Primer día del mes o de la semana (lunes) que contiene una fecha
+    @param fecha date
+    @param periodo 'mes' o 'semana'
+    @return date
+    @version 1.0
+    """
+    if periodo == 'mes':
+        return fecha.replace(day=1)
+    return fecha - timedelta(days=fecha.weekday())
+
+def desplazar_periodo(inicio, periodo, pasos):
+    """
+    @brief Inicio del periodo situado a pasos periodos de otro (negativo hacia atrás)
+    @param inicio Inicio de un periodo
+    @param periodo 'mes' o 'semana'
+    @param pasos Número de periodos
+    @return date
+    @version 1.0
+    """
+    if periodo == 'mes':
+        meses = inicio.year * 12 + inicio.month - 1 + pasos
+        return date(meses // 12, meses % 12 + 1, 1)
+    return inicio + timedelta(weeks=pasos)
+
+def periodo_anio_anterior(inicio, periodo):
+    """
+    @brief Inicio del mismo periodo del año anterior (mismo mes, o la semana 52 semanas antes)
+    @version 1.0
+    """
+    return desplazar_periodo(inicio, periodo, -12 if periodo == 'mes' else -52)
+
+def expresion_periodo(periodo):
+    """
+    @brief Expresión SQL del inicio del periodo de cada factura
+    @details date_trunc en PostgreSQL; en SQLite, los modificadores de date() equivalentes.
+    @param periodo 'mes' o 'semana'
+    @return Expresión SQL
+    @version 1.0
+    """
+    if es_postgresql():
+        return func.date_trunc('month' if periodo == 'mes' else 'week', Factura.fecha_factura)
+    if periodo == 'mes':
+        return func.date(Factura.fecha_factura, 'start of month')
+    return func.date(Factura.fecha_factura, '-6 days', 'weekday 1')
+
+def variacion(actual, anterior):
+    """
+    @brief Variación porcentual entre dos importes
+    @return float Porcentaje con un decimal, o None si el importe anterior es 0
+    @version 1.0
+    """
+    if not anterior:
+        return None
+    return float(((actual - anterior) * 100 / anterior).quantize(Decimal('0.1')))
+
+def resumen_facturacion(periodo='mes', desde=None, hasta=None):
+    """
+    @brief Facturas e importe facturado por periodo, con la comparación con el periodo anterior y con el año anterior
+    @param periodo 'mes' o 'semana'
+    @param desde Primer día del rango (date); por defecto, los últimos PERIODOS_POR_DEFECTO periodos
+    @param hasta Último día del rango (date); por defecto, hoy
+    @return list Un diccionario por periodo del rango, del más antiguo al más reciente, incluidos los que no tienen facturas
+    @exception ValueError Si el periodo no es válido
+    @version 1.0
+    """
+    if periodo not in PERIODOS_FACTURACION:
+        raise ValueError(f"Periodo no válido: {periodo}")
+
+    hasta = hasta or date.today()
+    ultimo = inicio_periodo(hasta, periodo)
+    primero = inicio_periodo(desde, periodo) if desde else desplazar_periodo(ultimo, periodo, 1 - PERIODOS_POR_DEFECTO)
+
+    # Desde el mismo periodo del año anterior, para poder comparar también el primer periodo del rango
+    inicio_consulta = periodo_anio_anterior(primero, periodo)
+    fin_consulta = hasta + timedelta(days=1)
+
+    expresion = expresion_periodo(periodo).label('periodo')
+    consulta = select(
+        expresion,
+        func.count().label('facturas'),
+        func.coalesce(func.sum(Factura.total), 0).label('total')
+    ).where(
+        Factura.fecha_factura >= datetime.combine(inicio_consulta, datetime.min.time()),
+        Factura.fecha_factura < datetime.combine(fin_consulta, datetime.min.time())
+    ).group_by(expresion)
+
+    # Inicio del periodo -> (facturas, total); el inicio llega como datetime en PostgreSQL y como texto en SQLite
+    importes = {
+        date.fromisoformat(str(fila['periodo'])[:10]): (fila['facturas'], a_decimal(fila['total']))
+        for fila in db.session.execute(consulta).mappings()
+    }
+    vacio = (0, Decimal('0'))
+
+    resumen = []
+    inicio = primero
+    while inicio <= ultimo:
+        facturas, total = importes.get(inicio, vacio)
+        total_anterior = importes.get(desplazar_periodo(inicio, periodo, -1), vacio)[1]
+        total_anio_anterior = importes.get(periodo_anio_anterior(inicio, periodo), vacio)[1]
+        resumen.append({
+            'periodo': inicio.isoformat(),
+            'facturas': facturas,
+            'total': float(total),
+            'total_periodo_anterior': float(total_anterior),
+            'variacion_periodo_anterior': variacion(total, total_anterior),
+            'total_anio_anterior': float(total_anio_anterior),
+            'variacion_anio_anterior': variacion(total, total_anio_anterior)
+        })
+        inicio = desplazar_periodo(inicio, periodo, 1)
+    return resumen
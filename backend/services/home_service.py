@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file home_service.py
+@brief Datos de los widgets del home del ERP de Mega Nevada
+@details Cada widget del home (contadores, actividad reciente, alertas de stock y resumen de pedidos) tiene aquí su
+         función, que usan tanto las APIs /api/home/* de cada widget como /api/home/bootstrap, que los devuelve todos en
+         una sola petición. datos_home() lee todos los widgets en una única transacción; en PostgreSQL con REPEATABLE
+         READ, de modo que todos ven la misma foto de los datos. version_datos_home() resume en una clave y una fecha
+         el estado de las tablas de las que salen los widgets, para los validadores HTTP de cache_home_service.
+@author José David Sánchez Fernández
+@version 1.2
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, load_only
+from models.models import db, Cliente, Producto, Pedido, Factura
+from services.estadisticas_service import estadisticas_home, ejecutar_agregados, inicio_mes
+from services.busqueda_service import es_postgresql
+
+# Elementos de la actividad reciente que se muestran
+MAXIMO_ACTIVIDADES = 6
+
+def productos_stock_bajo():
+    """
+    @brief Productos activos con stock igual o inferior al mínimo
+    @return list Diccionarios con id, nombre, codigo, stock_actual, stock_minimo y fecha_modificacion, de menor a mayor
+            stock
+    @version 1.1
+    """
+    productos = Producto.query.options(
+        load_only(Producto.id, Producto.nombre, Producto.codigo, Producto.stock, Producto.stock_minimo,
+                  Producto.fecha_modificacion)
+    ).filter(
+        Producto.stock <= Producto.stock_minimo,
+        Producto.activo == True
+    ).order_by(Producto.stock.asc(), Producto.id).all()
+
+    return [
+        {
+            'id': producto.id,
+            'nombre': producto.nombre,
+            'codigo': producto.codigo,
+            'stock_actual': producto.stock,
+            'stock_minimo': producto.stock_minimo,
+            'fecha_modificacion': producto.fecha_modificacion.isoformat() if producto.fecha_modificacion else None
+        }
+        for producto in productos
+    ]
+
+def actividad_reciente(pedidos_pendientes=None, stock_bajo=None):
+    """
+    @brief Actividad reciente del home: últimos pedidos, clientes y productos y alertas
+    @details Si se pasan el número de pedidos pendientes y la lista de stock bajo (ya leídos para otros widgets) no se
+             vuelven a consultar. Todas las fechas salen de los datos y no de la hora de la petición: la alerta de
+             pedidos pendientes lleva la del último pendiente y la de stock bajo la última modificación del producto, así
+             la respuesta solo cambia cuando cambian los datos.
+    @param pedidos_pendientes Número de pedidos pendientes o None para contarlos
+    @param stock_bajo Resultado de productos_stock_bajo() o None para consultarlo
+    @return list Hasta MAXIMO_ACTIVIDADES actividades, de la más reciente a la más antigua
+    @version 1.1
+    """
+    actividades = []
+
+    # Últimos pedidos creados, con su cliente en la misma consulta
+    for pedido in Pedido.query.options(joinedload(Pedido.cliente)).order_by(Pedido.fecha_pedido.desc()).limit(3):
+        actividades.append({
+            'tipo': 'pedido_nuevo',
+            'mensaje': f'Nuevo pedido: {pedido.numero_pedido} - {pedido.cliente.nombre}',
+            'fecha': pedido.fecha_pedido.isoformat(),
+            'icono': 'fa-shopping-cart',
+            'color': 'success',
+            'enlace': '/pedidos',
+            'elemento_id': pedido.id,
+            'elemento_tipo': 'pedido'
+        })
+
+    # Últimos clientes creados
+    for cliente in Cliente.query.options(
+        load_only(Cliente.id, Cliente.nombre, Cliente.fecha_creacion)
+    ).order_by(Cliente.fecha_creacion.desc()).limit(2):
+        actividades.append({
+            'tipo': 'cliente_nuevo',
+            'mensaje': f'Nuevo cliente: {cliente.nombre}',
+            'fecha': cliente.fecha_creacion.isoformat(),
+            'icono': 'fa-user-plus',
+            'color': 'primary',
+            'enlace': '/clientes',
+            'elemento_id': cliente.id,
+            'elemento_tipo': 'cliente'
+        })
+
+    # Últimos productos creados
+    for producto in Producto.query.options(
+        load_only(Producto.id, Producto.nombre, Producto.fecha_creacion)
+    ).order_by(Producto.fecha_creacion.desc()).limit(2):
+        actividades.append({
+            'tipo': 'producto_nuevo',
+            'mensaje': f'Nuevo producto: {producto.nombre}',
+            'fecha': producto.fecha_creacion.isoformat(),
+            'icono': 'fa-box',
+            'color': 'info',
+            'enlace': '/productos',
+            'elemento_id': producto.id,
+            'elemento_tipo': 'producto'
+        })
+
+    # Pedidos pendientes (alertas), con la fecha del último
+    if pedidos_pendientes is None:
+        pedidos_pendientes = Pedido.query.filter_by(estado='pendiente').count()
+    if pedidos_pendientes > 0:
+        ultimo_pendiente = db.session.query(func.max(Pedido.fecha_pedido)).filter(Pedido.estado == 'pendiente').scalar()
+        actividades.append({
+            'tipo': 'pedidos_pendientes',
+            'mensaje': f'{pedidos_pendientes} pedidos pendientes de confirmar',
+            'fecha': ultimo_pendiente.isoformat() if ultimo_pendiente else None,
+            'icono': 'fa-clock',
+            'color': 'warning',
+            'enlace': '/pedidos?estado=pendiente',
+            'elemento_id': None,
+            'elemento_tipo': None
+        })
+
+    # Los dos productos con menos stock de los que están bajo mínimos
+    if stock_bajo is None:
+        stock_bajo = productos_stock_bajo()
+    for producto in stock_bajo[:2]:
+        actividades.append({
+            'tipo': 'stock_bajo',
+            'mensaje': f"Stock bajo: {producto['nombre']} ({producto['stock_actual']} unidades)",
+            'fecha': producto['fecha_modificacion'],
+            'icono': 'fa-exclamation-triangle',
+            'color': 'danger',
+            'enlace': '/productos',
+            'elemento_id': producto['id'],
+            'elemento_tipo': 'producto'
+        })
+
+    # Ordenar por fecha (más recientes primero)
+    actividades.sort(key=lambda x: x['fecha'] or '', reverse=True)
+
+    # Actividad de muestra si no hay datos (sin fecha)
+    if not actividades:
+        actividades = [
+            {
+                'tipo': 'sistema',
+                'mensaje': 'Sistema ERP iniciado correctamente',
+                'fecha': None,
+                'icono': 'fa-check-circle',
+                'color': 'success',
+                'enlace': None,
+                'elemento_id': None,
+                'elemento_tipo': None
+            },
+            {
+                'tipo': 'info',
+                'mensaje': 'ERP listo para gestionar pedidos',
+                'fecha': None,
+                'icono': 'fa-info-circle',
+                'color': 'info',
+                'enlace': '/pedidos/nuevo',
+                'elemento_id': None,
+                'elemento_tipo': None
+            }
+        ]
+
+    return actividades[:MAXIMO_ACTIVIDADES]
+
+def resumen_pedidos():
+    """
+    @brief Número y valor de los pedidos por estado
+    @return dict estado -> {cantidad, valor_total}
+    @version 1.0
+    """
+    resumen = db.session.query(
+        Pedido.estado,
+        func.count(Pedido.id).label('cantidad'),
+        func.sum(Pedido.total).label('valor_total')
+    ).group_by(Pedido.estado).all()
+
+    return {
+        estado: {
+            'cantidad': cantidad,
+            'valor_total': float(valor) if valor else 0
+        }
+        for estado, cantidad, valor in resumen
+    }
+
+def iniciar_lectura_coherente():
+    """
+    @brief Abre la transacción de lectura del home
+    @details En PostgreSQL la abre con REPEATABLE READ, de modo que todas las consultas siguientes ven la misma foto de
+             los datos. Si ya hay una transacción abierta no hace nada.
+    @version 1.0
+    """
+    if es_postgresql() and not db.session().in_transaction():
+        db.session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+def version_datos_home():
+    """
+    @brief Versión de los datos de los que salen los widgets del home
+    @details Número de filas y última fecha_modificacion de clientes, productos, pedidos y facturas, en una consulta
+             (índices de fecha_modificacion). Las altas y modificaciones cambian la fecha y las bajas el número de filas.
+             Incluye además el mes en curso, del que dependen las facturas del mes.
+    @return tuple (clave de la versión, fecha de la última modificación o None si no hay datos)
+    @version 1.0
+    """
+    modelos = (Cliente, Producto, Pedido, Factura)
+    fila = ejecutar_agregados(*(
+        select(
+            func.count().label(f'filas_{modelo.__tablename__}'),
+            func.max(modelo.fecha_modificacion).label(f'fecha_{modelo.__tablename__}')
+        )
+        for modelo in modelos
+    ))
+    fechas = [fila[f'fecha_{modelo.__tablename__}'] for modelo in modelos if fila[f'fecha_{modelo.__tablename__}']]
+    clave = '|'.join(
+        f"{fila[f'filas_{modelo.__tablename__}']}:{fila[f'fecha_{modelo.__tablename__}']}" for modelo in modelos
+    )
+    return f'{clave}|{inicio_mes().date()}', max(fechas, default=None)
+
+def datos_home():
+    """
+    @brief Todos los widgets del home leídos en una única transacción
+    @details En PostgreSQL la transacción se abre con REPEATABLE READ para que contadores, actividad y alertas sean
+             coherentes entre sí. Los pedidos pendientes y el stock bajo se reutilizan en la actividad reciente.
+    @return dict estadisticas, actividades, productos_stock_bajo y resumen_pedidos
+    @version 1.1
+    """
+    iniciar_lectura_coherente()
+
+    estadisticas = estadisticas_home()
+    stock_bajo = productos_stock_bajo()
+    return {
+        'estadisticas': estadisticas,
+        'actividades': actividad_reciente(estadisticas['pedidos_pendientes'], stock_bajo),
+        'productos_stock_bajo': stock_bajo,
+        'resumen_pedidos': resumen_pedidos()
+    }
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file impuestos_service.py
+@brief Desglose de IVA y recargo de equivalencia del ERP de Mega Nevada
+@details Este módulo es el único sitio donde se reparte una base imponible por tipo de IVA y se calcula el recargo de
+         equivalencia. Lo usan los totales de los pedidos, la vista de factura y los informes. Todo el cálculo se hace con
+         Decimal y redondeo a céntimos por tipo de IVA, de modo que el desglose de la factura suma exactamente su total.
+@author José David Sánchez Fernández
+@version 1.0
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+from decimal import Decimal
+from sqlalchemy import func
+from models.models import db, ItemPedido, redondear_importe
+
+# Recargo de equivalencia (%) que corresponde a cada tipo de IVA (%)
+RECARGO_POR_IVA = {
+    Decimal('4'): Decimal('0.5'),
+    Decimal('10'): Decimal('1.4'),
+    Decimal('21'): Decimal('5.2'),
+}
+
+def normalizar_porcentaje(valor):
+    """
+    @brief Convierte un porcentaje a Decimal sin ceros decimales sobrantes
+    @details Así 21, 21.0 y Decimal('21.00') se agrupan como el mismo tipo.
+    @param valor Porcentaje como número o Decimal
+    @return Decimal Porcentaje normalizado
+    @version 1.0
+    """
+    if valor is None:
+        return Decimal('0')
+    valor = Decimal(str(valor))
+    return valor.quantize(Decimal('1')) if valor == valor.to_integral_value() else valor.normalize()
+
+def a_decimal(valor):
+    """
+    @brief Convierte un importe a Decimal sin arrastrar errores de coma flotante
+    @version 1.0
+    """
+    if valor is None:
+        return Decimal('0')
+    return valor if isinstance(valor, Decimal) else Decimal(str(valor))
+
+def recargo_para_iva(iva_porcentaje):
+    """
+    @brief Porcentaje de recargo de equivalencia que corresponde a un tipo de IVA
+    @param iva_porcentaje Tipo de IVA en porcentaje
+    @return Decimal Porcentaje de recargo (0 si el tipo no lleva recargo)
+    @version 1.0
+    """
+    return RECARGO_POR_IVA.get(normalizar_porcentaje(iva_porcentaje), Decimal('0'))
+
+class DesgloseImpuestos:
+    """
+    @brief Desglose de bases, IVA y recargo por tipo de IVA
+    @details tipos es una lista ordenada por tipo de IVA con un diccionario por tipo (iva_porcentaje, recargo_porcentaje,
+             base, iva, recargo). base, iva, recargo y total son las sumas de todos los tipos.
+    @version 1.0
+    """
+
+    def __init__(self):
+        self.acumulados = {}
+        self.tipos_calculados = None
+
+    def acumular(self, iva_porcentaje, base, iva):
+        """
+        @brief Suma una base y su cuota de IVA al tipo correspondiente
+        @param iva_porcentaje Tipo de IVA en porcentaje
+        @param base Base imponible
+        @param iva Cuota de IVA
+        @version 1.0
+        """
+        tipo = normalizar_porcentaje(iva_porcentaje)
+        acumulado = self.acumulados.get(tipo)
+        if acumulado is None:
+            acumulado = self.acumulados[tipo] = [Decimal('0'), Decimal('0')]
+        acumulado[0] += a_decimal(base)
+        acumulado[1] += a_decimal(iva)
+        self.tipos_calculados = None
+
+    @property
+    def tipos(self):
+        if self.tipos_calculados is not None:
+            return self.tipos_calculados
+        lineas = []
+        for tipo in sorted(self.acumulados):
+            base, iva = self.acumulados[tipo]
+            recargo_porcentaje = recargo_para_iva(tipo)
+            lineas.append({
+                'iva_porcentaje': tipo,
+                'recargo_porcentaje': recargo_porcentaje,
+                'base': redondear_importe(base),
+                'iva': redondear_importe(iva),
+                'recargo': redondear_importe(base * recargo_porcentaje / Decimal('100'))
+            })
+        self.tipos_calculados = lineas
+        return lineas
+
+    @property
+    def base(self):
+        return sum((linea['base'] for linea in self.tipos), Decimal('0.00'))
+
+    @property
+    def iva(self):
+        return sum((linea['iva'] for linea in self.tipos), Decimal('0.00'))
+
+    @property
+    def recargo(self):
+        return sum((linea['recargo'] for linea in self.tipos), Decimal('0.00'))
+
+    @property
+    def total(self):
+        return self.base + self.iva + self.recargo
+
+    def to_dict(self):
+        return {
+            'tipos': [
+                {
+                    'iva_porcentaje': float(linea['iva_porcentaje']),
+                    'recargo_porcentaje': float(linea['recargo_porcentaje']),
+                    'base': float(linea['base']),
+                    'iva': float(linea['iva']),
+                    'recargo': float(linea['recargo'])
+                }
+                for linea in self.tipos
+            ],
+            'base': float(self.base),
+            'iva': float(self.iva),
+            'recargo': float(self.recargo),
+            'total': float(self.total)
+        }
+
+def desglosar_items(items):
+    """
+    @brief Desglosa una lista de items de pedido en una sola pasada
+    @param items Items con subtotal_sin_iva, total_iva e iva_porcentaje
+    @return DesgloseImpuestos Desglose por tipo de IVA
+    @version 1.0
+    """
+    desglose = DesgloseImpuestos()
+    for item in items:
+        desglose.acumular(item.iva_porcentaje, item.subtotal_sin_iva, item.total_iva)
+    return desglose
+
+def desglosar_pedidos(pedido_ids):
+    """
+    @brief Desglosa muchos pedidos a la vez agregando en la base de datos
+    @details Una sola consulta agrupada por pedido y tipo de IVA, sin cargar los items como objetos.
+             Los pedidos sin items no aparecen en el resultado.
+    @param pedido_ids IDs de los pedidos
+    @return dict pedido_id -> DesgloseImpuestos
+    @version 1.0
+    """
+    pedido_ids = list(pedido_ids)
+    if not pedido_ids:
+        return {}
+
+    filas = db.session.query(
+        ItemPedido.pedido_id,
+        ItemPedido.iva_porcentaje,
+        func.sum(ItemPedido.subtotal_sin_iva),
+        func.sum(ItemPedido.total_iva)
+    ).filter(
+        ItemPedido.pedido_id.in_(pedido_ids)
+    ).group_by(
+        ItemPedido.pedido_id,
+        ItemPedido.iva_porcentaje
+    ).all()
+
+    desgloses = {}
+    for pedido_id, iva_porcentaje, base, iva in filas:
+        desglose = desgloses.get(pedido_id)
+        if desglose is None:
+            desglose = desgloses[pedido_id] = DesgloseImpuestos()
+        desglose.acumular(iva_porcentaje, base, iva)
+    return desgloses
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file numeracion_service.py
+@brief Servicio de numeración de pedidos y facturas del ERP de Mega Nevada
+@details Este módulo entrega los números de documento a partir de la tabla contadores_numeracion, con una fila por serie
+         y periodo. Cada petición es un único INSERT ... ON CONFLICT DO UPDATE ... RETURNING, así que el coste no depende
+         del número de documentos existentes. La fila del contador queda bloqueada hasta el commit de la transacción que
+         pide el número: las peticiones concurrentes esperan su turno y, si la transacción se deshace, el número también,
+         por lo que la numeración no tiene huecos ni duplicados.
+@author José David Sánchez Fernández
+@version 1.0
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+from datetime import datetime
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.models import db, ContadorNumeracion
+
+SERIE_PEDIDOS = 'P'
+SERIE_FACTURAS = 'VF'
+
+def reservar_numeros(serie, periodo, cantidad=1):
+    """
+    @brief Reserva un bloque de números consecutivos de una serie
+    @details Incrementa el contador de forma atómica y devuelve el rango reservado. Con cantidad mayor que 1 permite
+             numerar muchos documentos con una sola sentencia (por ejemplo en cargas masivas).
+    @param serie Serie del documento ('P', 'VF', ...)
+    @param periodo Periodo de la serie (día para pedidos, año para facturas)
+    @param cantidad Número de documentos a numerar
+    @return range Números reservados
+    @version 1.0
+    """
+    if cantidad < 1:
+        return range(0)
+
+    dialecto = db.session.get_bind().dialect.name
+    insert = postgresql_insert if dialecto == 'postgresql' else sqlite_insert
+
+    consulta = insert(ContadorNumeracion).values(
+        serie=serie,
+        periodo=periodo,
+        ultimo_numero=cantidad
+    )
+    consulta = consulta.on_conflict_do_update(
+        index_elements=['serie', 'periodo'],
+        set_={'ultimo_numero': ContadorNumeracion.__table__.c.ultimo_numero + cantidad}
+    ).returning(ContadorNumeracion.__table__.c.ultimo_numero)
+
+    ultimo = db.session.execute(consulta).scalar_one()
+    return range(ultimo - cantidad + 1, ultimo + 1)
+
+def periodo_pedidos(fecha=None):
+    """
+    @brief Periodo de numeración de pedidos (un contador por día)
+    @param fecha Fecha del pedido, por defecto ahora
+    @return str Periodo con formato YYYYMMDD
+    @version 1.0
+    """
+    return (fecha or datetime.now()).strftime('%Y%m%d')
+
+def formatear_numero_pedido(periodo, numero):
+    """
+    @brief Da formato P-YYYYMMDD-XXX a un número de pedido
+    @version 1.0
+    """
+    return f"{SERIE_PEDIDOS}-{periodo}-{numero:03d}"
+
+def periodo_facturas(fecha=None):
+    """
+    @brief Periodo de numeración de facturas (un contador por año)
+    @param fecha Fecha de la factura, por defecto ahora (UTC)
+    @return str Año con dos dígitos
+    @version 1.0
+    """
+    return (fecha or datetime.utcnow()).strftime('%y')
+
+def formatear_numero_factura(periodo, numero):
+    """
+    @brief Da formato VF/XXX/YY a un número de factura
+    @version 1.0
+    """
+    return f"{SERIE_FACTURAS}/{numero:03d}/{periodo}"
+
+def generar_numero_pedido():
+    """
+    @brief Genera el siguiente número de pedido del día
+    @details Formato P-YYYYMMDD-XXX
+    @return str Número de pedido único
+    @version 2.0
+    """
+    periodo = periodo_pedidos()
+    numero = reservar_numeros(SERIE_PEDIDOS, periodo)[0]
+    return formatear_numero_pedido(periodo, numero)
+
+def generar_numero_factura():
+    """
+    @brief Genera el siguiente número de factura del año
+    @details Formato VF/[número secuencial]/[año de 2 dígitos]
+    @return str Número de factura único
+    @version 2.0
+    """
+    periodo = periodo_facturas()
+    numero = reservar_numeros(SERIE_FACTURAS, periodo)[0]
+    return formatear_numero_factura(periodo, numero)
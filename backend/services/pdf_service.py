@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file pdf_service.py
+@brief Generación de las facturas en PDF del ERP de Mega Nevada
+@details Genera en el servidor, con reportlab, el mismo contenido que muestra facturas/detalle.html: cabecera de la
+         empresa, datos del cliente y de la factura, líneas del pedido, desglose de IVA y recargo e importe total.
+         Los PDF se guardan en disco, en PDF_CACHE_DIR, con el nombre factura_<id>_<huella>.pdf, donde la huella es un
+         resumen de los datos que se imprimen: mientras la factura no cambia, cada descarga sirve el fichero ya generado
+         y, si cambia cualquier dato impreso, la huella es otra, se genera de nuevo y se borran los de huellas
+         anteriores. Cuando actualizar_factura_automatica cambia el total, los PDF anteriores de la factura se borran al
+         confirmar la transacción. datos_factura() devuelve solo tipos básicos para poder generar el PDF fuera de la
+         sesión.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
+from models.models import db
+from services.impuestos_service import desglosar_items
+
+# Clave de db.session.info donde se anotan las facturas cuyos PDF se borran al confirmar
+CLAVE_PDF_SESION = 'pdf_facturas_invalidar'
+
+# Datos fijos de la empresa, los mismos de la cabecera de facturas/detalle.html
+EMPRESA = {
+    'nombre': 'MEGA NEVADA, S.L.',
+    'lineas': [
+        'C/ CUESTA BLANQUILLA, Nº 21/BLOQ. 3/PTAL. 2/1º E',
+        '18110 / LAS GABIAS / GRANADA',
+        'TEL. 601610843 / EMAIL. fernando_enriquez65@outlook.com',
+        'N.I.F. B-06.956.007'
+    ]
+}
+
+# Días hasta el vencimiento (forma de pago a 30 días)
+DIAS_VENCIMIENTO = 30
+
+def importe(valor):
+    """
+    @brief Importe con dos decimales, como en la vista HTML
+    @version 1.0
+    """
+    return "%.2f" % valor
+
+def datos_factura(factura):
+    """
+    @brief Datos que se imprimen en el PDF de una factura
+    @details Todo se devuelve ya formateado como texto, de modo que el diccionario se puede serializar para calcular la
+             huella y pasar a otro proceso sin depender de la sesión de base de datos.
+    @param factura Factura con su pedido, cliente e items
+    @return dict
+    @version 1.0
+    """
+    pedido = factura.pedido
+    cliente = pedido.cliente
+    desglose = desglosar_items(pedido.items)
+
+    lineas = []
+    for item in pedido.items:
+        producto = item.producto
+        detalle = [producto.nombre]
+        if producto.lote:
+            detalle.append(f'LOTE: {producto.lote}')
+        if producto.fecha_caducidad:
+            detalle.append(f"CAD: {producto.fecha_caducidad.strftime('%Y/%m/%d')}")
+        lineas.append({
+            'codigo': producto.codigo,
+            'marca': producto.marca or 'PRODUCTO',
+            'detalle': detalle,
+            'cantidad': str(item.cantidad),
+            'precio': importe(item.precio_unitario_sin_iva),
+            'importe': importe(item.subtotal_sin_iva),
+            'iva': "%.0f%%" % item.iva_porcentaje
+        })
+
+    return {
+        'id': factura.id,
+        'numero_factura': factura.numero_factura,
+        'fecha': factura.fecha_factura.strftime('%d/%m/%y'),
+        'vencimiento': (factura.fecha_factura + timedelta(days=DIAS_VENCIMIENTO)).strftime('%d/%m/%y'),
+        'cliente': {
+            'nombre': cliente.nombre_fiscal or cliente.nombre,
+            'direccion': cliente.direccion or '',
+            'codigo': cliente.codigo,
+            'cif': cliente.cif or ''
+        },
+        'lineas': lineas,
+        'tipos': [
+            {
+                'base': importe(tipo['base']),
+                'iva_porcentaje': "%.0f%%" % tipo['iva_porcentaje'],
+                'recargo_porcentaje': "%.2f%%" % tipo['recargo_porcentaje'],
+                'iva': importe(tipo['iva']),
+                'recargo': importe(tipo['recargo'])
+            }
+            for tipo in desglose.tipos if tipo['base'] > 0
+        ],
+        'total': importe(desglose.total)
+    }
+
+def huella_datos(datos):
+    """
+    @brief Resumen de los datos impresos de una factura
+    @param datos Diccionario de datos_factura()
+    @return str 16 caracteres hexadecimales
+    @version 1.0
+    """
+    contenido = json.dumps(datos, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:16]
+
+def renderizar_pdf(datos):
+    """
+    @brief Genera el PDF de una factura
+    @details El PDF se genera en modo invariante (sin fecha de creación ni identificador aleatorio), así los mismos datos
+             producen siempre los mismos bytes.
+    @param datos Diccionario de datos_factura()
+    @return bytes Documento PDF
+    @version 1.0
+    """
+    estilos = getSampleStyleSheet()
+    normal = ParagraphStyle('factura', parent=estilos['Normal'], fontSize=8, leading=10)
+    negrita = ParagraphStyle('factura_negrita', parent=normal, fontName='Helvetica-Bold')
+    empresa = ParagraphStyle('empresa', parent=estilos['Heading3'], textColor=colors.HexColor('#0d6efd'), spaceAfter=2)
+    total = ParagraphStyle('total', parent=estilos['Heading3'], alignment=1)
+
+    def parrafo(texto, estilo=normal):
+        return Paragraph(texto.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;'), estilo)
+
+    cliente = datos['cliente']
+    cabecera = Table([[
+        [parrafo(EMPRESA['nombre'], empresa)] + [parrafo(linea) for linea in EMPRESA['lineas']],
+        [parrafo(cliente['nombre'], negrita)] + ([parrafo(cliente['direccion'])] if cliente['direccion'] else [])
+    ]], colWidths=[95 * mm, 85 * mm])
+    cabecera.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'TOP')]))
+
+    datos_cabecera = Table([
+        ['FECHA', datos['fecha'], 'Nº FACTURA', datos['numero_factura']],
+        ['CLIENTE', cliente['codigo'], 'N.I.F.', cliente['cif']],
+        ['FORMA DE PAGO', f'{DIAS_VENCIMIENTO} DÍAS', 'VENCIMIENTO', datos['vencimiento']],
+        ['Nº HOJA: 1', '', '', '']
+    ], colWidths=[30 * mm, 30 * mm, 30 * mm, 30 * mm], hAlign='LEFT')
+    datos_cabecera.setStyle(TableStyle([
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('FONTNAME', (0, 0), (0, 2), 'Helvetica-Bold'),
+        ('FONTNAME', (2, 0), (2, 2), 'Helvetica-Bold'),
+        ('SPAN', (0, 3), (-1, 3)),
+        ('ALIGN', (0, 3), (-1, 3), 'CENTER'),
+        ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
+    ]))
+
+    filas = [['CODIGO', 'ARTICULO', 'UNID', 'PVL/PVF', 'IMPORTE', 'IVA']]
+    for linea in datos['lineas']:
+        filas.append([
+            parrafo(linea['codigo'], negrita),
+            [parrafo(linea['marca'], negrita)] + [parrafo(texto) for texto in linea['detalle']],
+            linea['cantidad'], linea['precio'], linea['importe'], linea['iva']
+        ])
+    productos = Table(filas, colWidths=[22 * mm, 88 * mm, 16 * mm, 20 * mm, 20 * mm, 14 * mm], repeatRows=1)
+    productos.setStyle(TableStyle([
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('VALIGN', (0, 1), (-1, -1), 'TOP'),
+        ('ALIGN', (2, 1), (2, -1), 'CENTER'),
+        ('ALIGN', (3, 1), (4, -1), 'RIGHT'),
+        ('ALIGN', (5, 1), (5, -1), 'CENTER'),
+    ]))
+
+    impuestos = Table(
+        [['BASE I.V.A', '% I.V.A', '% REC', 'IVA', 'REC']] +
+        [[tipo['base'], tipo['iva_porcentaje'], tipo['recargo_porcentaje'], tipo['iva'], tipo['recargo']]
+         for tipo in datos['tipos']],
+        colWidths=[18 * mm, 14 * mm, 14 * mm, 14 * mm, 14 * mm], hAlign='RIGHT'
+    )
+    impuestos.setStyle(TableStyle([
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+    ]))
+
+    resultado = BytesIO()
+    documento = SimpleDocTemplate(
+        resultado, pagesize=A4, invariant=True,
+        leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=15 * mm,
+        title=f"Factura {datos['numero_factura']}", author=EMPRESA['nombre']
+    )
+    documento.build([
+        cabecera, Spacer(1, 6 * mm),
+        datos_cabecera, Spacer(1, 4 * mm),
+        Table([['']], colWidths=[180 * mm], style=[('LINEABOVE', (0, 0), (-1, 0), 2, colors.black)]),
+        productos, Spacer(1, 4 * mm),
+        impuestos, Spacer(1, 4 * mm),
+        Table([[Paragraph(f"IMPORTE TOTAL<br/>{datos['total']} €", total)]], colWidths=[74 * mm], hAlign='RIGHT',
+              style=[('BOX', (0, 0), (-1, -1), 1, colors.black)])
+    ])
+    return resultado.getvalue()
+
+def ruta_pdf(directorio, factura_id, huella):
+    """
+    @brief Ruta del PDF guardado de una factura con una huella dada
+    @version 1.0
+    """
+    return os.path.join(directorio, f'factura_{factura_id}_{huella}.pdf')
+
+def guardar_pdf(directorio, datos):
+    """
+    @brief Devuelve el PDF guardado de unos datos de factura y lo genera si no existe
+    @details El fichero se escribe primero con otro nombre y se renombra al terminar, de modo que una descarga
+             simultánea nunca lee un PDF a medias. Después se borran los PDF de la factura con otra huella: quedaron
+             obsoletos al cambiar algún dato impreso (por ejemplo el nombre del cliente o de un producto) sin pasar por
+             anotar_invalidacion_pdf(). No usa la aplicación ni la base de datos.
+    @param directorio Directorio de la caché de PDF
+    @param datos Diccionario de datos_factura()
+    @return tuple (ruta del PDF, huella)
+    @version 1.1
+    """
+    huella = huella_datos(datos)
+    ruta = ruta_pdf(directorio, datos['id'], huella)
+    if os.path.exists(ruta):
+        return ruta, huella
+
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as fichero:
+            fichero.write(renderizar_pdf(datos))
+        os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    borrar_pdf_factura(directorio, datos['id'], conservar=ruta)
+    return ruta, huella
+
+def directorio_pdf():
+    """
+    @brief Directorio de la caché de PDF de la aplicación actual
+    @version 1.0
+    """
+    return current_app.config['PDF_CACHE_DIR']
+
+def obtener_pdf_factura(factura):
+    """
+    @brief PDF de una factura, del disco si ya se generó con los mismos datos
+    @param factura Factura con su pedido, cliente e items
+    @return tuple (ruta del PDF, huella)
+    @version 1.0
+    """
+    return guardar_pdf(directorio_pdf(), datos_factura(factura))
+
+def borrar_pdf_factura(directorio, factura_id, conservar=None):
+    """
+    @brief Borra todos los PDF guardados de una factura
+    @param directorio Directorio de la caché de PDF
+    @param factura_id ID de la factura
+    @param conservar Ruta de un PDF de la factura que no se borra
+    @return int Ficheros borrados
+    @version 1.1
+    """
+    borrados = 0
+    for ruta in glob.glob(os.path.join(directorio, f'factura_{factura_id}_*.pdf')):
+        if ruta == conservar:
+            continue
+        try:
+            os.remove(ruta)
+            borrados += 1
+        except FileNotFoundError:
+            pass
+    return borrados
+
+def anotar_invalidacion_pdf(factura_id):
+    """
+    @brief Anota que los PDF de una factura se borren cuando se confirme la transacción en curso
+    @param factura_id ID de la factura
+    @version 1.0
+    """
+    db.session.info.setdefault(CLAVE_PDF_SESION, set()).add(factura_id)
+
+def confirmar_invalidaciones_pdf(sesion):
+    """
+    @brief Borra los PDF de las facturas anotadas por la transacción confirmada
+    @version 1.0
+    """
+    facturas = sesion.info.pop(CLAVE_PDF_SESION, None)
+    if not facturas or not has_app_context():
+        return
+    directorio = directorio_pdf()
+    for factura_id in facturas:
+        borrar_pdf_factura(directorio, factura_id)
+
+def descartar_invalidaciones_pdf(sesion):
+    """
+    @brief Olvida las invalidaciones de una transacción deshecha
+    @version 1.0
+    """
+    sesion.info.pop(CLAVE_PDF_SESION, None)
+
+def iniciar_pdf_facturas(app):
+    """
+    @brief Registra (una sola vez) los eventos de sesión que borran los PDF de las facturas modificadas
+    @param app Instancia de Flask
+    @version 1.0
+    """
+    if not event.contains(Session, 'after_commit', confirmar_invalidaciones_pdf):
+        event.listen(Session, 'after_commit', confirmar_invalidaciones_pdf)
+        event.listen(Session, 'after_rollback', descartar_invalidaciones_pdf)
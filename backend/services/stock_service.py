@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file stock_service.py
+@brief Servicio de reserva de stock del ERP de Mega Nevada
+@details Este módulo centraliza las entradas y salidas de stock de los pedidos. Cada movimiento es un UPDATE condicional
+         en la base de datos (solo descuenta si queda stock suficiente), de modo que dos pedidos simultáneos sobre el
+         mismo producto nunca pueden vender más unidades de las que hay. Los productos se actualizan siempre en orden
+         de id para que transacciones concurrentes bloqueen las filas en el mismo orden y no se produzcan interbloqueos.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+from sqlalchemy import update
+from models.models import db, Producto
+from services.eventos_service import anotar_stock_bajo
+
+# Clave de db.session.info donde se acumulan las variaciones de stock de la transacción en curso
+CLAVE_DELTAS_SESION = 'deltas_stock'
+
+class StockInsuficienteError(Exception):
+    """
+    @brief Error lanzado cuando uno o varios productos no tienen stock suficiente
+    @details Contiene todos los productos con faltante del carrito, no solo el primero.
+    @version 1.0
+    """
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        detalle = ', '.join(
+            f"{f['nombre']} (solicitado: {f['solicitado']}, disponible: {f['disponible']})"
+            for f in faltantes
+        )
+        super().__init__(f'Stock insuficiente para {detalle}')
+
+def agrupar_cantidades(lineas):
+    """
+    @brief Suma las cantidades por producto
+    @param lineas Iterable de tuplas (producto_id, cantidad)
+    @return dict producto_id -> cantidad total
+    @version 1.0
+    """
+    cantidades = {}
+    for producto_id, cantidad in lineas:
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    return cantidades
+
+def ajustar_stock(deltas):
+    """
+    @brief Aplica variaciones netas de stock en una sola pasada
+    @details Un delta positivo descuenta unidades con un UPDATE condicional (solo si queda stock suficiente) y uno negativo
+             las devuelve. Los productos se recorren en orden de id. Si algún descuento no es posible se siguen comprobando
+             los demás y al final se lanza StockInsuficienteError con todos los faltantes; el llamador debe hacer rollback
+             para deshacer lo ya aplicado. Las variaciones aplicadas se anotan en db.session.info[CLAVE_DELTAS_SESION]
+             hasta el commit o rollback de la sesión. Los productos que quedan en su stock mínimo o por debajo generan el
+             evento stock_bajo.
+    @param deltas dict producto_id -> unidades a descontar (negativo para devolver)
+    @exception StockInsuficienteError Si uno o más productos no tienen stock suficiente
+    @version 1.2
+    """
+    sin_stock = []
+
+    for producto_id in sorted(deltas):
+        delta = deltas[producto_id]
+        if delta == 0:
+            continue
+
+        if delta > 0:
+            consulta = update(Producto).where(Producto.id == producto_id, Producto.stock >= delta)
+        else:
+            consulta = update(Producto).where(Producto.id == producto_id)
+
+        resultado = db.session.execute(
+            consulta.values(stock=Producto.stock - delta).execution_options(synchronize_session='fetch')
+        )
+
+        if delta > 0 and resultado.rowcount == 0:
+            sin_stock.append(producto_id)
+
+    if sin_stock:
+        productos = db.session.query(Producto.id, Producto.nombre, Producto.stock).filter(
+            Producto.id.in_(sin_stock)
+        ).all()
+        raise StockInsuficienteError([
+            {
+                'producto_id': producto_id,
+                'nombre': nombre,
+                'solicitado': deltas[producto_id],
+                'disponible': stock or 0
+            }
+            for producto_id, nombre, stock in sorted(productos)
+        ])
+
+    # Variaciones pendientes de commit, para quien mantenga copias del stock en memoria (autocompletado)
+    pendientes = db.session.info.setdefault(CLAVE_DELTAS_SESION, {})
+    for producto_id, delta in deltas.items():
+        if delta:
+            pendientes[producto_id] = pendientes.get(producto_id, 0) + delta
+
+    anotar_stock_bajo(deltas)
+
+def reservar_stock(cantidades):
+    """
+    @brief Descuenta stock para un carrito completo
+    @param cantidades dict producto_id -> cantidad a descontar
+    @exception StockInsuficienteError Si uno o más productos no tienen stock suficiente
+    @version 1.0
+    """
+    ajustar_stock(cantidades)
+
+def liberar_stock(cantidades):
+    """
+    @brief Devuelve al stock las cantidades indicadas
+    @param cantidades dict producto_id -> cantidad a devolver
+    @version 1.0
+    """
+    ajustar_stock({producto_id: -cantidad for producto_id, cantidad in cantidades.items()})
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file ventas_service.py
+@brief Acumulado diario de ventas del ERP de Mega Nevada
+@details Las consultas de ventas leen la tabla ventas_diarias (una fila por día, cliente, producto y tipo de IVA con
+         unidades, base, IVA y recargo) en lugar de agregar todos los items de pedido. Las rutas de pedidos calculan las
+         líneas de venta del pedido antes y después de cada cambio y aplican solo la diferencia con un INSERT ... ON
+         CONFLICT DO UPDATE que suma sobre la fila existente, dentro de la misma transacción que el pedido; las filas que
+         quedan a cero se borran. El comando reconstruir-ventas-diarias vuelve a generar la tabla completa a partir de
+         los items.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+from decimal import Decimal
+from sqlalchemy import func, select, delete, insert, case, extract, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.models import db, Pedido, ItemPedido, VentaDiaria, redondear_importe
+from services.impuestos_service import RECARGO_POR_IVA, recargo_para_iva, a_decimal
+
+# Agrupaciones que admite resumen_ventas
+AGRUPACIONES_VENTAS = ('dia', 'mes', 'cliente', 'producto', 'iva')
+
+def clave_venta(fecha, cliente_id, producto_id, iva_porcentaje):
+    """
+    @brief Clave de una fila de ventas_diarias
+    @details El tipo de IVA se guarda con dos decimales, igual que la columna, para que 21 y 21.00 sean la misma fila.
+    @return tuple (fecha, cliente_id, producto_id, iva_porcentaje)
+    @version 1.0
+    """
+    return (fecha, cliente_id, producto_id, a_decimal(iva_porcentaje).quantize(Decimal('0.01')))
+
+def lineas_venta(*pedidos):
+    """
+    @brief Aportación de uno o varios pedidos a ventas_diarias
+    @details Los pedidos deben tener fecha_pedido (es decir, estar ya volcados con flush) y sus items calculados.
+    @param pedidos Pedidos a sumar
+    @return dict Clave de clave_venta() -> [unidades, base, iva, recargo]
+    @version 1.0
+    """
+    lineas = {}
+    for pedido in pedidos:
+        fecha = pedido.fecha_pedido.date()
+        for item in pedido.items:
+            base = a_decimal(item.subtotal_sin_iva)
+            acumulado = lineas.setdefault(
+                clave_venta(fecha, pedido.cliente_id, item.producto_id, item.iva_porcentaje),
+                [0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00')]
+            )
+            acumulado[0] += item.cantidad
+            acumulado[1] += base
+            acumulado[2] += a_decimal(item.total_iva)
+            acumulado[3] += redondear_importe(base * recargo_para_iva(item.iva_porcentaje) / Decimal('100'))
+    return lineas
+
+def actualizar_ventas(anteriores=None, nuevas=None):
+    """
+    @brief Aplica a ventas_diarias la diferencia entre las líneas de venta anteriores y las nuevas de un cambio
+    @details Alta: solo nuevas. Baja: solo anteriores. Modificación: las dos, calculadas antes y después del cambio.
+             Las claves sin variación no se escriben y el resto se suman en una única sentencia. Después se borran las
+             filas de esas claves que han quedado a cero (el pedido era la única venta de ese día, cliente, producto e
+             IVA), para que la tabla tenga las mismas filas que reconstruir_ventas().
+    @param anteriores Líneas de lineas_venta() antes del cambio
+    @param nuevas Líneas de lineas_venta() después del cambio
+    @version 1.1
+    """
+    diferencias = {}
+    for signo, lineas in ((-1, anteriores or {}), (1, nuevas or {})):
+        for clave, valores in lineas.items():
+            acumulado = diferencias.setdefault(clave, [0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00')])
+            for posicion, valor in enumerate(valores):
+                acumulado[posicion] += signo * valor
+
+    filas = [
+        {
+            'fecha': fecha,
+            'cliente_id': cliente_id,
+            'producto_id': producto_id,
+            'iva_porcentaje': iva_porcentaje,
+            'unidades': unidades,
+            'base': base,
+            'iva': iva,
+            'recargo': recargo
+        }
+        for (fecha, cliente_id, producto_id, iva_porcentaje), (unidades, base, iva, recargo) in diferencias.items()
+        if unidades or base or iva or recargo
+    ]
+    if not filas:
+        return
+
+    dialecto = db.session.get_bind().dialect.name
+    insertar = postgresql_insert if dialecto == 'postgresql' else sqlite_insert
+
+    consulta = insertar(VentaDiaria).values(filas)
+    db.session.execute(consulta.on_conflict_do_update(
+        index_elements=['fecha', 'cliente_id', 'producto_id', 'iva_porcentaje'],
+        set_={
+            columna: VentaDiaria.__table__.c[columna] + consulta.excluded[columna]
+            for columna in ('unidades', 'base', 'iva', 'recargo')
+        }
+    ))
+
+    claves = [(fila['fecha'], fila['cliente_id'], fila['producto_id'], fila['iva_porcentaje']) for fila in filas]
+    db.session.execute(delete(VentaDiaria).where(
+        tuple_(VentaDiaria.fecha, VentaDiaria.cliente_id, VentaDiaria.producto_id, VentaDiaria.iva_porcentaje).in_(claves),
+        VentaDiaria.unidades == 0,
+        VentaDiaria.base == 0,
+        VentaDiaria.iva == 0,
+        VentaDiaria.recargo == 0
+    ))
+
+def reconstruir_ventas():
+    """
+    @brief Vuelve a generar ventas_diarias a partir de los items de todos los pedidos
+    @details Borra la tabla y la rellena con un único INSERT ... SELECT agrupado. El recargo se redondea por línea, igual
+             que en lineas_venta(), para que el resultado coincida con el mantenimiento incremental.
+    @return int Filas generadas
+    @version 1.0
+    """
+    fecha = func.date(Pedido.fecha_pedido)
+    porcentaje_recargo = case(
+        *((ItemPedido.iva_porcentaje == iva, recargo) for iva, recargo in RECARGO_POR_IVA.items()),
+        else_=0
+    )
+
+    origen = select(
+        fecha,
+        Pedido.cliente_id,
+        ItemPedido.producto_id,
+        ItemPedido.iva_porcentaje,
+        func.sum(ItemPedido.cantidad),
+        func.sum(ItemPedido.subtotal_sin_iva),
+        func.sum(ItemPedido.total_iva),
+        func.sum(func.round(ItemPedido.subtotal_sin_iva * porcentaje_recargo / 100, 2))
+    ).join(Pedido, ItemPedido.pedido_id == Pedido.id).group_by(
+        fecha, Pedido.cliente_id, ItemPedido.producto_id, ItemPedido.iva_porcentaje
+    )
+
+    db.session.execute(delete(VentaDiaria))
+    resultado = db.session.execute(insert(VentaDiaria).from_select(
+        ['fecha', 'cliente_id', 'producto_id', 'iva_porcentaje', 'unidades', 'base', 'iva', 'recargo'],
+        origen
+    ))
+    return resultado.rowcount
+
+def resumen_ventas(agrupar='dia', desde=None, hasta=None, cliente_id=None, producto_id=None):
+    """
+    @brief Ventas acumuladas leídas de ventas_diarias
+    @param agrupar 'dia', 'mes', 'cliente', 'producto' o 'iva'
+    @param desde Primer día incluido (date) o None
+    @param hasta Último día incluido (date) o None
+    @param cliente_id Limitar a un cliente
+    @param producto_id Limitar a un producto
+    @return list Un diccionario por grupo con unidades, base, iva, recargo y total, ordenados por el grupo
+    @exception ValueError Si la agrupación no es válida
+    @version 1.0
+    """
+    if agrupar not in AGRUPACIONES_VENTAS:
+        raise ValueError(f"Agrupación no válida: {agrupar}")
+
+    grupos = {
+        'dia': (VentaDiaria.fecha,),
+        'mes': (extract('year', VentaDiaria.fecha).label('anio'), extract('month', VentaDiaria.fecha).label('mes')),
+        'cliente': (VentaDiaria.cliente_id,),
+        'producto': (VentaDiaria.producto_id,),
+        'iva': (VentaDiaria.iva_porcentaje,),
+    }[agrupar]
+
+    consulta = select(
+        *grupos,
+        func.sum(VentaDiaria.unidades).label('unidades'),
+        func.sum(VentaDiaria.base).label('base'),
+        func.sum(VentaDiaria.iva).label('iva'),
+        func.sum(VentaDiaria.recargo).label('recargo')
+    ).group_by(*grupos).order_by(*grupos)
+
+    if desde:
+        consulta = consulta.where(VentaDiaria.fecha >= desde)
+    if hasta:
+        consulta = consulta.where(VentaDiaria.fecha <= hasta)
+    if cliente_id:
+        consulta = consulta.where(VentaDiaria.cliente_id == cliente_id)
+    if producto_id:
+        consulta = consulta.where(VentaDiaria.producto_id == producto_id)
+
+    resumen = []
+    for fila in db.session.execute(consulta).mappings():
+        if agrupar == 'dia':
+            grupo = {'fecha': fila['fecha'].isoformat()}
+        elif agrupar == 'mes':
+            grupo = {'periodo': f"{int(fila['anio']):04d}-{int(fila['mes']):02d}"}
+        elif agrupar == 'iva':
+            grupo = {'iva_porcentaje': float(fila['iva_porcentaje'])}
+        else:
+            grupo = {f'{agrupar}_id': fila[f'{agrupar}_id']}
+
+        base, iva, recargo = (a_decimal(fila[campo]) for campo in ('base', 'iva', 'recargo'))
+        resumen.append({
+            **grupo,
+            'unidades': int(fila['unidades']),
+            'base': float(base),
+            'iva': float(iva),
+            'recargo': float(recargo),
+            'total': float(base + iva + recargo)
+        })
+    return resumen
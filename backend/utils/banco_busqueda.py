@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file banco_busqueda.py
+@brief Catálogo sintético y medición de la búsqueda del ERP de Mega Nevada
+@details Lo usan los comandos flask sembrar-catalogo-prueba y medir-busqueda para comprobar en local que la búsqueda al
+         teclear (buscar) y la búsqueda global (busqueda_global) siguen en pocos milisegundos con un catálogo de cientos
+         de miles de productos. Los registros generados llevan el prefijo PREFIJO_PRUEBA en el código, para poder
+         borrarlos sin tocar los datos reales, y se generan con una semilla fija, así que dos siembras iguales producen el
+         mismo catálogo.
+@author José David Sánchez Fernández
+@version 1.0
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import random
+import statistics
+import time
+from decimal import Decimal
+from sqlalchemy import insert, delete, text
+from models.models import db, Cliente, Producto
+from services.busqueda_service import buscar, busqueda_global, es_postgresql
+from utils.helpers import normalizar_busqueda
+
+# Prefijo del código de los clientes y productos generados
+PREFIJO_PRUEBA = 'BX'
+
+# Filas por sentencia INSERT al sembrar
+LOTE_SIEMBRA = 5000
+
+PRINCIPIOS = [
+    'Ibuprofeno', 'Paracetamol', 'Amoxicilina', 'Omeprazol', 'Metamizol', 'Dexketoprofeno', 'Enantyum', 'Loratadina',
+    'Cetirizina', 'Simvastatina', 'Atorvastatina', 'Enalapril', 'Losartán', 'Metformina', 'Salbutamol', 'Diazepam',
+    'Lorazepam', 'Sertralina', 'Fluoxetina', 'Tramadol', 'Naproxeno', 'Diclofenaco', 'Azitromicina', 'Ciprofloxacino',
+    'Pantoprazol', 'Bisoprolol', 'Furosemida', 'Levotiroxina', 'Prednisona', 'Ácido acetilsalicílico'
+]
+FORMAS = ['comprimidos', 'cápsulas', 'sobres', 'jarabe', 'gel', 'crema', 'solución oral', 'colirio', 'supositorios']
+DOSIS = ['5 mg', '10 mg', '20 mg', '40 mg', '100 mg', '200 mg', '400 mg', '500 mg', '600 mg', '1 g']
+MARCAS = ['Cinfa', 'Normon', 'Kern', 'Stada', 'Teva', 'Sandoz', 'Mylan', 'Pensa', 'Ratiopharm', 'Aristo', 'Bayer']
+PROVEEDORES = ['Cofares', 'Hefame', 'Bidafarma', 'Alliance Healthcare', 'Fedefarma']
+NOMBRES_FARMACIA = ['Farmacia', 'Farmacia Ldo.', 'Farmacia Lda.', 'Parafarmacia', 'Botica']
+APELLIDOS = [
+    'García', 'Fernández', 'González', 'Rodríguez', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez', 'Martín',
+    'Jiménez', 'Ruiz', 'Hernández', 'Díaz', 'Moreno', 'Muñoz', 'Álvarez', 'Romero', 'Alonso', 'Gutiérrez', 'Núñez'
+]
+POBLACIONES = ['Granada', 'Las Gabias', 'Armilla', 'Motril', 'Loja', 'Baza', 'Guadix', 'Maracena', 'Almuñécar']
+
+# Lo que se va escribiendo en el buscador, pulsación a pulsación
+TEXTOS_MEDICION = ['ibu', 'ibupro', 'ibuprofeno 600', 'parac', 'amoxi', 'omepra 20', 'cinfa', 'normon', 'sertra',
+                   'garcia', 'farmacia nunez', 'granada', 'BX0001', '847000']
+
+def filas_productos(cantidad, aleatorio):
+    """
+    @brief Genera las filas de productos sintéticos, por lotes
+    @param cantidad Número de productos
+    @param aleatorio random.Random con la semilla de la siembra
+    @return Generador de listas de diccionarios para insert(Producto)
+    @version 1.0
+    """
+    lote = []
+    for numero in range(cantidad):
+        principio = aleatorio.choice(PRINCIPIOS)
+        marca = aleatorio.choice(MARCAS)
+        fila = {
+            'codigo': f'{PREFIJO_PRUEBA}{numero:07d}',
+            'nombre': f'{principio} {marca} {aleatorio.choice(DOSIS)} {aleatorio.choice(FORMAS)}',
+            'descripcion': f'{principio} {aleatorio.choice(FORMAS)} - envase {aleatorio.randint(1, 60)} unidades',
+            'precio': Decimal(aleatorio.randint(100, 9000)) / 100,
+            'categoria': 'Medicamento',
+            'stock': aleatorio.randint(0, 500),
+            'stock_minimo': 5,
+            'activo': aleatorio.random() > 0.05,
+            # El código nacional es único y de seis dígitos: solo los primeros 400.000 productos lo tienen
+            'codigo_nacional': str(600000 + numero) if numero < 400000 else None,
+            'num_referencia': f'REF-{numero:07d}',
+            'nombre_proveedor': aleatorio.choice(PROVEEDORES),
+            'marca': marca,
+            'iva_porcentaje': Decimal('4'),
+        }
+        fila['texto_busqueda'] = normalizar_busqueda(*(fila.get(campo) for campo in Producto.CAMPOS_BUSQUEDA))
+        lote.append(fila)
+        if len(lote) >= LOTE_SIEMBRA:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def filas_clientes(cantidad, aleatorio):
+    """
+    @brief Genera las filas de clientes sintéticos, por lotes
+    @param cantidad Número de clientes
+    @param aleatorio random.Random con la semilla de la siembra
+    @return Generador de listas de diccionarios para insert(Cliente)
+    @version 1.0
+    """
+    lote = []
+    for numero in range(cantidad):
+        titular = f'{aleatorio.choice(APELLIDOS)} {aleatorio.choice(APELLIDOS)}'
+        poblacion = aleatorio.choice(POBLACIONES)
+        fila = {
+            'codigo': f'{PREFIJO_PRUEBA}{numero:06d}',
+            'nombre': f'{aleatorio.choice(NOMBRES_FARMACIA)} {titular}',
+            'direccion': f'C/ Real {aleatorio.randint(1, 200)}, {poblacion}',
+            'telefono': f'958{aleatorio.randint(100000, 999999)}',
+            'activo': True,
+            'nombre_fiscal': f'{titular} {poblacion} S.L.',
+            'cif': f'B{aleatorio.randint(10000000, 99999999)}',
+            'contacto': aleatorio.choice(APELLIDOS),
+        }
+        fila['texto_busqueda'] = normalizar_busqueda(*(fila.get(campo) for campo in Cliente.CAMPOS_BUSQUEDA))
+        lote.append(fila)
+        if len(lote) >= LOTE_SIEMBRA:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def borrar_catalogo_prueba():
+    """
+    @brief Borra los clientes y productos generados (los que tienen el prefijo de prueba)
+    @details Los registros sintéticos no se usan en pedidos, así que se pueden borrar directamente.
+    @return tuple (productos borrados, clientes borrados)
+    @version 1.0
+    """
+    productos = db.session.execute(delete(Producto).where(Producto.codigo.like(f'{PREFIJO_PRUEBA}%'))).rowcount
+    clientes = db.session.execute(delete(Cliente).where(Cliente.codigo.like(f'{PREFIJO_PRUEBA}%'))).rowcount
+    db.session.commit()
+    return productos, clientes
+
+def sembrar_catalogo_prueba(productos, clientes, semilla=2025):
+    """
+    @brief Genera un catálogo sintético de productos y clientes
+    @details Borra antes los registros de prueba de una siembra anterior. Las filas se insertan por lotes con INSERT de
+             varias filas, calculando texto_busqueda igual que los eventos del modelo; en PostgreSQL los triggers rellenan
+             busqueda_tsv y al final se ejecuta ANALYZE para que el planificador conozca el nuevo tamaño de las tablas.
+    @param productos Número de productos
+    @param clientes Número de clientes
+    @param semilla Semilla del generador
+    @return float Segundos empleados
+    @version 1.0
+    """
+    inicio = time.perf_counter()
+    borrar_catalogo_prueba()
+    aleatorio = random.Random(semilla)
+
+    for modelo, lotes in ((Producto, filas_productos(productos, aleatorio)), (Cliente, filas_clientes(clientes, aleatorio))):
+        insertados = 0
+        for lote in lotes:
+            db.session.execute(insert(modelo), lote)
+            db.session.commit()
+            insertados += len(lote)
+            print(f"{modelo.__tablename__}: {insertados} registros de prueba")
+
+    if es_postgresql():
+        db.session.execute(text('ANALYZE clientes'))
+        db.session.execute(text('ANALYZE productos'))
+        db.session.commit()
+    return time.perf_counter() - inicio
+
+def cronometrar(funcion, repeticiones):
+    """
+    @brief Tiempos de una función en milisegundos
+    @param funcion Función sin argumentos
+    @param repeticiones Veces que se ejecuta (más una previa que no se cuenta)
+    @return dict p50, p95 y max en milisegundos
+    @version 1.0
+    """
+    funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        db.session.expunge_all()
+    tiempos.sort()
+    return {
+        'p50': statistics.median(tiempos),
+        'p95': tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))],
+        'max': tiempos[-1]
+    }
+
+def medir_busqueda(repeticiones=50, textos=TEXTOS_MEDICION):
+    """
+    @brief Mide buscar() de productos y clientes y busqueda_global() con cada texto
+    @param repeticiones Ejecuciones por texto y función
+    @param textos Textos buscados
+    @return list Diccionarios con funcion, texto, resultados, p50, p95 y max (ms)
+    @version 1.0
+    """
+    mediciones = []
+    for texto in textos:
+        funciones = (
+            ('buscar(Producto)', lambda: buscar(Producto, texto, limite=10)),
+            ('buscar(Cliente)', lambda: buscar(Cliente, texto, limite=10)),
+            ('busqueda_global', lambda: busqueda_global(texto, limite=5)),
+        )
+        for nombre, funcion in funciones:
+            mediciones.append({
+                'funcion': nombre,
+                'texto': texto,
+                'resultados': len(funcion()),
+                **cronometrar(funcion, repeticiones)
+            })
+    return mediciones
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file campos.py
+@brief Selección de campos (parámetro fields=) para las APIs JSON del ERP de Mega Nevada
+@details Las APIs de búsqueda, detalle y stock bajo aceptan fields=campo1,campo2 para devolver solo esos campos. Además de
+         recortar la respuesta, la consulta carga únicamente las columnas que necesitan esos campos (load_only), según
+         SERIALIZACION y COLUMNAS_CAMPOS de cada modelo. El id se incluye siempre.
+@author José David Sánchez Fernández
+@version 1.0
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+from flask import request
+from sqlalchemy.orm import load_only
+
+class CamposInvalidosError(ValueError):
+    """
+    @brief Error lanzado cuando fields= contiene campos que el modelo no ofrece
+    @version 1.0
+    """
+    pass
+
+def leer_campos(disponibles, parametro='fields'):
+    """
+    @brief Lee la lista de campos pedidos en la petición actual
+    @param disponibles Campos válidos (por ejemplo Producto.SERIALIZACION)
+    @param parametro Nombre del parámetro de la query string
+    @return list Campos pedidos, con id el primero, o None si no se ha pedido una selección
+    @exception CamposInvalidosError Si algún campo no existe
+    @version 1.0
+    """
+    valor = request.args.get(parametro, '').strip()
+    if not valor:
+        return None
+
+    campos = ['id']
+    for campo in (campo.strip() for campo in valor.split(',')):
+        if campo and campo not in campos:
+            campos.append(campo)
+
+    desconocidos = [campo for campo in campos if campo not in disponibles]
+    if desconocidos:
+        raise CamposInvalidosError(f"Campos no válidos: {', '.join(desconocidos)}")
+    return campos
+
+def columnas_campos(modelo, campos):
+    """
+    @brief Columnas del modelo de las que dependen los campos indicados
+    @param modelo Clase del modelo
+    @param campos Campos de to_dict()
+    @return list Atributos de columna del modelo
+    @version 1.0
+    """
+    dependencias = getattr(modelo, 'COLUMNAS_CAMPOS', {})
+    tabla = modelo.__table__.columns
+    nombres = []
+    for campo in campos:
+        for nombre in dependencias.get(campo, (campo,)):
+            if nombre in tabla and nombre not in nombres:
+                nombres.append(nombre)
+    return [getattr(modelo, nombre) for nombre in nombres]
+
+def opciones_carga(modelo, campos, *adicionales):
+    """
+    @brief Opciones de consulta que cargan solo las columnas necesarias
+    @param modelo Clase del modelo
+    @param campos Campos pedidos (None para cargar el modelo completo)
+    @param adicionales Nombres de columnas que la ruta necesita además de los campos
+    @return list Opciones para query.options()
+    @version 1.0
+    """
+    if campos is None:
+        return []
+    return [load_only(*columnas_campos(modelo, list(campos) + list(adicionales)))]
+
+def recortar(datos, campos):
+    """
+    @brief Deja en un diccionario ya construido solo los campos pedidos
+    @param datos Diccionario completo
+    @param campos Campos pedidos (None para no recortar)
+    @return dict Diccionario recortado
+    @version 1.0
+    """
+    if campos is None:
+        return datos
+    return {campo: datos[campo] for campo in campos if campo in datos}
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file comandos.py
+@brief Comandos de mantenimiento del ERP de Mega Nevada
+@details Este módulo registra los comandos de línea de órdenes (flask <comando>) usados para tareas de mantenimiento de datos como recálculos y regeneraciones masivas.
+@author José David Sánchez Fernández
+@version 1.2
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import click
+from sqlalchemy import text
+from sqlalchemy.orm import load_only
+from models.models import db, Pedido, Cliente, Producto, VECTORES_BUSQUEDA
+from services.impuestos_service import desglosar_pedidos, DesgloseImpuestos
+from services.ventas_service import reconstruir_ventas
+from utils.idempotencia import purgar_respuestas_caducadas
+from utils.helpers import normalizar_busqueda
+from utils.banco_busqueda import sembrar_catalogo_prueba, borrar_catalogo_prueba, medir_busqueda, PREFIJO_PRUEBA
+
+def registrar_comandos(app):
+    """
+    @brief Registra los comandos de mantenimiento en la aplicación Flask
+    @param app Instancia de Flask
+    @version 1.0
+    """
+    
+    @app.cli.command('recalcular-totales-pedidos')
+    @click.option('--lote', default=500, show_default=True, help='Pedidos procesados por commit')
+    def recalcular_totales_pedidos(lote):
+        """
+        @brief Recalcula y guarda los totales de todos los pedidos
+        @details Recorre los pedidos por id en lotes. El desglose de cada lote se agrega en la base de datos con una sola consulta,
+                 sin cargar los items, y se hace commit al final de cada lote.
+        @param lote Número de pedidos por lote
+        @version 1.1
+        """
+        ultimo_id = 0
+        procesados = 0
+        
+        while True:
+            pedidos = Pedido.query.filter(
+                Pedido.id > ultimo_id
+            ).order_by(Pedido.id).limit(lote).all()
+            
+            if not pedidos:
+                break
+            
+            desgloses = desglosar_pedidos(pedido.id for pedido in pedidos)
+            for pedido in pedidos:
+                pedido.aplicar_desglose(desgloses.get(pedido.id) or DesgloseImpuestos())
+            
+            db.session.commit()
+            ultimo_id = pedidos[-1].id
+            procesados += len(pedidos)
+            print(f"Totales recalculados: {procesados} pedidos")
+        
+        print(f"Recálculo terminado: {procesados} pedidos actualizados")
+    
+    @app.cli.command('purgar-idempotencia')
+    def purgar_idempotencia():
+        """
+        @brief Borra las respuestas guardadas por Idempotency-Key que ya han caducado
+        @version 1.0
+        """
+        borradas = purgar_respuestas_caducadas()
+        print(f"Respuestas idempotentes caducadas borradas: {borradas}")
+    
+    @app.cli.command('reindexar-busqueda')
+    @click.option('--lote', default=1000, show_default=True, help='Registros procesados por commit')
+    def reindexar_busqueda(lote):
+        """
+        @brief Recalcula las claves de búsqueda de todos los clientes y productos
+        @details Necesario tras cambiar los campos buscables o la normalización (por ejemplo al pasar a claves sin tildes).
+                 Recorre cada tabla por id en lotes cargando solo los campos buscables y guarda texto_busqueda únicamente
+                 si ha cambiado. En PostgreSQL recalcula también busqueda_tsv del lote con la expresión de los triggers.
+        @param lote Número de registros por lote
+        @version 1.1
+        """
+        postgresql = db.engine.dialect.name == 'postgresql'
+        
+        for modelo in (Cliente, Producto):
+            tabla = modelo.__tablename__
+            columnas = [getattr(modelo, campo) for campo in modelo.CAMPOS_BUSQUEDA]
+            vector = VECTORES_BUSQUEDA[tabla][0].replace('NEW.', '')
+            ultimo_id = 0
+            procesados = 0
+            cambiados = 0
+            
+            while True:
+                registros = modelo.query.options(load_only(modelo.texto_busqueda, *columnas)).filter(
+                    modelo.id > ultimo_id
+                ).order_by(modelo.id).limit(lote).all()
+                if not registros:
+                    break
+                
+                for registro in registros:
+                    texto = normalizar_busqueda(*(getattr(registro, campo) for campo in modelo.CAMPOS_BUSQUEDA))
+                    if registro.texto_busqueda != texto:
+                        registro.texto_busqueda = texto
+                        cambiados += 1
+                
+                if postgresql:
+                    db.session.execute(
+                        text(f"UPDATE {tabla} SET busqueda_tsv = {vector} WHERE id BETWEEN :desde AND :hasta"),
+                        {'desde': registros[0].id, 'hasta': registros[-1].id}
+                    )
+                
+                db.session.commit()
+                ultimo_id = registros[-1].id
+                procesados += len(registros)
+            
+            print(f"Claves de búsqueda recalculadas en {tabla}: {cambiados} de {procesados} registros")
+    
+    @app.cli.command('reconstruir-ventas-diarias')
+    def reconstruir_ventas_diarias():
+        """
+        @brief Vuelve a generar la tabla ventas_diarias a partir de los items de todos los pedidos
+        @details Necesario tras crearla, tras cargas directas en la base de datos o si se sospecha que se ha desviado de
+                 los pedidos. Se hace en una única transacción, de modo que las consultas de ventas nunca ven la tabla a medias.
+        @version 1.0
+        """
+        filas = reconstruir_ventas()
+        db.session.commit()
+        print(f"Ventas diarias reconstruidas: {filas} filas")
+    
+    @app.cli.command('sembrar-catalogo-prueba')
+    @click.option('--productos', default=300000, show_default=True, help='Productos sintéticos a generar')
+    @click.option('--clientes', default=20000, show_default=True, help='Clientes sintéticos a generar')
+    @click.option('--semilla', default=2025, show_default=True, help='Semilla del generador')
+    @click.option('--borrar', is_flag=True, help='Solo borrar el catálogo de prueba')
+    def sembrar_catalogo(productos, clientes, semilla, borrar):
+        """
+        @brief Genera (o borra) un catálogo sintético para medir la búsqueda
+        @details Los registros llevan el prefijo PREFIJO_PRUEBA en el código y se borran antes de cada siembra. No usar en
+                 la base de datos de producción.
+        @version 1.0
+        """
+        if borrar:
+            productos_borrados, clientes_borrados = borrar_catalogo_prueba()
+            print(f"Catálogo de prueba borrado: {productos_borrados} productos y {clientes_borrados} clientes")
+            return
+        
+        segundos = sembrar_catalogo_prueba(productos, clientes, semilla)
+        print(f"Catálogo de prueba ({PREFIJO_PRUEBA}...) generado en {segundos:.1f} s: "
+              f"{productos} productos y {clientes} clientes")
+    
+    @app.cli.command('medir-busqueda')
+    @click.option('--repeticiones', default=50, show_default=True, help='Ejecuciones por texto y función')
+    def medir_busqueda_comando(repeticiones):
+        """
+        @brief Mide los tiempos de buscar() y busqueda_global() sobre los datos actuales
+        @details Pensado para ejecutarse tras sembrar-catalogo-prueba. Muestra, por texto buscado y función, el número de
+                 resultados y los percentiles 50 y 95 y el máximo en milisegundos.
+        @version 1.0
+        """
+        print(f"Base de datos: {db.engine.dialect.name}, {Producto.query.count()} productos, "
+              f"{Cliente.query.count()} clientes")
+        print(f"{'función':<18} {'texto':<18} {'result.':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        mediciones = medir_busqueda(repeticiones)
+        for medicion in mediciones:
+            print(f"{medicion['funcion']:<18} {medicion['texto']:<18} {medicion['resultados']:>7} "
+                  f"{medicion['p50']:>8.2f} {medicion['p95']:>8.2f} {medicion['max']:>8.2f}")
+        peor = max(mediciones, key=lambda medicion: medicion['p95'])
+        print(f"Peor p95: {peor['p95']:.2f} ms ({peor['funcion']}, '{peor['texto']}')")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file helpers.py
+@brief Funciones auxiliares comunes del ERP de Mega Nevada
+@details Pequeñas utilidades compartidas por varias rutas.
+@author José David Sánchez Fernández
+@version 1.2
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import unicodedata
+from datetime import datetime
+
+def es_verdadero(valor):
+    """
+    @brief Interpreta un parámetro de URL como booleano
+    @param valor Valor recibido (por ejemplo 'true', '1', 'on', 'yes')
+    @return bool True si el valor indica verdadero
+    @version 1.0
+    """
+    return (valor or '').lower() in ['true', '1', 'on', 'yes']
+
+def normalizar_busqueda(*valores):
+    """
+    @brief Normaliza uno o varios textos para la búsqueda
+    @details Une los valores no vacíos, los pasa a minúsculas, quita tildes y diéresis (la ñ queda como n, igual que con
+             unaccent de PostgreSQL) y deja un único espacio entre palabras. Se usa tanto para construir la columna
+             texto_busqueda de los modelos como para normalizar lo que escribe el usuario, de modo que "nunez" encuentra
+             "Farmacia Nuñez" con el mismo índice.
+    @param valores Textos a normalizar (los None se ignoran)
+    @return str Texto normalizado
+    @version 1.1
+    """
+    texto = unicodedata.normalize('NFKD', ' '.join(str(valor) for valor in valores if valor).lower())
+    return ' '.join(''.join(caracter for caracter in texto if not unicodedata.combining(caracter)).split())
+
+def leer_fecha(valor):
+    """
+    @brief Convierte un parámetro de URL YYYY-MM-DD a date
+    @param valor Texto recibido
+    @return date o None si el valor está vacío
+    @exception ValueError Si el formato no es válido
+    @version 1.0
+    """
+    if not valor:
+        return None
+    return datetime.strptime(valor, '%Y-%m-%d').date()
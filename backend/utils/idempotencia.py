@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file idempotencia.py
+@brief Soporte de la cabecera Idempotency-Key para las APIs de creación del ERP de Mega Nevada
+@details El cliente envía una clave única por operación y la repite en cada reintento. La primera petición con esa clave
+         registra la clave y su respuesta en la misma transacción que la operación: la vista solo vuelca su trabajo con
+         confirmar_operacion() y el decorador hace un único commit con la respuesta ya guardada, así que o se confirman
+         las dos o ninguna. Los reintentos reciben esa respuesta guardada sin volver a ejecutar la vista (ni stock, ni
+         numeración, ni facturas). Dos peticiones simultáneas con la misma clave chocan en la clave primaria, así que solo
+         una de ellas llega a ejecutarse.
+@author José David Sánchez Fernández
+@version 1.1
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, make_response, current_app, g
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from models.models import db, RespuestaIdempotente
+
+CABECERA_IDEMPOTENCIA = 'Idempotency-Key'
+CABECERA_REPETIDA = 'Idempotent-Replayed'
+
+# Atributo de flask.g que indica que la vista en curso tiene clave de idempotencia
+ATRIBUTO_EN_CURSO = 'idempotencia_en_curso'
+
+def confirmar_operacion():
+    """
+    @brief Confirma el trabajo de una vista protegida con @idempotente
+    @details Sin clave de idempotencia hace commit. Con clave solo hace flush: el decorador guarda la respuesta y confirma
+             todo en el mismo commit.
+    @version 1.0
+    """
+    if g.get(ATRIBUTO_EN_CURSO):
+        db.session.flush()
+    else:
+        db.session.commit()
+
+def huella_peticion():
+    """
+    @brief Calcula la huella de la petición actual
+    @details Permite detectar que una clave se reutiliza con otra petición distinta (otra ruta u otro cuerpo).
+    @return str SHA-256 en hexadecimal
+    @version 1.0
+    """
+    contenido = f"{request.method} {request.path}\n".encode('utf-8') + request.get_data()
+    return hashlib.sha256(contenido).hexdigest()
+
+def responder_registro(registro, huella):
+    """
+    @brief Respuesta para una clave ya registrada
+    @param registro RespuestaIdempotente existente
+    @param huella Huella de la petición actual
+    @return Response Respuesta guardada, o error si la clave no corresponde a esta petición o aún se está procesando
+    @version 1.0
+    """
+    if registro.huella != huella:
+        return jsonify({
+            'success': False,
+            'message': 'La clave de idempotencia ya se usó con una petición distinta'
+        }), 422
+
+    if not registro.completada:
+        return jsonify({
+            'success': False,
+            'message': 'La petición con esta clave de idempotencia todavía se está procesando'
+        }), 409
+
+    respuesta = current_app.response_class(registro.cuerpo, status=registro.codigo_estado, mimetype='application/json')
+    respuesta.headers[CABECERA_REPETIDA] = 'true'
+    return respuesta
+
+def idempotente(ambito):
+    """
+    @brief Decorador que hace idempotente una vista mediante la cabecera Idempotency-Key
+    @details Sin cabecera la vista se ejecuta como siempre. Con cabecera, solo se guardan las respuestas correctas (2xx):
+             si la vista falla deshace su transacción y con ella el registro de la clave, de modo que el reintento vuelve
+             a intentarlo. La vista debe terminar su trabajo con confirmar_operacion() en lugar de hacer commit, para que
+             la operación y la respuesta guardada se confirmen en la misma transacción.
+    @param ambito Nombre de la operación protegida (las claves son independientes por ámbito)
+    @return function Decorador
+    @version 1.1
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            clave = (request.headers.get(CABECERA_IDEMPOTENCIA) or '').strip()
+            if not clave:
+                return vista(*args, **kwargs)
+
+            if len(clave) > 255:
+                return jsonify({
+                    'success': False,
+                    'message': 'La clave de idempotencia no puede superar 255 caracteres'
+                }), 400
+
+            huella = huella_peticion()
+            ahora = datetime.utcnow()
+            expira = ahora + timedelta(hours=current_app.config.get('IDEMPOTENCIA_HORAS', 24))
+
+            registro = db.session.get(RespuestaIdempotente, (ambito, clave))
+            if registro is not None and registro.expira > ahora:
+                return responder_registro(registro, huella)
+
+            if registro is not None:
+                # Clave caducada: se reutiliza la fila como si fuera nueva
+                registro.huella = huella
+                registro.completada = False
+                registro.codigo_estado = None
+                registro.cuerpo = None
+                registro.fecha_creacion = ahora
+                registro.expira = expira
+            else:
+                registro = RespuestaIdempotente(
+                    ambito=ambito,
+                    clave=clave,
+                    huella=huella,
+                    completada=False,
+                    fecha_creacion=ahora,
+                    expira=expira
+                )
+                db.session.add(registro)
+
+            try:
+                db.session.flush()
+            except IntegrityError:
+                # Otra petición con la misma clave se ha registrado a la vez
+                db.session.rollback()
+                registro = db.session.get(RespuestaIdempotente, (ambito, clave))
+                if registro is None:
+                    return jsonify({
+                        'success': False,
+                        'message': 'La petición con esta clave de idempotencia todavía se está procesando'
+                    }), 409
+                return responder_registro(registro, huella)
+
+            setattr(g, ATRIBUTO_EN_CURSO, True)
+            try:
+                respuesta = make_response(vista(*args, **kwargs))
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                g.pop(ATRIBUTO_EN_CURSO, None)
+
+            if 200 <= respuesta.status_code < 300 and inspect(registro).persistent:
+                registro.completada = True
+                registro.codigo_estado = respuesta.status_code
+                registro.cuerpo = respuesta.get_data(as_text=True)
+                try:
+                    db.session.commit()
+                except Exception as e:
+                    # Ni la operación ni la clave quedan guardadas: el reintento la ejecuta de nuevo
+                    db.session.rollback()
+                    return jsonify({
+                        'success': False,
+                        'message': f'Error al confirmar la operación: {str(e)}'
+                    }), 500
+            else:
+                # Respuesta de error: la clave no se guarda y el reintento se ejecuta de nuevo
+                db.session.rollback()
+
+            return respuesta
+        return envoltura
+    return decorador
+
+def purgar_respuestas_caducadas():
+    """
+    @brief Borra las respuestas idempotentes caducadas
+    @return int Número de filas borradas
+    @version 1.0
+    """
+    borradas = RespuestaIdempotente.query.filter(
+        RespuestaIdempotente.expira <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return borradas
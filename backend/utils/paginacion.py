@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file paginacion.py
+@brief Paginación por cursor (keyset) para los listados del ERP de Mega Nevada
+@details Alternativa a paginate() para listados grandes. En lugar de OFFSET, cada página continúa a partir de los valores
+         de ordenación de la última fila vista, de modo que una página profunda cuesta lo mismo que la primera. Los cursores
+         son opacos (base64 de un JSON con los valores y la dirección) y el COUNT(*) total solo se calcula si se pide.
+@author José David Sánchez Fernández
+@version 1.0
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import base64
+import json
+from datetime import datetime, date
+from decimal import Decimal
+from sqlalchemy import tuple_, DateTime, Date, Numeric
+
+class CursorInvalidoError(ValueError):
+    """
+    @brief Error lanzado cuando un cursor no se puede decodificar
+    @version 1.0
+    """
+    pass
+
+class PaginaCursor:
+    """
+    @brief Resultado de una página paginada por cursor
+    @details Expone items, has_next/has_prev y total como el objeto de paginate(), más los cursores de la página
+             siguiente y anterior. pages vale 0 para que las plantillas no pinten la paginación numerada.
+    @version 1.0
+    """
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.pages = 0
+        self.page = None
+        self.por_cursor = True
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def codificar_cursor(valores, direccion):
+    """
+    @brief Codifica los valores de ordenación de una fila como cursor opaco
+    @param valores Lista de valores de las columnas de ordenación
+    @param direccion 'sig' para avanzar o 'ant' para retroceder
+    @return str Cursor en base64 url-safe
+    @version 1.0
+    """
+    serializables = []
+    for valor in valores:
+        if isinstance(valor, (datetime, date)):
+            valor = valor.isoformat()
+        elif isinstance(valor, Decimal):
+            valor = str(valor)
+        serializables.append(valor)
+    contenido = json.dumps({'v': serializables, 'd': direccion}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(contenido.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decodificar_cursor(cursor, columnas):
+    """
+    @brief Decodifica un cursor y convierte sus valores al tipo de cada columna
+    @param cursor Cursor recibido
+    @param columnas Columnas de ordenación
+    @return tuple (valores, dirección)
+    @exception CursorInvalidoError Si el cursor no es válido
+    @version 1.0
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        contenido = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode('utf-8'))
+        valores = contenido['v']
+        direccion = contenido['d']
+        if direccion not in ('sig', 'ant') or len(valores) != len(columnas):
+            raise ValueError('cursor incompleto')
+
+        convertidos = []
+        for columna, valor in zip(columnas, valores):
+            tipo = columna.type
+            if valor is not None and isinstance(tipo, DateTime):
+                valor = datetime.fromisoformat(valor)
+            elif valor is not None and isinstance(tipo, Date):
+                valor = date.fromisoformat(valor)
+            elif valor is not None and isinstance(tipo, Numeric):
+                valor = Decimal(valor)
+            convertidos.append(valor)
+        return convertidos, direccion
+    except (ValueError, KeyError, TypeError) as e:
+        raise CursorInvalidoError(f'Cursor no válido: {str(e)}')
+
+def paginar_por_cursor(query, columnas, descendente=False, cursor=None, per_page=15, con_total=False):
+    """
+    @brief Pagina una consulta por cursor
+    @details La consulta no debe llevar order_by: se ordena por las columnas indicadas, todas en el mismo sentido, y la
+             última debe ser única (normalmente el id) para que el orden sea total.
+    @param query Consulta filtrada
+    @param columnas Columnas de ordenación, por ejemplo [Pedido.fecha_pedido, Pedido.id]
+    @param descendente True para orden descendente
+    @param cursor Cursor recibido, o None para la primera página
+    @param per_page Filas por página
+    @param con_total True para calcular también el COUNT(*) total
+    @return PaginaCursor Página con sus cursores
+    @exception CursorInvalidoError Si el cursor no es válido
+    @version 1.0
+    """
+    total = query.order_by(None).count() if con_total else None
+
+    valores, direccion = decodificar_cursor(cursor, columnas) if cursor else (None, 'sig')
+    retrocede = direccion == 'ant'
+
+    # Al retroceder se recorre en sentido inverso y luego se da la vuelta a la página
+    hacia_abajo = descendente != retrocede
+    if valores is not None:
+        clave = tuple_(*columnas)
+        query = query.filter(clave < tuple_(*valores) if hacia_abajo else clave > tuple_(*valores))
+    orden = [columna.desc() if hacia_abajo else columna.asc() for columna in columnas]
+
+    filas = query.order_by(*orden).limit(per_page + 1).all()
+    hay_mas = len(filas) > per_page
+    filas = filas[:per_page]
+    if retrocede:
+        filas.reverse()
+
+    def valores_fila(fila):
+        return [getattr(fila, columna.key) for columna in columnas]
+
+    next_cursor = None
+    prev_cursor = None
+    if filas:
+        if hay_mas or retrocede:
+            next_cursor = codificar_cursor(valores_fila(filas[-1]), 'sig')
+        if (hay_mas and retrocede) or (valores is not None and not retrocede):
+            prev_cursor = codificar_cursor(valores_fila(filas[0]), 'ant')
+
+    return PaginaCursor(filas, per_page, next_cursor, prev_cursor, total)
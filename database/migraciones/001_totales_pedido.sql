@@ -0,0 +1,14 @@
+-- =============================================================================
+-- @file 001_totales_pedido.sql
+-- @brief Totales persistidos en la tabla de pedidos
+-- @details Añade las columnas de base imponible, IVA, recargo de equivalencia
+--          y total a cada pedido. Tras aplicarla, ejecutar desde backend/:
+--              flask --app app recalcular-totales-pedidos
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS subtotal NUMERIC(10, 2) NOT NULL DEFAULT 0;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS total_iva NUMERIC(10, 2) NOT NULL DEFAULT 0;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS total_recargo NUMERIC(10, 2) NOT NULL DEFAULT 0;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS total NUMERIC(10, 2) NOT NULL DEFAULT 0;
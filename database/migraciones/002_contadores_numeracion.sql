@@ -0,0 +1,34 @@
+-- =============================================================================
+-- @file 002_contadores_numeracion.sql
+-- @brief Contadores de numeración de pedidos y facturas
+-- @details Crea la tabla de contadores (una fila por serie y periodo) y la
+--          inicializa con el mayor número ya usado en cada periodo, comparando
+--          numéricamente para que VF/1000 quede por encima de VF/999.
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS contadores_numeracion (
+    serie VARCHAR(10) NOT NULL,
+    periodo VARCHAR(10) NOT NULL,
+    ultimo_numero INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (serie, periodo)
+);
+
+-- Pedidos: P-YYYYMMDD-XXX, un contador por día
+INSERT INTO contadores_numeracion (serie, periodo, ultimo_numero)
+SELECT 'P', split_part(numero_pedido, '-', 2), MAX(split_part(numero_pedido, '-', 3)::INTEGER)
+FROM pedidos
+WHERE numero_pedido ~ '^P-[0-9]{8}-[0-9]+$'
+GROUP BY split_part(numero_pedido, '-', 2)
+ON CONFLICT (serie, periodo) DO UPDATE
+    SET ultimo_numero = GREATEST(contadores_numeracion.ultimo_numero, EXCLUDED.ultimo_numero);
+
+-- Facturas: VF/XXX/YY, un contador por año
+INSERT INTO contadores_numeracion (serie, periodo, ultimo_numero)
+SELECT 'VF', split_part(numero_factura, '/', 3), MAX(split_part(numero_factura, '/', 2)::INTEGER)
+FROM facturas
+WHERE numero_factura ~ '^VF/[0-9]+/[0-9]{2}$'
+GROUP BY split_part(numero_factura, '/', 3)
+ON CONFLICT (serie, periodo) DO UPDATE
+    SET ultimo_numero = GREATEST(contadores_numeracion.ultimo_numero, EXCLUDED.ultimo_numero);
@@ -0,0 +1,14 @@
+-- =============================================================================
+-- @file 003_indices_paginacion.sql
+-- @brief Índices para la paginación por cursor de los listados
+-- @details Cada índice cubre el orden de un listado (columna de orden + id),
+--          de modo que cada página se lee directamente del índice sin OFFSET.
+--          Un índice ascendente sirve también para recorrer en descendente.
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+CREATE INDEX IF NOT EXISTS ix_pedidos_fecha_pedido_id ON pedidos (fecha_pedido, id);
+CREATE INDEX IF NOT EXISTS ix_facturas_fecha_factura_id ON facturas (fecha_factura, id);
+CREATE INDEX IF NOT EXISTS ix_clientes_nombre_id ON clientes (nombre, id);
+CREATE INDEX IF NOT EXISTS ix_productos_nombre_id ON productos (nombre, id);
@@ -0,0 +1,24 @@
+-- =============================================================================
+-- @file 004_respuestas_idempotentes.sql
+-- @brief Almacén de respuestas para la cabecera Idempotency-Key
+-- @details Guarda la respuesta de la creación de pedidos y facturas por clave de
+--          idempotencia para que un reintento del cliente la reciba de nuevo sin
+--          repetir la operación. Las filas caducadas se borran con
+--          flask purgar-idempotencia.
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS respuestas_idempotentes (
+    ambito VARCHAR(50) NOT NULL,
+    clave VARCHAR(255) NOT NULL,
+    huella VARCHAR(64) NOT NULL,
+    completada BOOLEAN NOT NULL DEFAULT FALSE,
+    codigo_estado INTEGER,
+    cuerpo TEXT,
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expira TIMESTAMP NOT NULL,
+    PRIMARY KEY (ambito, clave)
+);
+
+CREATE INDEX IF NOT EXISTS ix_respuestas_idempotentes_expira ON respuestas_idempotentes (expira);
@@ -0,0 +1,29 @@
+-- =============================================================================
+-- @file 005_busqueda_trigramas.sql
+-- @brief Búsqueda de clientes y productos con índices de trigramas
+-- @details Añade la columna texto_busqueda (campos buscables concatenados y en
+--          minúsculas), la rellena y crea sobre ella un índice GIN de pg_trgm
+--          para que la búsqueda por subcadena no recorra la tabla entera.
+--          La aplicación mantiene la columna al guardar; para recalcularla con
+--          la normalización exacta de la aplicación: flask reindexar-busqueda
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE clientes ADD COLUMN IF NOT EXISTS texto_busqueda TEXT;
+ALTER TABLE productos ADD COLUMN IF NOT EXISTS texto_busqueda TEXT;
+
+UPDATE clientes
+SET texto_busqueda = lower(regexp_replace(trim(concat_ws(' ',
+        nombre, codigo, telefono, nombre_fiscal, cif, contacto)), '\s+', ' ', 'g'));
+
+UPDATE productos
+SET texto_busqueda = lower(regexp_replace(trim(concat_ws(' ',
+        nombre, codigo, descripcion, codigo_nacional, num_referencia, nombre_proveedor, marca)), '\s+', ' ', 'g'));
+
+CREATE INDEX IF NOT EXISTS ix_clientes_texto_busqueda_trgm
+    ON clientes USING gin (texto_busqueda gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_productos_texto_busqueda_trgm
+    ON productos USING gin (texto_busqueda gin_trgm_ops);
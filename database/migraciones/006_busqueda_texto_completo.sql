@@ -0,0 +1,71 @@
+-- =============================================================================
+-- @file 006_busqueda_texto_completo.sql
+-- @brief Búsqueda global de texto completo en clientes, productos, pedidos y facturas
+-- @details Añade a cada tabla la columna busqueda_tsv (configuración 'spanish'
+--          para nombres y 'simple' para códigos y números de documento), los
+--          triggers que la mantienen al insertar o al cambiar las columnas
+--          buscables y sus índices GIN. Las expresiones son las mismas que
+--          VECTORES_BUSQUEDA en backend/models/models.py.
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+ALTER TABLE clientes ADD COLUMN IF NOT EXISTS busqueda_tsv TSVECTOR;
+ALTER TABLE productos ADD COLUMN IF NOT EXISTS busqueda_tsv TSVECTOR;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS busqueda_tsv TSVECTOR;
+ALTER TABLE facturas ADD COLUMN IF NOT EXISTS busqueda_tsv TSVECTOR;
+
+-- Clientes
+CREATE OR REPLACE FUNCTION clientes_busqueda_tsv() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda_tsv := setweight(to_tsvector('spanish', coalesce(NEW.nombre, '')), 'A') || setweight(to_tsvector('simple', concat_ws(' ', NEW.codigo, NEW.cif)), 'A') || setweight(to_tsvector('spanish', concat_ws(' ', NEW.nombre_fiscal, NEW.contacto)), 'B') || setweight(to_tsvector('simple', coalesce(NEW.telefono, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_clientes_busqueda_tsv ON clientes;
+CREATE TRIGGER trg_clientes_busqueda_tsv BEFORE INSERT OR UPDATE OF nombre, codigo, cif, nombre_fiscal, contacto, telefono ON clientes
+    FOR EACH ROW EXECUTE FUNCTION clientes_busqueda_tsv();
+
+-- Productos
+CREATE OR REPLACE FUNCTION productos_busqueda_tsv() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda_tsv := setweight(to_tsvector('spanish', coalesce(NEW.nombre, '')), 'A') || setweight(to_tsvector('simple', concat_ws(' ', NEW.codigo, NEW.codigo_nacional, NEW.num_referencia)), 'A') || setweight(to_tsvector('spanish', concat_ws(' ', NEW.marca, NEW.nombre_proveedor)), 'B') || setweight(to_tsvector('spanish', coalesce(NEW.descripcion, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_productos_busqueda_tsv ON productos;
+CREATE TRIGGER trg_productos_busqueda_tsv BEFORE INSERT OR UPDATE OF nombre, codigo, codigo_nacional, num_referencia, marca, nombre_proveedor, descripcion ON productos
+    FOR EACH ROW EXECUTE FUNCTION productos_busqueda_tsv();
+
+-- Pedidos
+CREATE OR REPLACE FUNCTION pedidos_busqueda_tsv() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda_tsv := setweight(to_tsvector('simple', NEW.numero_pedido || ' ' || translate(NEW.numero_pedido, '-', ' ')), 'A');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_pedidos_busqueda_tsv ON pedidos;
+CREATE TRIGGER trg_pedidos_busqueda_tsv BEFORE INSERT OR UPDATE OF numero_pedido ON pedidos
+    FOR EACH ROW EXECUTE FUNCTION pedidos_busqueda_tsv();
+
+-- Facturas
+CREATE OR REPLACE FUNCTION facturas_busqueda_tsv() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda_tsv := setweight(to_tsvector('simple', NEW.numero_factura || ' ' || translate(NEW.numero_factura, '/', ' ')), 'A');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_facturas_busqueda_tsv ON facturas;
+CREATE TRIGGER trg_facturas_busqueda_tsv BEFORE INSERT OR UPDATE OF numero_factura ON facturas
+    FOR EACH ROW EXECUTE FUNCTION facturas_busqueda_tsv();
+
+-- Rellenar los datos existentes (dispara los triggers)
+UPDATE clientes SET nombre = nombre;
+UPDATE productos SET nombre = nombre;
+UPDATE pedidos SET numero_pedido = numero_pedido;
+UPDATE facturas SET numero_factura = numero_factura;
+
+CREATE INDEX IF NOT EXISTS ix_clientes_busqueda_tsv ON clientes USING gin (busqueda_tsv);
+CREATE INDEX IF NOT EXISTS ix_productos_busqueda_tsv ON productos USING gin (busqueda_tsv);
+CREATE INDEX IF NOT EXISTS ix_pedidos_busqueda_tsv ON pedidos USING gin (busqueda_tsv);
+CREATE INDEX IF NOT EXISTS ix_facturas_busqueda_tsv ON facturas USING gin (busqueda_tsv);
@@ -0,0 +1,48 @@
+-- =============================================================================
+-- @file 007_busqueda_sin_tildes.sql
+-- @brief Claves de búsqueda sin tildes para clientes y productos
+-- @details La aplicación guarda ahora texto_busqueda sin tildes ni diéresis (la
+--          ñ como n) y normaliza igual lo que escribe el usuario, así que la
+--          búsqueda no distingue tildes usando el mismo índice de trigramas.
+--          Esta migración instala unaccent, recalcula texto_busqueda con una
+--          aproximación en SQL y cambia los triggers de busqueda_tsv para que
+--          también quiten las tildes, recalculando los vectores existentes.
+--          Para dejar texto_busqueda con la normalización exacta de la
+--          aplicación: flask reindexar-busqueda
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+UPDATE clientes
+SET texto_busqueda = lower(unaccent(regexp_replace(trim(concat_ws(' ',
+        nombre, codigo, telefono, nombre_fiscal, cif, contacto)), '\s+', ' ', 'g')));
+
+UPDATE productos
+SET texto_busqueda = lower(unaccent(regexp_replace(trim(concat_ws(' ',
+        nombre, codigo, descripcion, codigo_nacional, num_referencia, nombre_proveedor, marca)), '\s+', ' ', 'g')));
+
+-- Clientes
+CREATE OR REPLACE FUNCTION clientes_busqueda_tsv() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda_tsv := setweight(to_tsvector('spanish', unaccent(coalesce(NEW.nombre, ''))), 'A') || setweight(to_tsvector('simple', concat_ws(' ', NEW.codigo, NEW.cif)), 'A') || setweight(to_tsvector('spanish', unaccent(concat_ws(' ', NEW.nombre_fiscal, NEW.contacto))), 'B') || setweight(to_tsvector('simple', coalesce(NEW.telefono, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_clientes_busqueda_tsv ON clientes;
+CREATE TRIGGER trg_clientes_busqueda_tsv BEFORE INSERT OR UPDATE OF nombre, codigo, cif, nombre_fiscal, contacto, telefono ON clientes
+    FOR EACH ROW EXECUTE FUNCTION clientes_busqueda_tsv();
+UPDATE clientes SET busqueda_tsv = setweight(to_tsvector('spanish', unaccent(coalesce(nombre, ''))), 'A') || setweight(to_tsvector('simple', concat_ws(' ', codigo, cif)), 'A') || setweight(to_tsvector('spanish', unaccent(concat_ws(' ', nombre_fiscal, contacto))), 'B') || setweight(to_tsvector('simple', coalesce(telefono, '')), 'C');
+
+-- Productos
+CREATE OR REPLACE FUNCTION productos_busqueda_tsv() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda_tsv := setweight(to_tsvector('spanish', unaccent(coalesce(NEW.nombre, ''))), 'A') || setweight(to_tsvector('simple', concat_ws(' ', NEW.codigo, NEW.codigo_nacional, NEW.num_referencia)), 'A') || setweight(to_tsvector('spanish', unaccent(concat_ws(' ', NEW.marca, NEW.nombre_proveedor))), 'B') || setweight(to_tsvector('spanish', unaccent(coalesce(NEW.descripcion, ''))), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_productos_busqueda_tsv ON productos;
+CREATE TRIGGER trg_productos_busqueda_tsv BEFORE INSERT OR UPDATE OF nombre, codigo, codigo_nacional, num_referencia, marca, nombre_proveedor, descripcion ON productos
+    FOR EACH ROW EXECUTE FUNCTION productos_busqueda_tsv();
+UPDATE productos SET busqueda_tsv = setweight(to_tsvector('spanish', unaccent(coalesce(nombre, ''))), 'A') || setweight(to_tsvector('simple', concat_ws(' ', codigo, codigo_nacional, num_referencia)), 'A') || setweight(to_tsvector('spanish', unaccent(concat_ws(' ', marca, nombre_proveedor))), 'B') || setweight(to_tsvector('spanish', unaccent(coalesce(descripcion, ''))), 'C');
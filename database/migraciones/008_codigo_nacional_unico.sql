@@ -0,0 +1,23 @@
+-- =============================================================================
+-- @file 008_codigo_nacional_unico.sql
+-- @brief Índice único del código nacional de los productos
+-- @details La lectura del escáner busca exactamente por codigo_nacional (y por
+--          codigo, que ya era único). Los códigos nacionales vacíos pasan a
+--          NULL, que es como los guarda ahora la aplicación, y se crea un
+--          índice único parcial sobre los informados.
+--          Si la creación del índice falla por duplicados, esta consulta los
+--          lista para corregirlos antes de repetirla:
+--            SELECT codigo_nacional, array_agg(codigo) FROM productos
+--            WHERE codigo_nacional IS NOT NULL
+--            GROUP BY codigo_nacional HAVING count(*) > 1;
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+UPDATE productos
+SET codigo_nacional = NULLIF(trim(codigo_nacional), '')
+WHERE codigo_nacional IS DISTINCT FROM NULLIF(trim(codigo_nacional), '');
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_productos_codigo_nacional
+    ON productos (codigo_nacional)
+    WHERE codigo_nacional IS NOT NULL;
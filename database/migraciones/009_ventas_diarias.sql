@@ -0,0 +1,28 @@
+-- =============================================================================
+-- @file 009_ventas_diarias.sql
+-- @brief Tabla resumen de ventas por día, cliente, producto y tipo de IVA
+-- @details Las APIs de ventas leen esta tabla en lugar de agregar items_pedido.
+--          La aplicación la mantiene al crear, modificar y eliminar pedidos.
+--          Tras crearla hay que rellenarla con los pedidos existentes:
+--            flask reconstruir-ventas-diarias
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS ventas_diarias (
+    fecha DATE NOT NULL,
+    cliente_id INTEGER NOT NULL REFERENCES clientes (id),
+    producto_id INTEGER NOT NULL REFERENCES productos (id),
+    iva_porcentaje NUMERIC(5, 2) NOT NULL,
+    unidades INTEGER NOT NULL DEFAULT 0,
+    base NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    iva NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    recargo NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, cliente_id, producto_id, iva_porcentaje)
+);
+
+CREATE INDEX IF NOT EXISTS ix_ventas_diarias_cliente_fecha
+    ON ventas_diarias (cliente_id, fecha);
+
+CREATE INDEX IF NOT EXISTS ix_ventas_diarias_producto_fecha
+    ON ventas_diarias (producto_id, fecha);
@@ -0,0 +1,12 @@
+-- =============================================================================
+-- @file 010_facturas_fecha_total.sql
+-- @brief Índice compuesto de facturas por fecha e importe
+-- @details El resumen de facturación suma el total de las facturas por mes o
+--          por semana en un rango de fechas. Con (fecha_factura, total) la
+--          consulta se resuelve recorriendo solo el índice.
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+CREATE INDEX IF NOT EXISTS ix_facturas_fecha_factura_total
+    ON facturas (fecha_factura, total);
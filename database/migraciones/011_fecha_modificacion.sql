@@ -0,0 +1,27 @@
+-- =============================================================================
+-- @file 011_fecha_modificacion.sql
+-- @brief Fecha de la última escritura de clientes, productos, pedidos y facturas
+-- @details El ETag y el Last-Modified de las APIs del home se calculan a partir
+--          del número de filas y de la última fecha_modificacion de estas
+--          tablas, de modo que no cambian mientras no cambien los datos. La
+--          aplicación la actualiza en cada UPDATE; los registros existentes
+--          toman su fecha de creación.
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+ALTER TABLE clientes ADD COLUMN IF NOT EXISTS fecha_modificacion TIMESTAMP;
+UPDATE clientes SET fecha_modificacion = COALESCE(fecha_creacion, now() AT TIME ZONE 'utc') WHERE fecha_modificacion IS NULL;
+CREATE INDEX IF NOT EXISTS ix_clientes_fecha_modificacion ON clientes (fecha_modificacion);
+
+ALTER TABLE productos ADD COLUMN IF NOT EXISTS fecha_modificacion TIMESTAMP;
+UPDATE productos SET fecha_modificacion = COALESCE(fecha_creacion, now() AT TIME ZONE 'utc') WHERE fecha_modificacion IS NULL;
+CREATE INDEX IF NOT EXISTS ix_productos_fecha_modificacion ON productos (fecha_modificacion);
+
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS fecha_modificacion TIMESTAMP;
+UPDATE pedidos SET fecha_modificacion = COALESCE(fecha_pedido, now() AT TIME ZONE 'utc') WHERE fecha_modificacion IS NULL;
+CREATE INDEX IF NOT EXISTS ix_pedidos_fecha_modificacion ON pedidos (fecha_modificacion);
+
+ALTER TABLE facturas ADD COLUMN IF NOT EXISTS fecha_modificacion TIMESTAMP;
+UPDATE facturas SET fecha_modificacion = COALESCE(fecha_factura, now() AT TIME ZONE 'utc') WHERE fecha_modificacion IS NULL;
+CREATE INDEX IF NOT EXISTS ix_facturas_fecha_modificacion ON facturas (fecha_modificacion);
@@ -0,0 +1,19 @@
+-- =============================================================================
+-- @file 012_busqueda_trigramas_gist.sql
+-- @brief Índices GiST de trigramas para ordenar la búsqueda por similitud
+-- @details El índice GIN de 005 filtra por subcadena pero no puede devolver
+--          las filas ordenadas por similitud. Con términos muy frecuentes la
+--          búsqueda al teclear toma las más parecidas con ORDER BY
+--          texto <<-> lower(texto_busqueda), que resuelve este índice sin calcular la
+--          similitud de todas las coincidencias. Es sobre lower(texto_busqueda)
+--          (la columna ya está en minúsculas) para que los LIKE sigan usando el
+--          índice GIN, mucho más rápido para filtrar; siglen=256 hace que las
+--          búsquedas cortas ('ibu') descarten más filas en el índice.
+-- @version 1.0
+-- @date 2026-10-17
+-- =============================================================================
+
+CREATE INDEX IF NOT EXISTS ix_clientes_texto_busqueda_gist
+    ON clientes USING gist (lower(texto_busqueda) gist_trgm_ops(siglen=256));
+CREATE INDEX IF NOT EXISTS ix_productos_texto_busqueda_gist
+    ON productos USING gist (lower(texto_busqueda) gist_trgm_ops(siglen=256));
@@ -3,7 +3,7 @@
  * @brief JavaScript principal del ERP de Mega Nevada
  * @details Funciones principales para el manejo del frontend, notificaciones, validaciones y comunicación con la API del backend.
  * @author José David Sánchez Fernández
- * @version 4.1
+ * @version 4.5
  * @date 2025-06-09
  * @copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
  */
@@ -15,21 +15,36 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeApp();
     
     // Cargar datos del home
-    if (window.location.pathname === '/' || window.location.pathname === '') {
+    if (esPaginaHome()) {
         cargarEstadisticasHome();
         actualizarReloj();
         setInterval(actualizarReloj, 1000);
+        
+        // Actualizar los widgets con los eventos del servidor en lugar de recargar
+        conectarEventosHome();
     }
 });
 
+/**
+ * @brief Indica si la página actual es el home
+ * @return Boolean true en el home
+ * @version 1.0
+ */
+function esPaginaHome() {
+    return window.location.pathname === '/' || window.location.pathname === '';
+}
+
 /**
  * @brief Inicializa todos los componentes de la aplicación
  * @details Función principal que configura todos los elementos necesarios para el funcionamiento del frontend.
- * @version 4.0
+ *          En el home la conexión se comprueba con la propia carga de /api/home/bootstrap, sin pedir /api/test.
+ * @version 4.1
  */
 function initializeApp() {
     // Verificar conexión con la API
-    checkAPIConnection();
+    if (!esPaginaHome()) {
+        checkAPIConnection();
+    }
     
     // Configurar tooltips de Bootstrap
     initializeTooltips();
@@ -38,10 +53,23 @@ function initializeApp() {
     setupNotifications();
 }
 
+/**
+ * @brief Avisa una vez por sesión del navegador de que el sistema está conectado
+ * @version 1.0
+ */
+function notificarConexion() {
+    console.log('Conexión con API exitosa');
+    
+    if (!sessionStorage.getItem('sistema_conectado_notificado')) {
+        showNotification('Sistema conectado correctamente', 'success', false);
+        sessionStorage.setItem('sistema_conectado_notificado', 'true');
+    }
+}
+
 /**
  * @brief Verifica la conexión con la API del backend
  * @details Realiza una petición al endpoint de prueba para verificar que la comunicación con el servidor funciona correctamente.
- * @version 3.1
+ * @version 3.2
  */
 async function checkAPIConnection() {
     try {
@@ -50,16 +78,6 @@ async function checkAPIConnection() {
         
         if (data.status === 'success') {
             console.log('Conexión con API exitosa');
-            
-            // Solo mostrar notificacion en la home
-            if (window.location.pathname === '/' || window.location.pathname === '') {
-                const yaNotificado = sessionStorage.getItem('sistema_conectado_notificado');
-                
-                if (!yaNotificado) {
-                    showNotification('Sistema conectado correctamente', 'success', false);
-                    sessionStorage.setItem('sistema_conectado_notificado', 'true');
-                }
-            }
         }
     } catch (error) {
         console.error('Error de conexión:', error);
@@ -68,56 +86,53 @@ async function checkAPIConnection() {
 }
 
 /**
- * @brief Carga las estadísticas del home
- * @details Obtiene y muestra todas las estadísticas del home principal
- * @version 1.0
+ * @brief Carga todos los widgets del home
+ * @details Una sola petición a /api/home/bootstrap trae contadores, actividad reciente y alertas de stock. El navegador
+ *          la revalida con ETag, así que si nada ha cambiado el servidor responde 304 sin cuerpo ni consultas.
+ * @version 2.0
  */
 async function cargarEstadisticasHome() {
     try {
-        console.log('Cargando estadísticas del home...');
+        console.log('Cargando home...');
         
-        // Cargar estadísticas principales
-        const response = await fetch('/api/home/estadisticas');
+        const response = await fetch('/api/home/bootstrap');
         const data = await response.json();
         
-        if (data.success) {
-            const stats = data.estadisticas;
-            
-            // Actualizar contadores con animación
-            actualizarContador('total-clientes', stats.total_clientes);
-            actualizarContador('total-productos', stats.total_productos);
-            actualizarContador('pedidos-pendientes', stats.pedidos_pendientes);
-            actualizarContador('facturas-mes', stats.facturas_mes);
-            
-            console.log('Estadísticas cargadas correctamente');
-        } else {
-            console.warn('Error en estadísticas:', data.error);
-            // Mostrar valores por defecto
-            actualizarContador('total-clientes', 0);
-            actualizarContador('total-productos', 0);
-            actualizarContador('pedidos-pendientes', 0);
-            actualizarContador('facturas-mes', 0);
+        if (!data.success) {
+            throw new Error(data.error);
         }
         
-        // Cargar actividad reciente
-        await cargarActividadReciente();
+        pintarContadoresHome(data.estadisticas);
+        pintarActividadReciente(data.actividades);
+        pintarAlertasStock(data.productos_stock_bajo);
+        notificarConexion();
         
-        // Cargar alertas de stock
-        await cargarAlertasStock();
+        console.log('Home cargado correctamente');
         
     } catch (error) {
-        console.error('Error al cargar estadísticas:', error);
+        console.error('Error al cargar el home:', error);
         
         // Mostrar valores por defecto en caso de error
-        actualizarContador('total-clientes', 0);
-        actualizarContador('total-productos', 0);
-        actualizarContador('pedidos-pendientes', 0);
-        actualizarContador('facturas-mes', 0);
+        pintarContadoresHome({});
+        pintarActividadReciente(null);
+        pintarAlertasStock(null);
         
-        showNotification('Error al cargar estadísticas del home', 'warning');
+        showNotification('Error de conexión con el servidor', 'danger', true);
     }
 }
 
+/**
+ * @brief Muestra los contadores del home
+ * @param stats Estadísticas de /api/home/bootstrap (las que falten se muestran a 0)
+ * @version 1.0
+ */
+function pintarContadoresHome(stats) {
+    actualizarContador('total-clientes', stats.total_clientes || 0);
+    actualizarContador('total-productos', stats.total_productos || 0);
+    actualizarContador('pedidos-pendientes', stats.pedidos_pendientes || 0);
+    actualizarContador('facturas-mes', stats.facturas_mes || 0);
+}
+
 /**
  * @brief Actualiza un contador con animación
  * @param elementId ID del elemento a actualizar
@@ -146,66 +161,79 @@ function actualizarContador(elementId, valor) {
 
 /**
  * @brief Carga la actividad reciente del sistema con enlaces clicables
- * @version 2.0
+ * @details Se usa para refrescar solo este widget (por ejemplo al recibir un evento); la carga inicial viene en
+ *          /api/home/bootstrap.
+ * @version 3.0
  */
 async function cargarActividadReciente() {
     try {
         const response = await fetch('/api/home/actividad');
         const data = await response.json();
-        
-        const container = document.getElementById('actividad-reciente');
-        if (!container) return;
-        
-        if (data.success && data.actividades.length > 0) {
-            let html = '';
-            data.actividades.forEach(actividad => {
-                const fecha = new Date(actividad.fecha).toLocaleString('es-ES', {
-                    month: 'short',
-                    day: 'numeric',
-                    hour: '2-digit',
-                    minute: '2-digit'
-                });
-                
-                // Determinar si el elemento es clicable
-                const esClicable = actividad.enlace && actividad.elemento_id && actividad.elemento_tipo;
-                const cursorClass = esClicable ? 'cursor-pointer' : '';
-                const onClickHandler = esClicable ? 
-                    `onclick="manejarClickActividad('${actividad.elemento_tipo}', ${actividad.elemento_id}, '${actividad.enlace}')"` : 
-                    '';
-                
-                html += `
-                    <div class="activity-item d-flex align-items-center ${cursorClass}" ${onClickHandler}>
-                        <div class="me-3">
-                            <i class="fas ${actividad.icono} text-${actividad.color}"></i>
-                        </div>
-                        <div class="flex-grow-1">
-                            <div class="fw-bold ${esClicable ? 'text-primary' : ''}">${actividad.mensaje}</div>
-                            <small class="text-muted">${fecha}</small>
-                        </div>
-                        ${esClicable ? '<div class="text-primary"><i class="fas fa-chevron-right"></i></div>' : ''}
-                    </div>
-                `;
-            });
-            container.innerHTML = html;
-        } else {
-            container.innerHTML = `
-                <div class="text-center py-3">
-                    <i class="fas fa-info-circle fa-2x text-muted mb-2"></i>
-                    <p class="text-muted mb-0">No hay actividad reciente</p>
-                </div>
-            `;
-        }
+        pintarActividadReciente(data.success ? data.actividades : null);
     } catch (error) {
         console.error('Error al cargar actividad:', error);
-        const container = document.getElementById('actividad-reciente');
-        if (container) {
-            container.innerHTML = `
-                <div class="text-center py-3">
-                    <i class="fas fa-exclamation-triangle fa-2x text-warning mb-2"></i>
-                    <p class="text-muted mb-0">Error al cargar actividad</p>
+        pintarActividadReciente(null);
+    }
+}
+
+/**
+ * @brief Muestra la actividad reciente
+ * @param actividades Lista de actividades, o null si no se ha podido cargar
+ * @version 1.1
+ */
+function pintarActividadReciente(actividades) {
+    const container = document.getElementById('actividad-reciente');
+    if (!container) return;
+    
+    if (actividades === null) {
+        container.innerHTML = `
+            <div class="text-center py-3">
+                <i class="fas fa-exclamation-triangle fa-2x text-warning mb-2"></i>
+                <p class="text-muted mb-0">Error al cargar actividad</p>
+            </div>
+        `;
+        return;
+    }
+    
+    if (actividades.length > 0) {
+        let html = '';
+        actividades.forEach(actividad => {
+            // La actividad de muestra (sin datos) no tiene fecha
+            const fecha = actividad.fecha ? new Date(actividad.fecha).toLocaleString('es-ES', {
+                month: 'short',
+                day: 'numeric',
+                hour: '2-digit',
+                minute: '2-digit'
+            }) : '';
+            
+            // Determinar si el elemento es clicable
+            const esClicable = actividad.enlace && actividad.elemento_id && actividad.elemento_tipo;
+            const cursorClass = esClicable ? 'cursor-pointer' : '';
+            const onClickHandler = esClicable ? 
+                `onclick="manejarClickActividad('${actividad.elemento_tipo}', ${actividad.elemento_id}, '${actividad.enlace}')"` : 
+                '';
+            
+            html += `
+                <div class="activity-item d-flex align-items-center ${cursorClass}" ${onClickHandler}>
+                    <div class="me-3">
+                        <i class="fas ${actividad.icono} text-${actividad.color}"></i>
+                    </div>
+                    <div class="flex-grow-1">
+                        <div class="fw-bold ${esClicable ? 'text-primary' : ''}">${actividad.mensaje}</div>
+                        <small class="text-muted">${fecha}</small>
+                    </div>
+                    ${esClicable ? '<div class="text-primary"><i class="fas fa-chevron-right"></i></div>' : ''}
                 </div>
             `;
-        }
+        });
+        container.innerHTML = html;
+    } else {
+        container.innerHTML = `
+            <div class="text-center py-3">
+                <i class="fas fa-info-circle fa-2x text-muted mb-2"></i>
+                <p class="text-muted mb-0">No hay actividad reciente</p>
+            </div>
+        `;
     }
 }
 
@@ -233,61 +261,162 @@ function manejarClickActividad(tipo, elementoId, enlaceBase) {
 
 /**
  * @brief Carga las alertas de stock bajo con enlaces
- * @version 1.1
+ * @details Se usa para refrescar solo este widget (por ejemplo al recibir un evento); la carga inicial viene en
+ *          /api/home/bootstrap.
+ * @version 2.0
  */
 async function cargarAlertasStock() {
     try {
         const response = await fetch('/api/home/stock-bajo');
         const data = await response.json();
-        
-        const container = document.getElementById('alertas-stock');
-        if (!container) return;
-        
-        if (data.success && data.productos.length > 0) {
-            let html = '<div class="table-responsive"><table class="table table-sm"><thead><tr><th>Producto</th><th>Código</th><th>Stock Actual</th><th>Stock Mínimo</th><th>Acciones</th></tr></thead><tbody>';
-            
-            data.productos.forEach(producto => {
-                html += `
-                    <tr>
-                        <td><strong>${producto.nombre}</strong></td>
-                        <td><small class="text-muted">${producto.codigo}</small></td>
-                        <td><span class="badge bg-danger">${producto.stock_actual}</span></td>
-                        <td>${producto.stock_minimo}</td>
-                        <td>
-                            <button class="btn btn-sm btn-outline-primary" 
-                                    onclick="manejarClickActividad('producto', ${producto.id}, '/productos')"
-                                    title="Ver detalles del producto">
-                                <i class="fas fa-eye"></i>
-                            </button>
-                        </td>
-                    </tr>
-                `;
-            });
-            
-            html += '</tbody></table></div>';
-            container.innerHTML = html;
-        } else {
-            container.innerHTML = `
-                <div class="text-center py-3">
-                    <i class="fas fa-check-circle fa-2x text-success mb-2"></i>
-                    <p class="text-muted mb-0">Todos los productos tienen stock suficiente</p>
-                </div>
-            `;
-        }
+        pintarAlertasStock(data.success ? data.productos : null);
     } catch (error) {
         console.error('Error al cargar alertas de stock:', error);
-        const container = document.getElementById('alertas-stock');
-        if (container) {
-            container.innerHTML = `
-                <div class="text-center py-3">
-                    <i class="fas fa-exclamation-triangle fa-2x text-warning mb-2"></i>
-                    <p class="text-muted mb-0">Error al verificar stock</p>
-                </div>
+        pintarAlertasStock(null);
+    }
+}
+
+/**
+ * @brief Muestra las alertas de stock bajo
+ * @param productos Lista de productos con stock bajo, o null si no se ha podido cargar
+ * @version 1.0
+ */
+function pintarAlertasStock(productos) {
+    const container = document.getElementById('alertas-stock');
+    if (!container) return;
+    
+    if (productos === null) {
+        container.innerHTML = `
+            <div class="text-center py-3">
+                <i class="fas fa-exclamation-triangle fa-2x text-warning mb-2"></i>
+                <p class="text-muted mb-0">Error al verificar stock</p>
+            </div>
+        `;
+        return;
+    }
+    
+    if (productos.length > 0) {
+        let html = '<div class="table-responsive"><table class="table table-sm"><thead><tr><th>Producto</th><th>Código</th><th>Stock Actual</th><th>Stock Mínimo</th><th>Acciones</th></tr></thead><tbody>';
+        
+        productos.forEach(producto => {
+            html += `
+                <tr>
+                    <td><strong>${producto.nombre}</strong></td>
+                    <td><small class="text-muted">${producto.codigo}</small></td>
+                    <td><span class="badge bg-danger">${producto.stock_actual}</span></td>
+                    <td>${producto.stock_minimo}</td>
+                    <td>
+                        <button class="btn btn-sm btn-outline-primary" 
+                                onclick="manejarClickActividad('producto', ${producto.id}, '/productos')"
+                                title="Ver detalles del producto">
+                            <i class="fas fa-eye"></i>
+                        </button>
+                    </td>
+                </tr>
             `;
-        }
+        });
+        
+        html += '</tbody></table></div>';
+        container.innerHTML = html;
+    } else {
+        container.innerHTML = `
+            <div class="text-center py-3">
+                <i class="fas fa-check-circle fa-2x text-success mb-2"></i>
+                <p class="text-muted mb-0">Todos los productos tienen stock suficiente</p>
+            </div>
+        `;
     }
 }
 
+/**
+ * @brief Conecta con el canal de eventos en tiempo real del servidor (Server-Sent Events)
+ * @details EventSource reconecta solo tras un corte y envía Last-Event-ID, de modo que el servidor reenvía los eventos
+ *          perdidos. Si el navegador no soporta EventSource o el canal está desactivado no se hace nada.
+ * @param manejadores Objeto tipo de evento -> función que recibe los datos del evento
+ * @return EventSource o null
+ * @version 1.0
+ */
+function conectarEventos(manejadores) {
+    if (!window.EventSource) return null;
+    
+    const fuente = new EventSource('/eventos/api/stream');
+    Object.entries(manejadores).forEach(([tipo, manejador]) => {
+        fuente.addEventListener(tipo, evento => {
+            try {
+                manejador(JSON.parse(evento.data));
+            } catch (error) {
+                console.error(`Error al procesar el evento ${tipo}:`, error);
+            }
+        });
+    });
+    return fuente;
+}
+
+/**
+ * @brief Agrupa las llamadas a una función que se repiten en poco tiempo en una sola
+ * @param funcion Función a ejecutar
+ * @param espera Milisegundos de espera
+ * @return Función agrupada
+ * @version 1.0
+ */
+function agrupar(funcion, espera = 500) {
+    let temporizador = null;
+    return function() {
+        clearTimeout(temporizador);
+        temporizador = setTimeout(funcion, espera);
+    };
+}
+
+/**
+ * @brief Suma una cantidad al valor mostrado en un contador, sin animación
+ * @param elementId ID del elemento del contador
+ * @param cantidad Cantidad a sumar (negativa para restar)
+ * @version 1.0
+ */
+function sumarContador(elementId, cantidad) {
+    const elemento = document.getElementById(elementId);
+    if (!elemento || !cantidad) return;
+    elemento.textContent = Math.max(0, (parseInt(elemento.textContent, 10) || 0) + cantidad);
+}
+
+/**
+ * @brief Mantiene el home al día con los eventos del servidor
+ * @details Los contadores se corrigen con los datos del evento y solo se vuelve a pedir el widget afectado
+ *          (actividad o alertas de stock), agrupando los eventos seguidos en una sola petición.
+ * @version 1.0
+ */
+function conectarEventosHome() {
+    const recargarActividad = agrupar(cargarActividadReciente);
+    const recargarAlertas = agrupar(cargarAlertasStock);
+    const esPendiente = estado => (estado === 'pendiente' ? 1 : 0);
+    
+    conectarEventos({
+        pedido_creado: pedido => {
+            sumarContador('pedidos-pendientes', esPendiente(pedido.estado));
+            recargarActividad();
+        },
+        pedido_estado: pedido => {
+            sumarContador('pedidos-pendientes', esPendiente(pedido.estado) - esPendiente(pedido.estado_anterior));
+        },
+        pedido_eliminado: pedido => {
+            sumarContador('pedidos-pendientes', -esPendiente(pedido.estado));
+            recargarActividad();
+        },
+        pedidos_cargados: carga => {
+            sumarContador('pedidos-pendientes', carga.pendientes);
+            sumarContador('facturas-mes', carga.facturas);
+            recargarActividad();
+        },
+        factura_generada: () => {
+            sumarContador('facturas-mes', 1);
+        },
+        stock_bajo: producto => {
+            showNotification(`Stock bajo: ${producto.nombre} (${producto.stock} uds.)`, 'warning');
+            recargarAlertas();
+        }
+    });
+}
+
 /**
  * @brief Actualiza el reloj en tiempo real
  * @version 1.0
@@ -451,6 +580,19 @@ function isValidPhone(phone) {
     return phoneRegex.test(phone);
 }
 
+/**
+ * @brief Genera una clave única para la cabecera Idempotency-Key
+ * @details La misma clave se reenvía en los reintentos de una operación para que el servidor no la repita.
+ * @return String Clave aleatoria
+ * @version 1.0
+ */
+function generarClaveIdempotencia() {
+    if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+        return window.crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+}
+
 /**
  * @brief Muestra un diálogo de confirmación y ejecuta callback si se acepta
  * @param message Mensaje de confirmación
@@ -551,7 +693,9 @@ window.ERPFarmacias = {
     closeModal,
     cargarEstadisticasHome,
     actualizarContador,
-    manejarClickActividad
+    manejarClickActividad,
+    conectarEventos,
+    agrupar
 };
 
 // Hacer disponibles las funciones principales globalmente
@@ -3,7 +3,7 @@
  * @brief JavaScript específico para la gestión de facturas
  * @details Funciones para ver, imprimir y gestionar facturas del ERP de Mega Nevada
  * @author José David Sánchez Fernández
- * @version 1.1
+ * @version 1.2
  * @date 2025-06-15
  * @copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
  */
@@ -85,24 +85,38 @@ function imprimirFactura(facturaId) {
     }
 }
 
+// Claves Idempotency-Key por pedido; se mantienen en los reintentos tras un error de red
+const clavesIdempotenciaFactura = {};
+
 /**
  * @brief Generar factura desde un pedido
+ * @details Envía la cabecera Idempotency-Key para que un reintento no genere dos facturas.
  * @param pedidoId ID del pedido
- * @version 1.0
+ * @version 1.1
  */
 async function generarFacturaDesdePedido(pedidoId) {
     try {
         console.log(`Generando factura desde pedido ID: ${pedidoId}`);
         
+        if (!clavesIdempotenciaFactura[pedidoId]) {
+            clavesIdempotenciaFactura[pedidoId] = generarClaveIdempotencia();
+        }
+        
         const response = await fetch(`/facturas/api/generar-desde-pedido/${pedidoId}`, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'Idempotency-Key': clavesIdempotenciaFactura[pedidoId]
             }
         });
         
         const data = await response.json();
         
+        // El servidor ha respondido: el siguiente intento es una operación nueva
+        if (response.status !== 409) {
+            delete clavesIdempotenciaFactura[pedidoId];
+        }
+        
         if (data.success) {
             showNotification(`Factura ${data.factura.numero_factura} generada correctamente`, 'success');
             
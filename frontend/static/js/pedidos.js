@@ -3,7 +3,7 @@
  * @brief JavaScript para la gestión de pedidos
  * @details Funciones para manejar las operaciones CRUD de pedidos, búsquedas, validaciones y control de items.
  * @author José David Sánchez Fernández
- * @version 1.3
+ * @version 1.5
  * @date 2025-06-15
  * @copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
  */
@@ -13,6 +13,8 @@ let clienteSeleccionado = null;
 let productoSeleccionado = null;
 let itemsPedido = [];
 let contadorItems = 0;
+// Clave Idempotency-Key del pedido en curso; se mantiene en los reintentos tras un error de red
+let claveIdempotenciaPedido = null;
 
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Módulo de pedidos cargado correctamente');
@@ -113,6 +115,9 @@ function inicializarPedidos() {
     if (esLista && !esFormulario) {
         // Solo configurar búsqueda automática en la página de lista
         configurarBusquedaPedidos();
+        
+        // Reflejar en la lista los cambios hechos desde otros puestos
+        conectarEventosListaPedidos();
     }
     
     // Inicializar tooltips
@@ -127,6 +132,43 @@ function inicializarPedidos() {
     }
 }
 
+// Insignia de cada estado en la lista de pedidos (la misma que pinta la plantilla)
+const INSIGNIAS_ESTADO_PEDIDO = {
+    pendiente: '<span class="badge bg-warning"><i class="fas fa-clock me-1"></i>Pendiente</span>',
+    confirmado: '<span class="badge bg-info"><i class="fas fa-check me-1"></i>Confirmado</span>',
+    entregado: '<span class="badge bg-primary"><i class="fas fa-truck me-1"></i>Entregado</span>',
+    facturado: '<span class="badge bg-success"><i class="fas fa-file-invoice me-1"></i>Facturado</span>'
+};
+
+/**
+ * @brief Actualiza la lista de pedidos con los eventos del servidor
+ * @details Los cambios de estado se pintan en la fila del pedido y los pedidos eliminados se quitan de la lista. Los
+ *          pedidos nuevos solo se avisan, para no descolocar la página ni el filtro que se está viendo.
+ * @version 1.0
+ */
+function conectarEventosListaPedidos() {
+    if (!window.ERPFarmacias || !window.ERPFarmacias.conectarEventos) return;
+    
+    const filaPedido = id => document.querySelector(`tr[data-pedido-id="${id}"]`);
+    const avisarNuevos = mensaje => showNotification(
+        `${mensaje} <a href="javascript:window.location.reload()" class="alert-link">Actualizar lista</a>`, 'info'
+    );
+    
+    window.ERPFarmacias.conectarEventos({
+        pedido_creado: pedido => avisarNuevos(`Nuevo pedido ${pedido.numero_pedido} de ${pedido.cliente_nombre}.`),
+        pedidos_cargados: carga => avisarNuevos(`${carga.creados} pedidos nuevos cargados.`),
+        pedido_estado: pedido => {
+            const celda = filaPedido(pedido.id)?.querySelector('.celda-estado-pedido');
+            if (celda && INSIGNIAS_ESTADO_PEDIDO[pedido.estado]) {
+                celda.innerHTML = INSIGNIAS_ESTADO_PEDIDO[pedido.estado];
+            }
+        },
+        pedido_eliminado: pedido => {
+            filaPedido(pedido.id)?.remove();
+        }
+    });
+}
+
 /**
  * @brief Configura todos los event listeners de la página de pedidos
  * @version 1.0
@@ -705,8 +747,9 @@ function validarFormularioPedido() {
 
 /**
  * @brief Guarda el pedido (crear o actualizar)
+ * @details Al crear envía la cabecera Idempotency-Key para que un reintento no duplique el pedido.
  * @param esBorrador Si es true, guarda como borrador
- * @version 1.0
+ * @version 1.1
  */
 async function guardarPedido(esBorrador = false) {
     const form = document.getElementById('formPedido');
@@ -742,13 +785,21 @@ async function guardarPedido(esBorrador = false) {
         
         const method = esEdicion ? 'PUT' : 'POST';
         
+        const headers = {
+            'Content-Type': 'application/json'
+        };
+        if (!esEdicion) {
+            if (!claveIdempotenciaPedido) {
+                claveIdempotenciaPedido = generarClaveIdempotencia();
+            }
+            headers['Idempotency-Key'] = claveIdempotenciaPedido;
+        }
+        
         console.log(`Enviando ${method} a ${url}`);
         
         const response = await fetch(url, {
             method: method,
-            headers: {
-                'Content-Type': 'application/json'
-            },
+            headers: headers,
             body: JSON.stringify(data)
         });
         
@@ -757,6 +808,11 @@ async function guardarPedido(esBorrador = false) {
         const result = await response.json();
         console.log('Response data:', result);
         
+        // El servidor ha respondido: el siguiente envío es una operación nueva
+        if (response.status !== 409) {
+            claveIdempotenciaPedido = null;
+        }
+        
         if (result.success) {
             showNotification(result.message, 'success');
             setTimeout(() => {
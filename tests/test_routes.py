@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file test_routes.py
+@brief Pruebas de las rutas del ERP de Mega Nevada
+@details Pruebas sobre una base de datos SQLite en memoria usando el cliente de pruebas de Flask.
+@author José David Sánchez Fernández
+@version 1.2
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import io
+import os
+import sys
+import zipfile
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from app import create_app
+from models.models import db, Cliente, Factura, Producto, Pedido, ItemPedido, RespuestaIdempotente
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def crear_pedidos(num_pedidos, prefijo, items_por_pedido=3):
+    """
+    @brief Crea pedidos de prueba, cada uno con su propio cliente
+    @param num_pedidos Número de pedidos a crear
+    @param prefijo Prefijo para que los códigos no se repitan entre llamadas
+    @param items_por_pedido Número de items de cada pedido
+    @version 1.0
+    """
+    producto = Producto(codigo=f'PR-{prefijo}', nombre='Ibuprofeno', precio=Decimal('2.50'), stock=1000, iva_porcentaje=Decimal('4'))
+    db.session.add(producto)
+    for i in range(num_pedidos):
+        cliente = Cliente(codigo=f'{prefijo}{i}', nombre=f'Farmacia {prefijo}{i}')
+        pedido = Pedido(numero_pedido=f'P-{prefijo}-{i:03d}', cliente=cliente)
+        for _ in range(items_por_pedido):
+            item = ItemPedido(producto=producto, cantidad=2, precio_unitario_sin_iva=producto.precio, iva_porcentaje=producto.iva_porcentaje)
+            item.calcular_totales()
+            pedido.items.append(item)
+        pedido.calcular_totales()
+        db.session.add(pedido)
+    db.session.commit()
+    db.session.expunge_all()
+
+def contar_sentencias(client, url):
+    """
+    @brief Cuenta las sentencias SQL ejecutadas al servir una URL
+    @param client Cliente de pruebas de Flask
+    @param url URL a solicitar
+    @return tuple (respuesta, número de sentencias)
+    @version 1.0
+    """
+    sentencias = []
+    
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        respuesta = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+    return respuesta, len(sentencias)
+
+def test_lista_pedidos_numero_fijo_de_sentencias(app, client):
+    crear_pedidos(2, 'A')
+    respuesta_corta, sentencias_corta = contar_sentencias(client, '/pedidos/')
+    
+    crear_pedidos(15, 'B')
+    respuesta_larga, sentencias_larga = contar_sentencias(client, '/pedidos/')
+    
+    assert respuesta_corta.status_code == 200
+    assert respuesta_larga.status_code == 200
+    assert b'Farmacia B14' in respuesta_larga.data
+    assert sentencias_larga == sentencias_corta
+    assert sentencias_larga <= 3
+
+def test_cursor_de_pedidos_conserva_el_filtro_de_cliente(app, client):
+    crear_pedidos(3, 'O')
+    cliente = Cliente.query.filter_by(codigo='O0').one()
+    db.session.add_all([Pedido(numero_pedido=f'P-C-{i:03d}', cliente_id=cliente.id) for i in range(20)])
+    db.session.commit()
+
+    primera = client.get(f'/pedidos/?cliente={cliente.id}&paginacion=cursor&total=1')
+    html = primera.get_data(as_text=True)
+    enlace = html.split('cursor=', 1)[1].split('"', 1)[0].replace('&amp;', '&')
+    segunda = client.get(f'/pedidos/?cursor={enlace}')
+
+    assert f'cliente={cliente.id}' in enlace and 'total=1' in enlace
+    assert segunda.status_code == 200
+    assert 'Farmacia O1' not in segunda.get_data(as_text=True)
+
+def stock_de(producto_id):
+    """
+    @brief Stock actual de un producto, leído de la base de datos
+    @version 1.0
+    """
+    db.session.expire_all()
+    return db.session.get(Producto, producto_id).stock
+
+def crear_carrito(*stocks):
+    """
+    @brief Crea un cliente y un producto por cada stock indicado
+    @return tuple (cliente_id, lista de producto_id)
+    @version 1.0
+    """
+    cliente = Cliente(codigo='CS', nombre='Farmacia Stock')
+    productos = [
+        Producto(codigo=f'PS{i}', nombre=f'Producto {i}', precio=Decimal('1.00'), stock=stock, iva_porcentaje=Decimal('4'))
+        for i, stock in enumerate(stocks)
+    ]
+    db.session.add_all([cliente, *productos])
+    db.session.commit()
+    return cliente.id, [producto.id for producto in productos]
+
+def test_crear_pedido_sin_stock_lista_todos_los_faltantes(app, client):
+    cliente_id, (a, b, c) = crear_carrito(10, 2, 1)
+
+    respuesta = client.post('/pedidos/api/crear', json={'cliente_id': cliente_id, 'items': [
+        {'producto_id': a, 'cantidad': 3},
+        {'producto_id': b, 'cantidad': 5},
+        {'producto_id': c, 'cantidad': 4},
+    ]})
+
+    assert respuesta.status_code == 400
+    assert [f['producto_id'] for f in respuesta.get_json()['faltantes']] == [b, c]
+    assert [stock_de(a), stock_de(b), stock_de(c)] == [10, 2, 1]
+    assert Pedido.query.count() == 0
+
+def test_crear_pedido_suma_lineas_repetidas(app, client):
+    cliente_id, (a,) = crear_carrito(5)
+
+    respuesta = client.post('/pedidos/api/crear', json={'cliente_id': cliente_id, 'items': [
+        {'producto_id': a, 'cantidad': 3},
+        {'producto_id': a, 'cantidad': 4},
+    ]})
+
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['faltantes'][0]['solicitado'] == 7
+    assert stock_de(a) == 5
+
+def test_editar_y_eliminar_pedido_ajustan_stock(app, client):
+    cliente_id, (a, b, c) = crear_carrito(10, 10, 10)
+
+    respuesta = client.post('/pedidos/api/crear', json={'cliente_id': cliente_id, 'items': [
+        {'producto_id': a, 'cantidad': 4},
+        {'producto_id': b, 'cantidad': 2},
+    ]})
+    assert respuesta.status_code == 200
+    pedido_id = respuesta.get_json()['pedido']['id']
+    assert [stock_de(a), stock_de(b), stock_de(c)] == [6, 8, 10]
+
+    # Menos de a, b fuera del pedido y c nuevo
+    respuesta = client.put(f'/pedidos/api/actualizar/{pedido_id}', json={'items': [
+        {'producto_id': a, 'cantidad': 1},
+        {'producto_id': c, 'cantidad': 3},
+    ]})
+    assert respuesta.status_code == 200
+    assert [stock_de(a), stock_de(b), stock_de(c)] == [9, 10, 7]
+
+    # Una edición sin stock no cambia nada
+    respuesta = client.put(f'/pedidos/api/actualizar/{pedido_id}', json={'items': [
+        {'producto_id': a, 'cantidad': 20},
+        {'producto_id': c, 'cantidad': 3},
+    ]})
+    assert respuesta.status_code == 400
+    assert [stock_de(a), stock_de(b), stock_de(c)] == [9, 10, 7]
+
+    respuesta = client.delete(f'/pedidos/api/eliminar/{pedido_id}')
+    assert respuesta.status_code == 200
+    assert [stock_de(a), stock_de(b), stock_de(c)] == [10, 10, 10]
+
+def test_idempotencia_reintento_recibe_la_misma_respuesta(app, client):
+    cliente_id, (a,) = crear_carrito(10)
+    cuerpo = {'cliente_id': cliente_id, 'items': [{'producto_id': a, 'cantidad': 2}]}
+    cabeceras = {'Idempotency-Key': 'pedido-1'}
+
+    commits = []
+
+    def registrar(sesion):
+        commits.append(sesion)
+
+    event.listen(Session, 'after_commit', registrar)
+    try:
+        primera = client.post('/pedidos/api/crear', json=cuerpo, headers=cabeceras)
+    finally:
+        event.remove(Session, 'after_commit', registrar)
+    segunda = client.post('/pedidos/api/crear', json=cuerpo, headers=cabeceras)
+
+    assert primera.status_code == 200
+    # El pedido y la respuesta guardada se confirman en un único commit
+    assert len(commits) == 1
+    assert segunda.status_code == 200
+    assert segunda.headers.get('Idempotent-Replayed') == 'true'
+    assert segunda.get_json() == primera.get_json()
+    assert Pedido.query.count() == 1
+    assert stock_de(a) == 8
+
+def test_idempotencia_misma_clave_con_otro_cuerpo(app, client):
+    cliente_id, (a,) = crear_carrito(10)
+    cabeceras = {'Idempotency-Key': 'pedido-2'}
+
+    client.post('/pedidos/api/crear', json={'cliente_id': cliente_id, 'items': [{'producto_id': a, 'cantidad': 2}]},
+                headers=cabeceras)
+    respuesta = client.post('/pedidos/api/crear', json={'cliente_id': cliente_id, 'items': [{'producto_id': a, 'cantidad': 3}]},
+                            headers=cabeceras)
+
+    assert respuesta.status_code == 422
+    assert Pedido.query.count() == 1
+    assert stock_de(a) == 8
+
+def test_idempotencia_clave_en_proceso(app, client):
+    cliente_id, (a,) = crear_carrito(10)
+    cuerpo = {'cliente_id': cliente_id, 'items': [{'producto_id': a, 'cantidad': 2}]}
+
+    # Huella de la petición tal como la enviará el cliente de pruebas
+    with app.test_request_context('/pedidos/api/crear', method='POST', json=cuerpo):
+        from utils.idempotencia import huella_peticion
+        huella = huella_peticion()
+    db.session.add(RespuestaIdempotente(
+        ambito='pedidos.crear', clave='pedido-3', huella=huella, completada=False,
+        fecha_creacion=datetime.utcnow(), expira=datetime.utcnow() + timedelta(hours=1)
+    ))
+    db.session.commit()
+
+    respuesta = client.post('/pedidos/api/crear', json=cuerpo, headers={'Idempotency-Key': 'pedido-3'})
+
+    assert respuesta.status_code == 409
+    assert Pedido.query.count() == 0
+    assert stock_de(a) == 10
+
+def test_idempotencia_error_no_guarda_la_clave(app, client):
+    cliente_id, (a,) = crear_carrito(1)
+    cuerpo = {'cliente_id': cliente_id, 'items': [{'producto_id': a, 'cantidad': 2}]}
+    cabeceras = {'Idempotency-Key': 'pedido-4'}
+
+    assert client.post('/pedidos/api/crear', json=cuerpo, headers=cabeceras).status_code == 400
+    assert db.session.get(RespuestaIdempotente, ('pedidos.crear', 'pedido-4')) is None
+
+    db.session.get(Producto, a).stock = 5
+    db.session.commit()
+    assert client.post('/pedidos/api/crear', json=cuerpo, headers=cabeceras).status_code == 200
+
+def test_home_revalida_con_la_version_de_los_datos(app, client):
+    cliente_id, (a,) = crear_carrito(10)
+    url = '/api/home/estadisticas'
+
+    primera = client.get(url)
+    etag = primera.headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    # Recalcular la respuesta no cambia los validadores mientras no cambien los datos
+    assert client.get(url).headers['ETag'] == etag
+
+    producto = db.session.get(Producto, a)
+    producto.stock = 3
+    db.session.commit()
+
+    tercera = client.get(url, headers={'If-None-Match': etag})
+    assert tercera.status_code == 200
+    assert tercera.headers['ETag'] != etag
+    assert tercera.last_modified == producto.fecha_modificacion.replace(tzinfo=timezone.utc, microsecond=0)
+
+    db.session.delete(db.session.get(Cliente, cliente_id))
+    db.session.commit()
+    assert client.get(url, headers={'If-None-Match': tercera.headers['ETag']}).status_code == 200
+
+def test_bootstrap_del_home_no_depende_de_la_hora_de_la_peticion(app, client):
+    crear_carrito(0)
+    crear_pedidos(1, 'H')
+
+    primera = client.get('/api/home/bootstrap')
+    segunda = client.get('/api/home/bootstrap')
+
+    assert primera.status_code == 200
+    assert primera.get_data() == segunda.get_data()
+    assert primera.headers['ETag'] == segunda.headers['ETag']
+    alertas = {actividad['tipo']: actividad['fecha'] for actividad in primera.get_json()['actividades']}
+    assert alertas['pedidos_pendientes'] == Pedido.query.one().fecha_pedido.isoformat()
+    assert alertas['stock_bajo'] == Producto.query.filter_by(codigo='PS0').one().fecha_modificacion.isoformat()
+
+def test_exportar_pdf_filtra_por_fechas_cliente_y_busqueda(app, client, tmp_path):
+    app.config['PDF_CACHE_DIR'] = str(tmp_path)
+    crear_pedidos(4, 'E', items_por_pedido=1)
+    fechas = [datetime(2026, 3, 1, 23, 59), datetime(2026, 3, 2), datetime(2026, 3, 3, 23, 30), datetime(2026, 3, 4)]
+    pedidos = Pedido.query.order_by(Pedido.numero_pedido).all()
+    for i, (pedido, fecha) in enumerate(zip(pedidos, fechas)):
+        db.session.add(Factura(numero_factura=f'VF/{i + 1:03d}/26', pedido=pedido, fecha_factura=fecha, total=pedido.total))
+    db.session.commit()
+
+    def exportar(consulta):
+        respuesta = client.get(f'/facturas/exportar-pdf?{consulta}')
+        if respuesta.mimetype != 'application/zip':
+            return respuesta.status_code, None, None
+        nombres = zipfile.ZipFile(io.BytesIO(respuesta.get_data())).namelist()
+        assert respuesta.headers['X-Total-Facturas'] == str(len(nombres))
+        return respuesta.status_code, respuesta.headers['Content-Disposition'], nombres
+
+    # Los dos extremos entran completos
+    assert exportar('desde=2026-03-02&hasta=2026-03-03') == (
+        200, 'attachment; filename="facturas_2026-03-02_2026-03-03.zip"', ['VF-002-26.pdf', 'VF-003-26.pdf']
+    )
+    assert exportar('hasta=2026-03-01') == (
+        200, 'attachment; filename="facturas_inicio_2026-03-01.zip"', ['VF-001-26.pdf']
+    )
+    assert exportar(f'cliente_id={pedidos[3].cliente_id}') == (
+        200, 'attachment; filename="facturas.zip"', ['VF-004-26.pdf']
+    )
+    assert exportar('search=P-E-002')[2] == ['VF-003-26.pdf']
+    assert exportar('search=farmacia e1')[2] == ['VF-002-26.pdf']
+
+    assert exportar('desde=2026-03-05') == (404, None, None)
+    assert exportar('desde=2026-13-01') == (400, None, None)
+    assert exportar('hasta=03/03/2026') == (400, None, None)
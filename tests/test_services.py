@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file test_services.py
+@brief Pruebas de los servicios del ERP de Mega Nevada
+@details Pruebas sobre una base de datos SQLite en memoria.
+@author José David Sánchez Fernández
+@version 1.7
+@date 2026-10-17
+@copyright Copyright (c) 2025 Mega Nevada S.L. Todos los derechos reservados.
+"""
+
+import io
+import os
+import sys
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from app import create_app
+from models.models import db, Cliente, ContadorNumeracion, Factura, Pedido, ItemPedido, Producto, VentaDiaria
+from services import exportacion_facturas_service, pdf_service
+from services.autocompletado_service import IndiceAutocompletado, datos_producto
+from services.busqueda_service import CANDIDATOS_BUSQUEDA, buscar
+from services.exportacion_facturas_service import exportar_facturas_zip
+from services.impuestos_service import desglosar_items, desglosar_pedidos, recargo_para_iva
+from services.numeracion_service import (
+    SERIE_FACTURAS, SERIE_PEDIDOS, formatear_numero_factura, generar_numero_factura, periodo_facturas, reservar_numeros
+)
+from services.pdf_service import anotar_invalidacion_pdf, datos_factura, guardar_pdf, huella_datos, obtener_pdf_factura
+from services.stock_service import (
+    StockInsuficienteError, agrupar_cantidades, ajustar_stock, reservar_stock, liberar_stock
+)
+from services.ventas_service import actualizar_ventas, lineas_venta, reconstruir_ventas
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def crear_productos(*stocks):
+    """
+    @brief Crea un producto por cada stock indicado
+    @return list IDs de los productos, en el mismo orden
+    @version 1.0
+    """
+    productos = [
+        Producto(codigo=f'ST{i}', nombre=f'Producto {i}', precio=Decimal('1.00'), stock=stock, iva_porcentaje=Decimal('4'))
+        for i, stock in enumerate(stocks)
+    ]
+    db.session.add_all(productos)
+    db.session.commit()
+    return [producto.id for producto in productos]
+
+def stocks(*producto_ids):
+    """
+    @brief Stock actual de los productos, leído de la base de datos
+    @version 1.0
+    """
+    db.session.expire_all()
+    return [db.session.get(Producto, producto_id).stock for producto_id in producto_ids]
+
+def test_agrupar_cantidades_suma_lineas_repetidas():
+    assert agrupar_cantidades([(1, 3), (2, 1), (1, 4)]) == {1: 7, 2: 1}
+
+def test_reservar_stock_descuenta_todo_el_carrito(app):
+    a, b = crear_productos(10, 5)
+
+    reservar_stock({a: 4, b: 5})
+    db.session.commit()
+
+    assert stocks(a, b) == [6, 0]
+
+def test_reservar_stock_informa_de_todos_los_faltantes_y_no_descuenta(app):
+    a, b, c = crear_productos(10, 2, 1)
+
+    with pytest.raises(StockInsuficienteError) as error:
+        reservar_stock({a: 3, b: 5, c: 4})
+    db.session.rollback()
+
+    assert [(f['producto_id'], f['solicitado'], f['disponible']) for f in error.value.faltantes] == [(b, 5, 2), (c, 4, 1)]
+    assert 'Producto 1' in str(error.value) and 'Producto 2' in str(error.value)
+    assert stocks(a, b, c) == [10, 2, 1]
+
+def test_reservar_stock_lineas_repetidas_se_comprueban_sumadas(app):
+    (a,) = crear_productos(5)
+
+    # Cada línea cabe por separado, pero juntas superan el stock
+    with pytest.raises(StockInsuficienteError) as error:
+        reservar_stock(agrupar_cantidades([(a, 3), (a, 4)]))
+    db.session.rollback()
+
+    assert error.value.faltantes[0]['solicitado'] == 7
+    assert stocks(a) == [5]
+
+def test_liberar_stock_devuelve_lo_reservado(app):
+    a, b = crear_productos(10, 3)
+
+    reservar_stock({a: 4, b: 3})
+    db.session.commit()
+    liberar_stock({a: 4, b: 3})
+    db.session.commit()
+
+    assert stocks(a, b) == [10, 3]
+
+def test_ajustar_stock_aplica_variaciones_netas(app):
+    a, b, c = crear_productos(10, 10, 10)
+
+    ajustar_stock({a: 2, b: -3, c: 0})
+    db.session.commit()
+
+    assert stocks(a, b, c) == [8, 13, 10]
+
+def test_recarga_del_autocompletado_conserva_las_escrituras_concurrentes(app, monkeypatch):
+    a, b = crear_productos(10, 10)
+    indice = IndiceAutocompletado(Producto, ('codigo', 'nombre'), ('codigo',), datos_producto)
+    indice.cargar()
+    leer = IndiceAutocompletado.leer
+
+    def leer_con_escrituras(self, registro):
+        # Mientras la recarga lee la tabla llegan una venta confirmada y un cambio de nombre
+        if self is not indice and registro.id == a:
+            indice.aplicar_deltas_stock({a: 3})
+            producto = db.session.get(Producto, b)
+            producto.nombre = 'Renombrado'
+            indice.actualizar(producto)
+        return leer(self, registro)
+
+    monkeypatch.setattr(IndiceAutocompletado, 'leer', leer_con_escrituras)
+    indice.cargar()
+
+    assert indice.buscar('ST0')[0]['stock'] == 7
+    assert [resultado['id'] for resultado in indice.buscar('renombrado')] == [b]
+    assert indice.pendientes is None
+
+def test_buscar_pone_primero_la_coincidencia_exacta_aunque_haya_muchas(app):
+    db.session.add_all([
+        Producto(codigo=f'PA{i:04d}', nombre=f'Acetil paracetamol {i:04d}', precio=Decimal('1.00'), iva_porcentaje=Decimal('4'))
+        for i in range(CANDIDATOS_BUSQUEDA + 50)
+    ])
+    db.session.add_all([
+        Producto(codigo='PAR', nombre='Zeta', precio=Decimal('1.00'), iva_porcentaje=Decimal('4')),
+        Producto(codigo='XZ1', nombre='Paracetamol', precio=Decimal('1.00'), iva_porcentaje=Decimal('4')),
+    ])
+    db.session.commit()
+
+    assert buscar(Producto, 'par')[0].codigo == 'PAR'
+    assert buscar(Producto, 'paracetamol')[0].codigo == 'XZ1'
+
+def crear_items(*lineas):
+    """
+    @brief Items de pedido con sus totales calculados, sin guardar
+    @param lineas Tuplas (producto_id, cantidad, precio, iva_porcentaje)
+    @return list Items de pedido
+    @version 1.0
+    """
+    items = []
+    for producto_id, cantidad, precio, iva in lineas:
+        item = ItemPedido(producto_id=producto_id, cantidad=cantidad, precio_unitario_sin_iva=Decimal(precio), iva_porcentaje=Decimal(iva))
+        item.calcular_totales()
+        items.append(item)
+    return items
+
+def crear_pedido_con_ventas(numero, cliente_id, fecha, *lineas):
+    """
+    @brief Crea un pedido y suma su aportación a ventas_diarias, como hace la ruta de alta
+    @param lineas Tuplas (producto_id, cantidad, precio, iva_porcentaje)
+    @return Pedido Pedido creado
+    @version 1.0
+    """
+    pedido = Pedido(numero_pedido=numero, cliente_id=cliente_id, fecha_pedido=fecha, items=crear_items(*lineas))
+    pedido.calcular_totales()
+    db.session.add(pedido)
+    db.session.flush()
+    actualizar_ventas(nuevas=lineas_venta(pedido))
+    db.session.commit()
+    return pedido
+
+def filas_ventas():
+    """
+    @brief Contenido de ventas_diarias ordenado por clave, con importes Decimal
+    @version 1.0
+    """
+    db.session.expire_all()
+    return [
+        (str(v.fecha), v.cliente_id, v.producto_id, Decimal(str(v.iva_porcentaje)), v.unidades,
+         Decimal(str(v.base)), Decimal(str(v.iva)), Decimal(str(v.recargo)))
+        for v in VentaDiaria.query.order_by(
+            VentaDiaria.fecha, VentaDiaria.cliente_id, VentaDiaria.producto_id, VentaDiaria.iva_porcentaje
+        )
+    ]
+
+@pytest.fixture
+def datos_ventas(app):
+    cliente = Cliente(codigo='VD', nombre='Farmacia VD')
+    db.session.add(cliente)
+    db.session.commit()
+    return cliente.id, crear_productos(100, 100, 100)
+
+def test_alta_de_pedido_suma_en_ventas_diarias(datos_ventas):
+    cliente_id, (a, b, _) = datos_ventas
+    dia = datetime(2026, 3, 2, 10, 0)
+
+    crear_pedido_con_ventas('VD-1', cliente_id, dia, (a, 3, '2.50', '21'), (b, 1, '10.00', '4'))
+    crear_pedido_con_ventas('VD-2', cliente_id, dia, (a, 2, '2.50', '21'))
+
+    assert filas_ventas() == [
+        ('2026-03-02', cliente_id, a, Decimal('21'), 5, Decimal('12.50'), Decimal('2.63'), Decimal('0.65')),
+        ('2026-03-02', cliente_id, b, Decimal('4'), 1, Decimal('10.00'), Decimal('0.40'), Decimal('0.05')),
+    ]
+
+def test_modificacion_de_pedido_resta_lo_anterior_y_borra_lineas_quitadas(datos_ventas):
+    cliente_id, (a, b, c) = datos_ventas
+    pedido = crear_pedido_con_ventas('VD-1', cliente_id, datetime(2026, 3, 2), (a, 3, '2.50', '21'), (b, 1, '10.00', '4'))
+
+    anteriores = lineas_venta(pedido)
+    pedido.items[0].cantidad = 7
+    pedido.items[0].calcular_totales()
+    pedido.items.remove(pedido.items[1])
+    item = ItemPedido(producto_id=c, cantidad=2, precio_unitario_sin_iva=Decimal('4.00'), iva_porcentaje=Decimal('10'))
+    item.calcular_totales()
+    pedido.items.append(item)
+    pedido.calcular_totales()
+    db.session.flush()
+    actualizar_ventas(anteriores, lineas_venta(pedido))
+    db.session.commit()
+
+    assert filas_ventas() == [
+        ('2026-03-02', cliente_id, a, Decimal('21'), 7, Decimal('17.50'), Decimal('3.68'), Decimal('0.91')),
+        ('2026-03-02', cliente_id, c, Decimal('10'), 2, Decimal('8.00'), Decimal('0.80'), Decimal('0.11')),
+    ]
+
+def test_baja_de_pedido_no_deja_filas_a_cero(datos_ventas):
+    cliente_id, (a, b, _) = datos_ventas
+    dia = datetime(2026, 3, 2)
+    crear_pedido_con_ventas('VD-1', cliente_id, dia, (a, 3, '2.50', '21'))
+    pedido = crear_pedido_con_ventas('VD-2', cliente_id, dia, (a, 1, '2.50', '21'), (b, 1, '10.00', '4'))
+
+    actualizar_ventas(anteriores=lineas_venta(pedido))
+    db.session.delete(pedido)
+    db.session.commit()
+
+    assert filas_ventas() == [
+        ('2026-03-02', cliente_id, a, Decimal('21'), 3, Decimal('7.50'), Decimal('1.58'), Decimal('0.39')),
+    ]
+
+def test_reconstruir_ventas_coincide_con_el_mantenimiento_incremental(datos_ventas):
+    cliente_id, (a, b, c) = datos_ventas
+    otro = Cliente(codigo='VD2', nombre='Farmacia VD2')
+    db.session.add(otro)
+    db.session.commit()
+
+    crear_pedido_con_ventas('VD-1', cliente_id, datetime(2026, 3, 2, 9), (a, 3, '2.55', '21'), (b, 7, '0.33', '4'))
+    crear_pedido_con_ventas('VD-2', cliente_id, datetime(2026, 3, 2, 18), (a, 1, '2.55', '21'), (c, 5, '1.17', '10'))
+    crear_pedido_con_ventas('VD-3', otro.id, datetime(2026, 3, 3, 12), (b, 2, '0.33', '4'), (b, 1, '0.35', '4'))
+    borrado = crear_pedido_con_ventas('VD-4', otro.id, datetime(2026, 3, 4), (c, 4, '1.17', '10'))
+    actualizar_ventas(anteriores=lineas_venta(borrado))
+    db.session.delete(borrado)
+    db.session.commit()
+    incremental = filas_ventas()
+
+    reconstruir_ventas()
+    db.session.commit()
+
+    assert filas_ventas() == incremental
+
+def test_reservar_numeros_da_consecutivos_por_serie_y_periodo(app):
+    assert [reservar_numeros(SERIE_PEDIDOS, '20260302')[0] for _ in range(3)] == [1, 2, 3]
+    assert reservar_numeros(SERIE_FACTURAS, '26')[0] == 1
+    db.session.commit()
+
+    assert reservar_numeros(SERIE_PEDIDOS, '20260302')[0] == 4
+
+def test_reservar_numeros_empieza_en_1_en_un_periodo_nuevo(app):
+    reservar_numeros(SERIE_PEDIDOS, '20260302', 5)
+    reservar_numeros(SERIE_FACTURAS, '26', 5)
+    db.session.commit()
+
+    assert reservar_numeros(SERIE_PEDIDOS, '20260303')[0] == 1
+    assert reservar_numeros(SERIE_FACTURAS, '27')[0] == 1
+    assert reservar_numeros(SERIE_PEDIDOS, '20260302')[0] == 6
+
+def test_reservar_numeros_con_cantidad_devuelve_un_rango_contiguo(app):
+    reservar_numeros(SERIE_PEDIDOS, '20260302', 2)
+
+    assert reservar_numeros(SERIE_PEDIDOS, '20260302', 4) == range(3, 7)
+    assert reservar_numeros(SERIE_PEDIDOS, '20260302') == range(7, 8)
+    assert reservar_numeros(SERIE_PEDIDOS, '20260302', 0) == range(0)
+
+def test_reservar_numeros_se_deshace_con_la_transaccion(app):
+    reservar_numeros(SERIE_PEDIDOS, '20260302')
+    db.session.commit()
+
+    reservar_numeros(SERIE_PEDIDOS, '20260302')
+    db.session.rollback()
+
+    assert reservar_numeros(SERIE_PEDIDOS, '20260302')[0] == 2
+
+def test_numeros_de_factura_siguen_en_orden_numerico_pasado_el_999(app):
+    db.session.add(ContadorNumeracion(serie=SERIE_FACTURAS, periodo=periodo_facturas(), ultimo_numero=998))
+    db.session.commit()
+
+    numeros = [generar_numero_factura() for _ in range(3)]
+
+    periodo = periodo_facturas()
+    assert numeros == [f'VF/999/{periodo}', f'VF/1000/{periodo}', f'VF/1001/{periodo}']
+    assert formatear_numero_factura('26', 7) == 'VF/007/26'
+
+def resumen_tipos(desglose):
+    """
+    @brief Líneas de un desglose como tuplas (iva, recargo %, base, iva, recargo) para comparar
+    @version 1.0
+    """
+    return [
+        (linea['iva_porcentaje'], linea['recargo_porcentaje'], linea['base'], linea['iva'], linea['recargo'])
+        for linea in desglose.tipos
+    ]
+
+def test_recargo_para_iva_segun_el_tipo():
+    assert recargo_para_iva(4) == Decimal('0.5')
+    assert recargo_para_iva(Decimal('10.00')) == Decimal('1.4')
+    assert recargo_para_iva(21.0) == Decimal('5.2')
+    assert recargo_para_iva('21') == Decimal('5.2')
+    assert recargo_para_iva(0) == Decimal('0')
+    assert recargo_para_iva(5) == Decimal('0')
+    assert recargo_para_iva(None) == Decimal('0')
+
+def test_desglosar_items_de_un_carrito_con_4_10_y_21():
+    desglose = desglosar_items(crear_items(
+        (1, 1, '12.99', '21'), (2, 2, '3.35', '4'), (3, 3, '1.15', '10'), (4, 1, '0.50', '4')
+    ))
+
+    assert resumen_tipos(desglose) == [
+        (Decimal('4'), Decimal('0.5'), Decimal('7.20'), Decimal('0.29'), Decimal('0.04')),
+        (Decimal('10'), Decimal('1.4'), Decimal('3.45'), Decimal('0.35'), Decimal('0.05')),
+        (Decimal('21'), Decimal('5.2'), Decimal('12.99'), Decimal('2.73'), Decimal('0.68')),
+    ]
+    assert (desglose.base, desglose.iva, desglose.recargo, desglose.total) == (
+        Decimal('23.64'), Decimal('3.37'), Decimal('0.77'), Decimal('27.78')
+    )
+
+def test_desglose_redondea_el_iva_por_linea_y_el_recargo_por_tipo():
+    # IVA por línea: 0,0147 -> 0,01 tres veces (por tipo serían 0,04).
+    # Recargo por tipo: 0,21 * 5,2 % = 0,01092 -> 0,01 (por línea serían 0,00).
+    desglose = desglosar_items(crear_items(*[(i, 1, '0.07', '21') for i in range(3)]))
+
+    assert resumen_tipos(desglose) == [
+        (Decimal('21'), Decimal('5.2'), Decimal('0.21'), Decimal('0.03'), Decimal('0.01')),
+    ]
+    assert desglose.total == Decimal('0.25')
+
+def test_desglosar_pedidos_coincide_con_el_desglose_de_cada_pedido(datos_ventas):
+    cliente_id, (a, b, c) = datos_ventas
+    pedidos = [
+        crear_pedido_con_ventas('DP-1', cliente_id, datetime(2026, 3, 2), (a, 1, '12.99', '21'), (b, 2, '3.35', '4'), (c, 3, '1.15', '10')),
+        crear_pedido_con_ventas('DP-2', cliente_id, datetime(2026, 3, 2), *[(a, 1, '0.07', '21') for _ in range(3)]),
+        crear_pedido_con_ventas('DP-3', cliente_id, datetime(2026, 3, 2), (b, 7, '0.33', '4'), (b, 1, '0.35', '4.00')),
+    ]
+    vacio = crear_pedido_con_ventas('DP-4', cliente_id, datetime(2026, 3, 2))
+
+    desgloses = desglosar_pedidos([pedido.id for pedido in pedidos] + [vacio.id])
+
+    assert set(desgloses) == {pedido.id for pedido in pedidos}
+    for pedido in pedidos:
+        assert resumen_tipos(desgloses[pedido.id]) == resumen_tipos(desglosar_items(pedido.items))
+        assert desgloses[pedido.id].total == Decimal(str(pedido.total))
+
+def crear_facturas(cantidad):
+    """
+    @brief Crea facturas de prueba de un mismo cliente, cada una con su pedido de un item
+    @return list IDs de las facturas, en orden de creación
+    @version 1.0
+    """
+    cliente = Cliente(codigo='EX', nombre='Farmacia EX')
+    producto = Producto(codigo='PR-EX', nombre='Ibuprofeno', precio=Decimal('2.50'), stock=1000, iva_porcentaje=Decimal('4'))
+    facturas = []
+    for i in range(cantidad):
+        item = ItemPedido(producto=producto, cantidad=i + 1, precio_unitario_sin_iva=producto.precio, iva_porcentaje=producto.iva_porcentaje)
+        item.calcular_totales()
+        pedido = Pedido(numero_pedido=f'P-EX-{i:03d}', cliente=cliente, items=[item])
+        pedido.calcular_totales()
+        facturas.append(Factura(numero_factura=f'VF/{i + 1:03d}/26', pedido=pedido, fecha_factura=datetime(2026, 3, i + 1), total=pedido.total))
+    db.session.add_all(facturas)
+    db.session.commit()
+    return [factura.id for factura in facturas]
+
+def leer_zip(trozos):
+    """
+    @brief Abre el ZIP formado por los trozos de exportar_facturas_zip()
+    @version 1.0
+    """
+    return zipfile.ZipFile(io.BytesIO(b''.join(trozos)))
+
+@pytest.mark.parametrize('procesos', [1, 2])
+def test_exportar_facturas_zip_conserva_el_orden_pedido(app, tmp_path, procesos):
+    ids = crear_facturas(5)
+    # Una de ellas ya está en la caché y sale antes que las que se generan
+    guardada = guardar_pdf(str(tmp_path), datos_factura(db.session.get(Factura, ids[2])))[0]
+    orden = [ids[4], ids[0], ids[2], ids[3], ids[1]]
+
+    trozos = list(exportar_facturas_zip(orden, str(tmp_path), procesos=procesos, ventana=2))
+
+    archivo = leer_zip(trozos)
+    assert archivo.namelist() == ['VF-005-26.pdf', 'VF-001-26.pdf', 'VF-003-26.pdf', 'VF-004-26.pdf', 'VF-002-26.pdf']
+    with open(guardada, 'rb') as fichero:
+        assert archivo.read('VF-003-26.pdf') == fichero.read()
+    # Un trozo por factura escrita, más el cierre del ZIP
+    assert len(trozos) == len(orden) + 1
+
+def test_exportar_facturas_zip_anota_los_fallos_en_errores_txt(app, tmp_path, monkeypatch):
+    ids = crear_facturas(3)
+    guardar_pdf_original = exportacion_facturas_service.guardar_pdf
+
+    def guardar_pdf_con_fallo(directorio, datos):
+        if datos['id'] == ids[1]:
+            raise RuntimeError('fallo de prueba')
+        return guardar_pdf_original(directorio, datos)
+
+    monkeypatch.setattr(exportacion_facturas_service, 'guardar_pdf', guardar_pdf_con_fallo)
+
+    archivo = leer_zip(exportar_facturas_zip(ids, str(tmp_path), procesos=1))
+
+    assert archivo.namelist() == ['VF-001-26.pdf', 'VF-003-26.pdf', 'ERRORES.txt']
+    assert archivo.read('ERRORES.txt').decode('utf-8') == 'VF/002/26: fallo de prueba\n'
+
+def pdf_guardados(directorio):
+    """
+    @brief Nombres de los PDF de la caché
+    @version 1.0
+    """
+    return sorted(nombre for nombre in os.listdir(directorio) if nombre.endswith('.pdf'))
+
+@pytest.fixture
+def factura_pdf(app, tmp_path, monkeypatch):
+    app.config['PDF_CACHE_DIR'] = str(tmp_path)
+    renderizados = []
+    renderizar_pdf_original = pdf_service.renderizar_pdf
+
+    def renderizar_pdf_contado(datos):
+        renderizados.append(datos['id'])
+        return renderizar_pdf_original(datos)
+
+    monkeypatch.setattr(pdf_service, 'renderizar_pdf', renderizar_pdf_contado)
+    return db.session.get(Factura, crear_facturas(1)[0]), renderizados
+
+def test_pdf_de_factura_se_reutiliza_mientras_no_cambian_los_datos(factura_pdf, tmp_path):
+    factura, renderizados = factura_pdf
+
+    ruta, huella = obtener_pdf_factura(factura)
+    # Un dato que no se imprime no cambia la huella
+    factura.pedido.cliente.telefono = '600000000'
+    db.session.commit()
+
+    assert obtener_pdf_factura(factura) == (ruta, huella)
+    assert renderizados == [factura.id]
+    assert pdf_guardados(tmp_path) == [os.path.basename(ruta)]
+
+def test_pdf_de_factura_cambia_de_huella_y_borra_el_anterior(factura_pdf, tmp_path):
+    factura, renderizados = factura_pdf
+    anterior = obtener_pdf_factura(factura)
+
+    factura.pedido.cliente.nombre = 'Farmacia EX Renombrada'
+    db.session.commit()
+    actual = obtener_pdf_factura(factura)
+
+    assert actual[1] != anterior[1]
+    assert actual[1] == huella_datos(datos_factura(factura))
+    assert renderizados == [factura.id, factura.id]
+    assert pdf_guardados(tmp_path) == [os.path.basename(actual[0])]
+
+def test_anotar_invalidacion_pdf_borra_al_confirmar_y_conserva_al_deshacer(factura_pdf, tmp_path):
+    factura, _ = factura_pdf
+    ruta = obtener_pdf_factura(factura)[0]
+
+    anotar_invalidacion_pdf(factura.id)
+    db.session.rollback()
+    assert os.path.exists(ruta)
+
+    anotar_invalidacion_pdf(factura.id)
+    db.session.commit()
+    assert not os.path.exists(ruta)
+    assert pdf_guardados(tmp_path) == []